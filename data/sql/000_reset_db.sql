@@ -1,3 +1,8 @@
+DELETE FROM studies_precomputed;
+DELETE FROM studies_variablepresence;
+DELETE FROM studies_domaincount;
+DELETE FROM studies_variablecount;
+DELETE FROM studies_qualifiercount;
 DELETE FROM studies_count_codes;
 DELETE FROM studies_count;
 DELETE FROM studies_filter;
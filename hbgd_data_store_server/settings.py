@@ -256,6 +256,23 @@ FILE_UPLOAD_PERMISSIONS = 0o644
 CRISPY_ALLOWED_TEMPLATE_PACKS = ('bootstrap', 'uni_form', 'bootstrap3', 'foundation-5')
 CRISPY_TEMPLATE_PACK = 'foundation-5'
 
+################# DATAFRAMES
+# Build count DataFrames with compact dtypes (int32, category, float32 codes),
+# see `studies.dataframes.compact_dtypes`
+COMPACT_DATAFRAMES = os.environ.get('COMPACT_DATAFRAMES', '').lower() in ('1', 'true', 'yes')
+
+################# PLOTS
+# Total length in characters of the rendered heatmaps cached by every process,
+# see `studies.cache.PlotCache`
+PLOT_CACHE_SIZE = int(os.environ.get('PLOT_CACHE_SIZE', 64 * 1024 * 1024))
+# Show the variable heatmaps of the explorer as one figure switching domains on
+# the client, instead of a heatmap fetched per domain panel
+EXPLORER_SINGLE_HEATMAP = os.environ.get('EXPLORER_SINGLE_HEATMAP', '').lower() in (
+    '1', 'true', 'yes')
+# Number of (study, variable) cells above which a heatmap is drawn as a single
+# image instead of a glyph per cell, see `studies.plots.use_image`
+HEATMAP_IMAGE_CELLS = int(os.environ.get('HEATMAP_IMAGE_CELLS', 50000))
+
 ################# DOCS
 DOCS_ROOT = os.path.join(BASE_DIR, 'docs/build/html')
 DOCS_ACCESS = 'staff'
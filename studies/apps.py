@@ -15,5 +15,8 @@
 from django.apps import AppConfig
 
 
-class DatasetsConfig(AppConfig):
-    name = 'datasets'
+class StudiesConfig(AppConfig):
+    name = 'studies'
+
+    def ready(self):
+        from . import signals  # noqa
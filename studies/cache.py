@@ -0,0 +1,253 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .index import get_study_index
+from .models import DataVersion, Filter, Study
+
+# GET params that do not change which studies match the filters
+IGNORED_PARAMS = ['page', 'Apply', 'submit']
+
+CACHE_PREFIX = 'studies:filter:'
+
+# Entries are stamped with the data version and replaced once stale, the
+# timeout only bounds how long unpopular queries take up cache space.
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def canonicalize_query(GET):
+    """
+    Returns a canonical string of the filter GET url parameters, with
+    sorted keys and values and without empty values or parameters that
+    do not affect the filtering.
+
+    Parameters:
+        GET (request.GET)
+
+    Returns:
+        str
+    """
+    params = []
+    for key in sorted(GET.keys()):
+        if key in IGNORED_PARAMS:
+            continue
+        values = sorted(set(v for v in GET.getlist(key) if v))
+        if values:
+            params.append((key, values))
+    return '&'.join('{0}={1}'.format(key, ','.join(values)) for key, values in params)
+
+
+def get_cache_key(GET):
+    """
+    Returns the cache key of the filter GET url parameters.
+
+    Parameters:
+        GET (request.GET)
+
+    Returns:
+        str
+    """
+    query = canonicalize_query(GET).encode('utf-8')
+    return CACHE_PREFIX + hashlib.md5(query).hexdigest()
+
+
+def get_filters(GET):
+    """Returns the Filters named by the GET url parameters"""
+    return Filter.objects.filter(Q(study_field__in=GET.keys()) | Q(domain__code__in=GET.keys()))
+
+
+def get_filtered_study_ids(GET, filters=None):
+    """
+    Returns the sorted ids of the studies matching the filters named in
+    the GET url parameters, reading through the cache. Cached ids are
+    only used if they were computed from the current data version.
+
+    Parameters:
+        GET (request.GET)
+        filters (queryset of Filter objects, defaults to `get_filters(GET)`)
+
+    Returns:
+        list(int)
+    """
+    key = get_cache_key(GET)
+    version = DataVersion.current()
+    cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    if filters is None:
+        filters = get_filters(GET)
+    studies = Study.filter_studies(filters, GET)
+    study_ids = sorted(studies.values_list('id', flat=True))
+    cache.set(key, (version, study_ids), CACHE_TIMEOUT)
+    return study_ids
+
+
+def select_studies(study_ids):
+    """
+    Returns the studies with the passed ids as a queryset, selected
+    through the study index rather than an IN list of the ids.
+
+    Parameters:
+        study_ids (list(int))
+
+    Returns:
+        queryset of Study objects
+    """
+    index = get_study_index()
+    return index.get_queryset(index.get_bitset(study_ids))
+
+
+def get_filtered_studies(GET, filters=None):
+    """
+    Returns the studies matching the filters named in the GET url
+    parameters, from the cached ids of `get_filtered_study_ids`.
+
+    Parameters:
+        GET (request.GET)
+        filters (queryset of Filter objects, defaults to `get_filters(GET)`)
+
+    Returns:
+        queryset of Study objects
+    """
+    return select_studies(get_filtered_study_ids(GET, filters))
+
+
+# Size counted for every PlotCache entry on top of its key and strings, so
+# that entries of empty plots (None) also count towards `max_size`
+PLOT_ENTRY_OVERHEAD = 256
+
+
+class PlotCache(object):
+    """
+    Least recently used cache of rendered Bokeh components in this
+    process, evicting the oldest entries once the total length of the
+    cached keys, scripts and divs, plus `PLOT_ENTRY_OVERHEAD` per entry,
+    exceeds `max_size`.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def get_size(key, value):
+        """Returns the size counted for an entry, see `PLOT_ENTRY_OVERHEAD`"""
+        size = PLOT_ENTRY_OVERHEAD + len(repr(key))
+        if value is not None:
+            size += sum(len(item) for item in value if isinstance(item, str))
+        return size
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def set(self, key, value):
+        size = self.get_size(key, value)
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if size > self.max_size:
+                return
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+_plot_cache = None
+
+# Marks a plot missing from the cache, as None is cached for empty plots
+MISSING = object()
+
+
+def get_plot_cache():
+    """Returns the PlotCache of this process, sized by the PLOT_CACHE_SIZE setting"""
+    global _plot_cache
+    max_size = getattr(settings, 'PLOT_CACHE_SIZE', 0)
+    if _plot_cache is None or _plot_cache.max_size != max_size:
+        _plot_cache = PlotCache(max_size)
+    return _plot_cache
+
+
+def get_selection_key(study_ids):
+    """
+    Returns a hash of a set of study ids.
+
+    Parameters:
+        study_ids (list(int))
+
+    Returns:
+        str
+    """
+    ids = ','.join(str(pk) for pk in sorted(study_ids)).encode('utf-8')
+    return hashlib.md5(ids).hexdigest()
+
+
+def get_plot_components(kind, name, selection_key, render):
+    """
+    Returns the components of a plot of a selection of studies, reading
+    through the plot cache of this process. On a miss `render` is called
+    and its plot serialized with `bokeh.embed.components`. Cached
+    components are only used for the data version they were built from.
+
+    Parameters:
+        kind (str) - kind of plot, e.g. 'summary', 'heatmap' or 'age'
+        name (str) - name of the plot within its kind, e.g. a domain code
+        selection_key (str) - see `get_selection_key`
+        render (function) - returns (plot, data), or None if the
+            selection has nothing to plot. `data` is a small value
+            cached with the components, e.g. the total count.
+
+    Returns:
+        (script, div, data) or None
+    """
+    from bokeh.embed import components
+
+    plot_cache = get_plot_cache()
+    key = (kind, name, selection_key, DataVersion.current())
+    value = plot_cache.get(key, MISSING)
+    if value is not MISSING:
+        return value
+
+    rendered = render()
+    if rendered is not None:
+        plot, data = rendered
+        script, divs = components({name: plot})
+        value = (script, divs.get(name), data)
+    else:
+        value = None
+    plot_cache.set(key, value)
+    return value
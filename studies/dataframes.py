@@ -12,13 +12,165 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 from toolz.dicttoolz import valmap
 
-from .models import Domain, Count
+from django.conf import settings
+from django.db import connection
+from django.db.models.sql.datastructures import EmptyResultSet
+
+from .models import (
+    Domain,
+    DomainCount,
+    Count,
+    QualifierCount,
+    Study,
+    StudyField,
+    Variable,
+    VariableCount,
+)
+
+# Size up to which `read_sql_copy` buffers in memory before using a file
+COPY_SPOOL_SIZE = 64 * 1024 * 1024
+
+# Label columns stored as `category` by `compact_dtypes`
+CATEGORY_COLUMNS = ['study_label', 'domain_code', 'domain_label',
+                    'var_code', 'var_label', 'qual_code', 'qual_label']
+
+# Variable ids below this are exactly represented by float32 codes
+FLOAT32_MAX_EXACT = 2 ** 24
+
+# Tables of the SQL count aggregations
+COUNT_TABLES = dict(count=Count._meta.db_table,
+                    study=Study._meta.db_table,
+                    codes=Count.codes.through._meta.db_table,
+                    variable=Variable._meta.db_table,
+                    domain=Domain._meta.db_table,
+                    domain_count=DomainCount._meta.db_table,
+                    variable_count=VariableCount._meta.db_table,
+                    qualifier_count=QualifierCount._meta.db_table)
+
+# Columns and dtypes of `query_counts_by_domain`
+COUNTS_BY_DOMAIN_DTYPES = OrderedDict([
+    ('study', np.int64),
+    ('study_label', object),
+    ('domain_code', object),
+    ('domain_label', object),
+    ('count', np.int64),
+    ('subjects', np.int64),
+])
+
+# Columns and dtypes of `query_domain_totals`
+DOMAIN_TOTALS_DTYPES = OrderedDict([
+    ('domain_code', object),
+    ('count', np.int64),
+    ('by_qualifier', np.int64),
+])
+
+# Columns and dtypes of the SQL aggregations of `query_variable_counts`
+VARIABLE_COUNTS_DTYPES = OrderedDict([
+    ('domain_code', object),
+    ('study', np.int64),
+    ('study_label', object),
+    ('variable', np.int64),
+    ('id', np.int64),
+    ('count', np.int64),
+    ('subjects', np.int64),
+    ('var_code', object),
+    ('var_label', object),
+])
+
+# Columns and dtypes of the SQL aggregations of `query_variable_count_by_variable`
+VARIABLE_COUNT_BY_VARIABLE_DTYPES = OrderedDict([
+    ('domain_code', object),
+    ('study', np.int64),
+    ('study_label', object),
+    ('qualifier', np.int64),
+    ('variable', np.int64),
+    ('id', np.int64),
+    ('count', np.int64),
+    ('subjects', np.int64),
+    ('var_code', object),
+    ('var_label', object),
+    ('qual_code', object),
+    ('qual_label', object),
+])
+
+
+def get_study_subquery(studies):
+    """
+    Returns the SQL selecting the ids of a Study queryset, raises
+    EmptyResultSet if the queryset can not match any Study.
+
+    Returns:
+        str, tuple
+    """
+    return studies.values('id').query.sql_with_params()
+
+
+def use_compact_dtypes(compact=None):
+    """Returns `compact`, defaulting to the COMPACT_DATAFRAMES setting"""
+    if compact is None:
+        return getattr(settings, 'COMPACT_DATAFRAMES', False)
+    return compact
+
 
+def compact_dtypes(df):
+    """
+    Converts the columns of a count DataFrame in place to compact dtypes:
+    `category` for repeated labels, int32 for integers within its range
+    and float32 for codes within its exact integer range (pandas 0.23 has
+    no nullable integer dtype).
 
-def get_counts_df(studies):
+    Returns:
+        pandas.Dataframe
+    """
+    int32 = np.iinfo(np.int32)
+    for column in df.columns:
+        values = df[column]
+        if column in CATEGORY_COLUMNS:
+            df[column] = values.astype('category')
+        elif values.dtype == np.int64:
+            if len(values) == 0 or (values.min() >= int32.min and values.max() <= int32.max):
+                df[column] = values.astype(np.int32)
+        elif column == 'codes' and values.dtype == np.float64:
+            if not (values.abs() >= FLOAT32_MAX_EXACT).any():
+                df[column] = values.astype(np.float32)
+    return df
+
+
+def read_sql_copy(sql, params, dtype):
+    """
+    Returns the result of a SELECT statement as a DataFrame, streamed by
+    `COPY ... TO STDOUT` as CSV into a temporary file and parsed by pandas
+    into typed columns, so that no Python object is created per row.
+
+    Parameters:
+        sql (str) - SELECT statement
+        params (list) - parameters of the statement
+        dtype (dict) - dtype of every column, NULLs are parsed as NaN
+
+    Returns:
+        pandas.DataFrame
+    """
+    with connection.cursor() as cursor, \
+            tempfile.SpooledTemporaryFile(max_size=COPY_SPOOL_SIZE) as buf:
+        query = cursor.mogrify(sql, params).decode('utf-8')
+        cursor.copy_expert('COPY ({0}) TO STDOUT WITH CSV HEADER'.format(query), buf)
+        buf.seek(0)
+        str_columns = {c: str for c, t in dtype.items() if t is object}
+        df = pd.read_csv(buf, dtype=str_columns, keep_default_na=False, na_values=[''])
+    for column, column_type in dtype.items():
+        if column_type is not object and len(df):
+            df[column] = df[column].astype(column_type)
+    return df
+
+
+def get_counts_df(studies, compact=None):
     """
     Returns a dataframe of Count records with some relevant meta data.
 
@@ -33,15 +185,12 @@ def get_counts_df(studies):
 
     Parameters:
         studies(Queryset) - Studies for which counts must be retrieved
+        compact (bool) - use `compact_dtypes`, defaults to the
+            COMPACT_DATAFRAMES setting
 
     Returns:
         pandas.Dataframe
     """
-    # Replaced by pandas code below to minimize SQL queries
-    # counts = (Count.objects.filter(study__in=studies)
-    #                        .values('id', 'study', 'study__study_id', 'count',
-    #                                'codes__domain__code', 'codes__domain__label', 'codes'))
-
     value_names = ['id', 'count', 'subjects', 'codes', 'study']
     count_vals = Count.objects.filter(study__in=studies).values(*value_names)
 
@@ -67,6 +216,8 @@ def get_counts_df(studies):
                             'label': 'domain_label',
                             'study_id': 'study_label'})
 
+    if use_compact_dtypes(compact):
+        compact_dtypes(df)
     return df[['id', 'study', 'study_label', 'count', 'subjects',
                'domain_code', 'domain_label', 'codes']]
 
@@ -81,11 +232,93 @@ def get_counts_by_domain(df):
     """
 
     columns = ['study', 'study_label', 'domain_code', 'domain_label']
-    df2 = df.groupby(columns, as_index=False)[["count", "subjects"]].max()
+    df2 = df.groupby(columns, as_index=False, observed=True)[["count", "subjects"]].max()
 
     return df2
 
 
+def query_counts_by_domain(studies, compact=None):
+    """
+    Rollup counterpart of `get_counts_by_domain`, reading the maximum
+    count and subjects of every (study, domain) from DomainCount.
+
+    Parameters:
+        studies (Queryset) - Studies for which counts must be retrieved
+        compact (bool) - see `get_counts_df`
+
+    Returns:
+        pandas.Dataframe
+    """
+    columns = list(COUNTS_BY_DOMAIN_DTYPES)
+    try:
+        study_sql, study_params = get_study_subquery(studies)
+    except EmptyResultSet:
+        return pd.DataFrame(columns=columns)
+
+    sql = """
+        SELECT r.study_id AS study, s.study_id AS study_label, d.code AS domain_code,
+               d.label AS domain_label, r.count, r.subjects
+        FROM {domain_count} r
+        JOIN {study} s ON s.id = r.study_id
+        JOIN {domain} d ON d.id = r.domain_id
+        WHERE r.study_id IN ({studies})
+        ORDER BY r.study_id, d.code
+        """.format(studies=study_sql, **COUNT_TABLES)
+
+    df = read_sql_copy(sql, study_params, COUNTS_BY_DOMAIN_DTYPES)
+    if len(df) == 0:
+        return pd.DataFrame(columns=columns)
+    return compact_dtypes(df) if use_compact_dtypes(compact) else df
+
+
+def query_domain_totals(studies, qualifier_code="AGECAT"):
+    """
+    Returns the total count shown with the heatmap of every domain with
+    counts, i.e. the sum of the `query_variable_counts` counts, and if the
+    domain has a heatmap by qualifier, read from the rollups without
+    aggregating the heatmaps themselves.
+
+    Columns:
+        domain_code (str)
+        count (int)
+        by_qualifier (bool) - `query_variable_count_by_variable` has rows
+
+    Parameters:
+        studies (Queryset) - Studies for which counts must be retrieved
+        qualifier_code (str) - code of the qualifier Domain
+
+    Returns:
+        pandas.Dataframe
+    """
+    columns = list(DOMAIN_TOTALS_DTYPES)
+    try:
+        study_sql, study_params = get_study_subquery(studies)
+    except EmptyResultSet:
+        return pd.DataFrame(columns=columns)
+
+    sql = """
+        SELECT d.code AS domain_code, t.count, (q.domain_id IS NOT NULL)::int AS by_qualifier
+        FROM (SELECT r.domain_id, SUM(r.count) AS count
+              FROM {variable_count} r
+              WHERE r.study_id IN ({studies})
+              GROUP BY r.domain_id) t
+        JOIN {domain} d ON d.id = t.domain_id
+        LEFT JOIN (SELECT DISTINCT r.domain_id
+                   FROM {qualifier_count} r
+                   JOIN {domain} qd ON qd.id = r.qualifier_domain_id
+                   WHERE qd.code = %s AND r.study_id IN ({studies})) q
+            ON q.domain_id = t.domain_id AND d.code <> %s
+        ORDER BY d.code
+        """.format(studies=study_sql, **COUNT_TABLES)
+    params = list(study_params) + [qualifier_code] + list(study_params) + [qualifier_code]
+
+    df = read_sql_copy(sql, params, DOMAIN_TOTALS_DTYPES)
+    if len(df) == 0:
+        return pd.DataFrame(columns=columns)
+    df['by_qualifier'] = df['by_qualifier'].astype(bool)
+    return df
+
+
 def pivot_counts_df(df):
     """
     Parameters:
@@ -117,7 +350,8 @@ def get_variable_counts(df, var_lookup, domain_code):
 
     df2 = df[domain_code].reset_index()
 
-    grouped = df2.groupby(['study', 'study_label', domain_code], as_index=False).max()
+    grouped = df2.groupby(['study', 'study_label', domain_code], as_index=False,
+                          observed=True).max()
 
     if len(grouped['count'].dropna()) == 0:
         return None
@@ -144,7 +378,8 @@ def get_variable_count_by_variable(df, var_lookup, domain_code, qualifier_code="
         return None
 
     df2 = df[[domain_code, qualifier_code]].reset_index()
-    grouped = (df2.groupby(['study', 'study_label', qualifier_code, domain_code], as_index=False)
+    grouped = (df2.groupby(['study', 'study_label', qualifier_code, domain_code], as_index=False,
+                           observed=True)
                   .sum())
 
     if len(grouped['count'].dropna()) == 0:
@@ -156,3 +391,222 @@ def get_variable_count_by_variable(df, var_lookup, domain_code, qualifier_code="
     grouped['qual_label'] = grouped[qualifier_code].map(valmap(lambda x: x[0]['label'], var_lookup))  # noqa
 
     return grouped
+
+
+def get_study_rows(studies, study_fields):
+    """
+    Reads the values of `study_fields` from the `Study.metadata` snapshot.
+
+    Parameters:
+        studies (Queryset) - Studies for which values must be retrieved
+        study_fields (Queryset) - StudyFields in display order
+
+    Returns:
+        list(str) - labels of the fields with values, in display order
+        OrderedDict - {label: value or None} by `Study.study_id`, for
+            the studies with values, ordered by `Study.study_id`
+    """
+    labels = OrderedDict(study_fields.values_list('field_name', 'label'))
+    rows = OrderedDict()
+    present = set()
+    for study_id, metadata in studies.order_by('study_id').values_list('study_id', 'metadata'):
+        values = {labels[name]: value for name, value in metadata.items() if name in labels}
+        if values:
+            rows[study_id] = values
+            present.update(values)
+    ordered_labels = [label for label in labels.values() if label in present]
+    for values in rows.values():
+        for label in ordered_labels:
+            values.setdefault(label, None)
+    return ordered_labels, rows
+
+
+def get_study_dict(studies):
+    """
+    Returns the labels of the StudyFields shown on the study filter page
+    and a dict of their values for each study.
+
+    Parameters:
+        studies(Queryset) - Studies for which values must be retrieved
+
+    Returns:
+        list(str), dict or None, None if there are no values to show
+    """
+    study_fields = StudyField.objects.filter(lil_order__gte=0).order_by('lil_order')
+    labels, rows = get_study_rows(studies, study_fields)
+    if not rows:
+        return None, None
+    return labels, dict(rows)
+
+
+def split_by_domain(df):
+    """
+    Splits an aggregation of several domains into a DataFrame per domain,
+    naming the Variable id column of each after its domain code.
+
+    Parameters:
+        df (pandas.Dataframe) - with domain_code and variable columns
+
+    Returns:
+        dict(str, pandas.Dataframe)
+    """
+    return {code: (group.drop('domain_code', axis=1)
+                        .rename(columns={'variable': code})
+                        .reset_index(drop=True))
+            for code, group in df.groupby('domain_code', sort=False, observed=True)}
+
+
+def _query_variable_counts(studies, domain_codes=None, compact=None):
+    """
+    Reads the maximum count and subjects of every (domain, study,
+    variable) of the given (or all) domains from the VariableCount rollup.
+
+    Returns:
+        pandas.Dataframe or None if there are no counts
+    """
+    try:
+        study_sql, study_params = get_study_subquery(studies)
+    except EmptyResultSet:
+        return None
+
+    domain_filter, params = '', list(study_params)
+    if domain_codes is not None:
+        domain_filter, params = 'AND d.code = ANY(%s)', [list(domain_codes)] + params
+
+    sql = """
+        SELECT d.code AS domain_code, r.study_id AS study, s.study_id AS study_label,
+               v.id AS variable, r.count_id AS id, r.count, r.subjects,
+               v.code AS var_code, v.label AS var_label
+        FROM {variable_count} r
+        JOIN {study} s ON s.id = r.study_id
+        JOIN {variable} v ON v.id = r.variable_id
+        JOIN {domain} d ON d.id = r.domain_id
+        WHERE TRUE {domain_filter} AND r.study_id IN ({studies})
+        ORDER BY d.code, r.study_id, v.id
+        """.format(studies=study_sql, domain_filter=domain_filter, **COUNT_TABLES)
+
+    df = read_sql_copy(sql, params, VARIABLE_COUNTS_DTYPES)
+    if len(df) == 0:
+        return None
+    return compact_dtypes(df) if use_compact_dtypes(compact) else df
+
+
+def _query_variable_count_by_variable(studies, qualifier_code, domain_codes=None,
+                                      compact=None):
+    """
+    Reads the summed count and subjects of every (domain, study,
+    qualifier, variable) of the given (or all non qualifier) domains from
+    the QualifierCount rollup.
+
+    Returns:
+        pandas.Dataframe or None if there are no counts
+    """
+    try:
+        study_sql, study_params = get_study_subquery(studies)
+    except EmptyResultSet:
+        return None
+
+    domain_filter, params = '', [qualifier_code, qualifier_code] + list(study_params)
+    if domain_codes is not None:
+        domain_filter = 'AND d.code = ANY(%s)'
+        params.insert(2, list(domain_codes))
+
+    sql = """
+        SELECT d.code AS domain_code, r.study_id AS study, s.study_id AS study_label,
+               q.id AS qualifier, v.id AS variable, r.count_id AS id, r.count, r.subjects,
+               v.code AS var_code, v.label AS var_label, q.code AS qual_code,
+               q.label AS qual_label
+        FROM {qualifier_count} r
+        JOIN {study} s ON s.id = r.study_id
+        JOIN {variable} v ON v.id = r.variable_id
+        JOIN {domain} d ON d.id = r.domain_id
+        JOIN {variable} q ON q.id = r.qualifier_id
+        JOIN {domain} qd ON qd.id = r.qualifier_domain_id
+        WHERE qd.code = %s AND d.code <> %s {domain_filter} AND r.study_id IN ({studies})
+        ORDER BY d.code, r.study_id, q.id, v.id
+        """.format(studies=study_sql, domain_filter=domain_filter, **COUNT_TABLES)
+
+    df = read_sql_copy(sql, params, VARIABLE_COUNT_BY_VARIABLE_DTYPES)
+    if len(df) == 0:
+        return None
+    return compact_dtypes(df) if use_compact_dtypes(compact) else df
+
+
+def query_variable_counts(studies, domain_code, compact=None):
+    """
+    SQL counterpart of `get_variable_counts`, aggregating the maximum
+    count and subjects of every (study, variable) of a single domain in
+    the database instead of pivoting the counts of all domains.
+
+    Parameters:
+        studies (Queryset) - Studies for which to aggregate counts
+        domain_code (str) - code of the Domain of the variables
+        compact (bool) - see `get_counts_df`
+
+    Returns:
+        pandas.Dataframe or None
+    """
+    df = _query_variable_counts(studies, [domain_code], compact)
+    if df is None:
+        return None
+    return split_by_domain(df)[domain_code]
+
+
+def query_variable_count_by_variable(studies, domain_code, qualifier_code="AGECAT",
+                                     compact=None):
+    """
+    SQL counterpart of `get_variable_count_by_variable`, summing the
+    count and subjects of every (study, qualifier, variable) of a single
+    domain in the database.
+
+    Parameters:
+        studies (Queryset) - Studies for which to aggregate counts
+        domain_code (str) - code of the Domain of the variables
+        qualifier_code (str) - code of the qualifier Domain
+        compact (bool) - see `get_counts_df`
+
+    Returns:
+        pandas.Dataframe or None
+    """
+    df = _query_variable_count_by_variable(studies, qualifier_code, [domain_code], compact)
+    if df is None:
+        return None
+    return split_by_domain(df)[domain_code].rename(columns={'qualifier': qualifier_code})
+
+
+def query_all_variable_counts(studies, compact=None):
+    """
+    Returns `query_variable_counts` of every domain with counts, computed
+    by a single aggregation over all domains.
+
+    Parameters:
+        studies (Queryset) - Studies for which to aggregate counts
+        compact (bool) - see `get_counts_df`
+
+    Returns:
+        dict(str, pandas.Dataframe) - by Domain code
+    """
+    df = _query_variable_counts(studies, compact=compact)
+    if df is None:
+        return {}
+    return split_by_domain(df)
+
+
+def query_all_variable_count_by_variable(studies, qualifier_code="AGECAT", compact=None):
+    """
+    Returns `query_variable_count_by_variable` of every domain with
+    qualified counts, computed by a single aggregation over all domains.
+
+    Parameters:
+        studies (Queryset) - Studies for which to aggregate counts
+        qualifier_code (str) - code of the qualifier Domain
+        compact (bool) - see `get_counts_df`
+
+    Returns:
+        dict(str, pandas.Dataframe) - by Domain code
+    """
+    df = _query_variable_count_by_variable(studies, qualifier_code, compact=compact)
+    if df is None:
+        return {}
+    return {code: domain_df.rename(columns={'qualifier': qualifier_code})
+            for code, domain_df in split_by_domain(df).items()}
@@ -0,0 +1,138 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from contextlib import contextmanager
+
+from .models import (
+    Count,
+    DataVersion,
+    Domain,
+    Study,
+    VariablePresence,
+    rebuild_rollups,
+)
+
+# Running loads, outermost first, each recording if it is incremental and
+# the study ids which had Counts of every replaced domain before the load
+_bulk_loads = []
+
+
+def is_bulk_loading():
+    """Checks if a loader is currently running in this process"""
+    return len(_bulk_loads) > 0
+
+
+@contextmanager
+def bulk_load(incremental=False):
+    """
+    Suspends the per-object maintenance done by `studies.signals` while
+    a loader writes many objects, and refreshes all derived data once
+    when the outermost block exits (even if loading failed part way).
+
+    Parameters:
+        incremental (bool) - the loader only replaces the Counts of the
+            domains declared with `domain_replaced`, so that only their
+            slices of the derived data are refreshed
+    """
+    _bulk_loads.append(dict(incremental=incremental, replaced={}))
+    try:
+        yield
+    finally:
+        load = _bulk_loads.pop()
+        if is_bulk_loading():
+            # Nested loads are refreshed with the outermost one
+            _bulk_loads[0]['incremental'] &= load['incremental']
+        elif load['incremental']:
+            refresh_domain_data(load['replaced'])
+        else:
+            refresh_derived_data()
+
+
+def domain_replaced(domain_id):
+    """
+    Declares that the running loader replaces the Counts of a domain.
+    Must be called before its Counts are deleted, as the studies which
+    had Counts of the domain are looked up from `VariablePresence`.
+
+    Parameters:
+        domain_id (int)
+    """
+    if not is_bulk_loading():
+        return
+    replaced = _bulk_loads[0]['replaced']
+    if domain_id not in replaced:
+        replaced[domain_id] = set(VariablePresence.objects.filter(domain_id=domain_id)
+                                                          .values_list('study_id', flat=True))
+        # Counts of rows without a domain code only have qualifier codes
+        replaced[domain_id] |= set(Count.objects.filter(source_domain_id=domain_id)
+                                                .values_list('study_id', flat=True))
+
+
+def refresh_derived_data():
+    """
+    Rebuilds data derived from the loaded studies and counts, bumps the
+    data version and precomputes the landing state for the new version.
+
+    Returns:
+        int (the new data version)
+    """
+    # Imported here as the landing state is built by the forms and plots,
+    # which are not needed when the signals are registered.
+    from .landing import store_landing_state
+
+    VariablePresence.rebuild()
+    rebuild_rollups()
+    Study.refresh_memberships()
+    Study.refresh_metadata()
+    version = DataVersion.bump()
+    store_landing_state(version)
+    return version
+
+
+def refresh_domain_data(replaced):
+    """
+    Refreshes the derived data after the Counts of some domains were
+    replaced. The presence and rollup rows of the replaced domains are
+    rebuilt, while the rows of the qualifier domains, which aggregate
+    Counts of every domain, and the membership arrays are only rebuilt
+    for the studies which had or have Counts of the replaced domains.
+    Then bumps the data version and precomputes the landing state.
+
+    Parameters:
+        replaced (dict) - study ids which had Counts of every replaced
+            domain id before the load
+
+    Returns:
+        int (the new data version)
+    """
+    from .landing import store_landing_state
+
+    domain_ids = list(replaced)
+    VariablePresence.rebuild(domain_ids=domain_ids)
+    rebuild_rollups(domain_ids=domain_ids)
+
+    study_ids = set(VariablePresence.objects.filter(domain_id__in=domain_ids)
+                                            .values_list('study_id', flat=True))
+    for previous_ids in replaced.values():
+        study_ids |= previous_ids
+    qualifier_ids = list(Domain.objects.filter(is_qualifier=True)
+                                       .exclude(id__in=domain_ids)
+                                       .values_list('id', flat=True))
+    VariablePresence.rebuild(study_ids, qualifier_ids)
+    rebuild_rollups(study_ids, qualifier_ids)
+    Study.refresh_memberships(study_ids)
+
+    version = DataVersion.bump()
+    store_landing_state(version)
+    return version
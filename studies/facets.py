@@ -0,0 +1,94 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+
+class FacetCounts(object):
+    """
+    Computes the number of related studies for every choice of every
+    Filter in one pass over a `StudyIndex`.
+
+    The counts of a filter are taken over the studies matching all *other*
+    active filters (leave-one-out), so that choices within a filter are a
+    union. The leave-one-out bitsets are built from prefix and suffix AND
+    products of the active filter bitsets, so each active filter is only
+    resolved once however many filters are shown.
+    """
+
+    def __init__(self, index, GET, filters):
+        """
+        Parameters:
+            index (StudyIndex)
+            GET (request.GET)
+            filters (iterable of Filter objects shown to the user)
+        """
+        self.index = index
+
+        active = [filt for filt in filters if filt.name in GET]
+        bitsets = [index.filter_bitset(filt, GET) for filt in active]
+
+        prefixes = [index.all_studies]
+        for bitset in bitsets:
+            prefixes.append(prefixes[-1] & bitset)
+        suffixes = [index.all_studies]
+        for bitset in reversed(bitsets):
+            suffixes.append(suffixes[-1] & bitset)
+        suffixes.reverse()
+
+        self.studies = prefixes[-1]
+        self.leave_one_out = {}
+        for i, filt in enumerate(active):
+            self.leave_one_out[filt.name] = prefixes[i] & suffixes[i + 1]
+
+    def get_studies(self, filt):
+        """
+        Returns the bitset of studies matching all active filters
+        except `filt`.
+
+        Parameters:
+            filt (Filter)
+
+        Returns:
+            numpy.ndarray(uint8)
+        """
+        return self.leave_one_out.get(filt.name, self.studies)
+
+    def get_counts(self, filt, ids):
+        """
+        Returns a count of related studies for each choice of a Filter.
+
+        Parameters:
+            filt (Filter)
+            ids (list(int)) - ids of the StudyVariables (study field
+                filters) or Variables (domain filters) of the choices
+
+        Returns:
+            list(int)
+        """
+        index = self.index
+        if filt.study_field:
+            matrix, sorted_ids = index.study_variables, index.study_variable_ids
+        else:
+            matrix, sorted_ids = index.variables, index.variable_ids
+
+        ids = np.asarray(ids, dtype=np.int64)
+        counts = np.zeros(len(ids), dtype=np.int64)
+        if len(ids) == 0 or len(sorted_ids) == 0:
+            return counts.tolist()
+
+        positions = np.clip(np.searchsorted(sorted_ids, ids), 0, len(sorted_ids) - 1)
+        found = sorted_ids[positions] == ids
+        counts[found] = index.count_rows(matrix, positions[found], self.get_studies(filt))
+        return counts.tolist()
@@ -26,11 +26,41 @@ from crispy_forms_foundation.layout.fields import InlineField, Field
 from crispy_forms_foundation.layout.buttons import Submit, ButtonGroup
 from crispy_forms_foundation.layout.grid import Row, Column
 
+from .facets import FacetCounts
 from .fields import (EmptyChoiceField, RangeField, DiscreteRangeField,
                      ExtendedMultipleChoiceField)
+from .index import get_study_index
 from .models import Study, Filter, Variable
 
 
+def get_filter_options(filt, facets):
+    """
+    Returns the values, choices and counts of related studies needed to
+    build the form field of a Filter.
+
+    Parameters:
+        filt (Filter)
+        facets (FacetCounts) - counts of the current selection
+
+    Returns:
+        dict
+    """
+    values = filt.get_values()
+    options = dict(values=values)
+    if filt.widget == 'discrete slider':
+        options['choices'] = filt.get_choices(values=values)
+    elif filt.widget == 'double slider':
+        options['range'] = [int(v) if v is not None and v.is_integer() else v
+                            for v in filt.get_range()]
+    else:
+        choices = filt.get_choices(values=values, include_ids=True)
+        options['choices'] = choices
+        options['counts'] = facets.get_counts(filt, [choice[0] for choice in choices])
+        if filt.domain and not filt.domain.is_qualifier:
+            options['categories'] = filt.get_categories()
+    return options
+
+
 class VariableListForm(forms.Form):
     category = EmptyChoiceField(required=False, empty_label="Search by Category")
     variable = forms.CharField(
@@ -164,13 +194,19 @@ class StudyFilterForm(forms.Form):
 
     def __init__(self, *args, **kwargs):
         self._request = kwargs.pop('request')
+        # Precomputed `get_filter_options` by Filter name, see `studies.landing`
+        self._filter_options = kwargs.pop('filter_options', None) or {}
 
         super(StudyFilterForm, self).__init__(*args, **kwargs)
 
         self.applied_filters = []
 
+        filters = list(Filter.objects.all().order_by('label'))
+        self._filters = filters
+        self._facets = None
+
         layouts = OrderedDict([('Study', []), ('Qualifier', []), ('Domain', [])])
-        for filt in Filter.objects.all().order_by('label'):
+        for filt in filters:
             layout_item, form_field = self._get_filter_layout_and_field(filt)
             # put layout_item into correct layout_group
             layouts[filt.filter_type].append(layout_item)
@@ -217,6 +253,12 @@ class StudyFilterForm(forms.Form):
             )
         )
 
+    @property
+    def facets(self):
+        if self._facets is None:
+            self._facets = FacetCounts(get_study_index(), self._request.GET, self._filters)
+        return self._facets
+
     def _get_accordion_or_empty(self, items=()):
         if items:
             field = AccordionHolder(*items, template=self.accordion_template)
@@ -239,13 +281,14 @@ class StudyFilterForm(forms.Form):
 
         layout_field = Field(filt.name)
         field_kwargs = dict(required=False, label=False)
-        values = filt.get_values()
+        options = self._filter_options.get(filt.name) or get_filter_options(filt, self.facets)
+        values = options['values']
 
         if filt.widget == 'discrete slider':
             layout_field.template = self.range_template
             initial = filt.get_initial_slider_values(self._request.GET, values=values)
             field_kwargs.update(initial)
-            choices = filt.get_choices(values=values)
+            choices = options['choices']
             form_field = DiscreteRangeField(choices=choices,
                                             custom_json=filt.widget_json,
                                             **field_kwargs)
@@ -254,16 +297,17 @@ class StudyFilterForm(forms.Form):
             layout_field.template = self.range_template
             initial = filt.get_initial_slider_values(self._request.GET)
             field_kwargs.update(initial)
-            form_field = RangeField(min_value=values[0],
-                                    max_value=values[-1],
+            min_value, max_value = options['range']
+            form_field = RangeField(min_value=min_value,
+                                    max_value=max_value,
                                     custom_json=filt.widget_json,
                                     **field_kwargs)
 
         else:
             widget = forms.CheckboxSelectMultiple()
-            choices = filt.get_choices(values=values, include_ids=True)
+            choices = options['choices']
             ids, values, labels = zip(*choices) if len(choices) else ([], [], [])
-            counts = filt.get_counts(self._request, values=values)
+            counts = options['counts']
             initial = self._request.GET.getlist(filt.name)
 
             if filt.domain and not filt.domain.is_qualifier:
@@ -274,7 +318,7 @@ class StudyFilterForm(forms.Form):
                     initial=initial,
                     counts=counts,
                     autocomplete=sorted(set(values) | set(labels)),
-                    categories=filt.get_categories(),
+                    categories=options['categories'],
                     **field_kwargs
                 )
 
@@ -0,0 +1,270 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+from django.db import connection
+
+from .models import Study, StudyVariable, Variable, VariablePresence, DataVersion
+
+# Number of set bits for every possible byte value
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def to_ints(values):
+    """Converts GET parameter values to ints, dropping invalid values"""
+    ints = []
+    for value in values:
+        try:
+            ints.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return ints
+
+
+def get_rows(sorted_ids, ids):
+    """
+    Returns the positions of `ids` in the sorted array `sorted_ids`,
+    ignoring ids that are not present.
+
+    Parameters:
+        sorted_ids (numpy.ndarray)
+        ids (list(int))
+
+    Returns:
+        numpy.ndarray(int)
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(sorted_ids) == 0 or len(ids) == 0:
+        return np.array([], dtype=np.int64)
+    rows = np.searchsorted(sorted_ids, ids)
+    rows = np.clip(rows, 0, len(sorted_ids) - 1)
+    return rows[sorted_ids[rows] == ids]
+
+
+def pack_rows(rows, columns, n_rows, n_columns):
+    """
+    Builds a packed bitset matrix with one row of `n_columns` bits per
+    item, setting the bit of every (row, column) pair.
+
+    Returns:
+        numpy.ndarray(uint8) of shape (n_rows, ceil(n_columns / 8))
+    """
+    packed = np.zeros((n_rows, (n_columns + 7) // 8), dtype=np.uint8)
+    rows = np.asarray(rows, dtype=np.int64)
+    columns = np.asarray(columns, dtype=np.int64)
+    bits = np.left_shift(1, 7 - (columns & 7)).astype(np.uint8)
+    np.bitwise_or.at(packed, (rows, columns >> 3), bits)
+    return packed
+
+
+class StudyIndex(object):
+    """
+    In-process inverted index mapping every Variable and StudyVariable to
+    a packed bitset of the studies it applies to. Bit `i` of every bitset
+    refers to the study at position `i` of `study_ids`.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+
+        self.study_ids = np.array(
+            Study.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+        n_studies = len(self.study_ids)
+
+        variables = list(Variable.objects.order_by('id').values_list('id', 'domain', 'code'))
+        self.variable_ids = np.array([v[0] for v in variables], dtype=np.int64)
+        self.variable_domains = np.array([v[1] for v in variables], dtype=np.int64)
+        self.variable_codes = np.array([v[2] for v in variables], dtype=object)
+
+        pairs = np.array(list(VariablePresence.objects.values_list('variable', 'study')),
+                         dtype=np.int64).reshape(-1, 2)
+        self.variables = pack_rows(get_rows(self.variable_ids, pairs[:, 0]),
+                                   get_rows(self.study_ids, pairs[:, 1]),
+                                   len(self.variable_ids), n_studies)
+
+        study_variables = list(StudyVariable.objects.order_by('id')
+                                                    .values_list('id', 'study_field', 'value',
+                                                                 'numeric_value'))
+        self.study_variable_ids = np.array([v[0] for v in study_variables], dtype=np.int64)
+        self.study_variable_fields = np.array([v[1] for v in study_variables], dtype=object)
+        self.study_variable_values = np.array([v[2] for v in study_variables], dtype=object)
+        # NaN for non-numeric values, which never fall inside a range
+        self.study_variable_numbers = np.array(
+            [np.nan if v[3] is None else v[3] for v in study_variables], dtype=np.float64)
+
+        pairs = np.array(list(StudyVariable.studies.through.objects
+                                           .values_list('studyvariable', 'study')),
+                         dtype=np.int64).reshape(-1, 2)
+        self.study_variables = pack_rows(get_rows(self.study_variable_ids, pairs[:, 0]),
+                                         get_rows(self.study_ids, pairs[:, 1]),
+                                         len(self.study_variable_ids), n_studies)
+
+        self.all_studies = pack_rows(np.zeros(n_studies), np.arange(n_studies), 1, n_studies)[0]
+
+    def __len__(self):
+        return len(self.study_ids)
+
+    def none(self):
+        """Returns an empty bitset"""
+        return np.zeros_like(self.all_studies)
+
+    def union(self, matrix, rows):
+        """Returns the OR of the bitsets in `rows` of `matrix`"""
+        if len(rows) == 0:
+            return self.none()
+        return np.bitwise_or.reduce(matrix[rows], axis=0)
+
+    def count(self, bitset):
+        """Returns the number of studies in a bitset"""
+        return int(POPCOUNT[bitset].sum())
+
+    def count_rows(self, matrix, rows, bitset):
+        """Returns the number of studies in `bitset` for each row of `matrix`"""
+        return POPCOUNT[matrix[rows] & bitset].sum(axis=1, dtype=np.int64)
+
+    def get_study_ids(self, bitset):
+        """
+        Returns the `Study.id` of every study in a bitset.
+
+        Returns:
+            list(int)
+        """
+        selected = np.unpackbits(bitset)[:len(self.study_ids)].astype(bool)
+        return self.study_ids[selected].tolist()
+
+    def get_bitset(self, study_ids):
+        """
+        Returns the bitset of the studies with the passed `Study.id`,
+        ignoring ids that are not in the index.
+
+        Returns:
+            numpy.ndarray(uint8)
+        """
+        rows = get_rows(self.study_ids, study_ids)
+        n_studies = len(self.study_ids)
+        return pack_rows(np.zeros(len(rows)), rows, 1, n_studies)[0]
+
+    def get_queryset(self, bitset):
+        """
+        Returns the studies in a bitset as a queryset. The statement filters
+        on the shorter of the selected ids and the ids of the other studies,
+        passed as one array parameter, instead of an IN list of every
+        selected id.
+
+        Returns:
+            queryset of Study objects
+        """
+        n_selected = self.count(bitset)
+        if n_selected == len(self.study_ids):
+            return Study.objects.all()
+        if n_selected == 0:
+            return Study.objects.none()
+        if n_selected <= len(self.study_ids) // 2:
+            where = '{0}.id = ANY(%s)'
+            study_ids = self.get_study_ids(bitset)
+        else:
+            where = 'NOT {0}.id = ANY(%s)'
+            study_ids = self.get_study_ids(~bitset & self.all_studies)
+        table = connection.ops.quote_name(Study._meta.db_table)
+        return Study.objects.extra(where=[where.format(table)], params=[study_ids])
+
+    def get_variable_rows(self, filt, GET):
+        """
+        Returns the index rows of the variables selected for a Filter
+        (StudyVariable rows for study field filters and Variable rows
+        for domain filters).
+
+        Parameters:
+            filt (Filter)
+            GET (request.GET)
+
+        Returns:
+            numpy.ndarray(int)
+        """
+        if filt.study_field:
+            in_field = self.study_variable_fields == filt.study_field_id
+            if filt.widget == 'checkbox':
+                rows = get_rows(self.study_variable_ids, to_ints(GET.getlist(filt.name)))
+                return rows[in_field[rows]]
+            if filt.widget == 'double slider':
+                from_value, to_value = filt.get_slider_range(GET)
+                numbers = self.study_variable_numbers
+                with np.errstate(invalid='ignore'):
+                    selected = (numbers >= from_value) & (numbers <= to_value)
+            else:
+                selected = np.isin(self.study_variable_values, filt.get_selections(GET))
+            return np.flatnonzero(in_field & selected)
+        else:
+            in_domain = self.variable_domains == filt.domain_id
+            if filt.widget == 'checkbox':
+                rows = get_rows(self.variable_ids, to_ints(GET.getlist(filt.name)))
+                return rows[in_domain[rows]]
+            selected = np.isin(self.variable_codes, filt.get_selections(GET))
+            return np.flatnonzero(in_domain & selected)
+
+    def filter_bitset(self, filt, GET):
+        """
+        Returns the bitset of studies matching a single Filter, mirroring
+        `Filter.filter_queryset`.
+
+        Parameters:
+            filt (Filter)
+            GET (request.GET)
+
+        Returns:
+            numpy.ndarray(uint8)
+        """
+        matrix = self.study_variables if filt.study_field else self.variables
+        return self.union(matrix, self.get_variable_rows(filt, GET))
+
+    def filter_studies(self, filters, GET):
+        """
+        Returns the bitset of studies matching all filters using AND join.
+
+        Parameters:
+            filters (queryset of Filter objects to apply)
+            GET (GET request params)
+
+        Returns:
+            numpy.ndarray(uint8)
+        """
+        bitset = self.all_studies.copy()
+        for filt in filters:
+            bitset &= self.filter_bitset(filt, GET)
+        return bitset
+
+
+_study_index = None
+
+
+def get_study_index():
+    """
+    Returns the StudyIndex of this process, rebuilding it if the data
+    changed since it was built.
+
+    Returns:
+        StudyIndex
+    """
+    global _study_index
+    version = DataVersion.current()
+    if _study_index is None or _study_index.version != version:
+        _study_index = StudyIndex(version=version)
+    return _study_index
+
+
+def reset_study_index():
+    """Discards the StudyIndex of this process, rebuilt on next use"""
+    global _study_index
+    _study_index = None
@@ -0,0 +1,86 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.http import QueryDict
+
+from .cache import canonicalize_query
+from .dataframes import query_counts_by_domain, get_study_dict
+from .facets import FacetCounts
+from .forms import get_filter_options
+from .index import get_study_index
+from .models import Filter, Precomputed, Study
+from .plots import get_summary_heatmap
+
+LANDING_KEY = 'study-filter-landing'
+
+
+def is_landing_query(GET):
+    """Checks if the GET url parameters select all studies without filtering"""
+    return canonicalize_query(GET) == ''
+
+
+def build_landing_state():
+    """
+    Computes the state of the study filter page for the empty selection.
+
+    Returns:
+        dict with
+            filter_options (dict) - `get_filter_options` by Filter name
+            context (dict) - template context of `StudyFilterView`
+    """
+    from bokeh.embed import components
+
+    studies = Study.objects.all()
+    filters = list(Filter.objects.all().order_by('label'))
+    facets = FacetCounts(get_study_index(), QueryDict(), filters)
+    filter_options = {filt.name: get_filter_options(filt, facets) for filt in filters}
+
+    study_ids = list(studies.order_by('study_id').values_list('study_id', flat=True))
+    context = dict(n_total=len(study_ids), filtered_studies=study_ids)
+    if study_ids:
+        context['field_names'], context['study_dict'] = get_study_dict(studies)
+
+    summary_heatmap_df = query_counts_by_domain(studies)
+    if len(summary_heatmap_df) > 0:
+        summary_heatmap = get_summary_heatmap(summary_heatmap_df, study_ids)
+        context['plot_summary_script'], context['plot_summary_div'] = components(summary_heatmap)
+
+    return dict(filter_options=filter_options, context=context)
+
+
+def store_landing_state(version=None):
+    """
+    Computes and stores the landing state for the current (or passed)
+    data version.
+
+    Returns:
+        dict
+    """
+    state = build_landing_state()
+    Precomputed.store(LANDING_KEY, state, version=version)
+    return state
+
+
+def get_landing_state():
+    """
+    Returns the stored landing state, computing it if the data changed
+    since it was stored.
+
+    Returns:
+        dict
+    """
+    state = Precomputed.load(LANDING_KEY)
+    if state is None:
+        state = store_landing_state()
+    return state
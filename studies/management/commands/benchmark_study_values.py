@@ -0,0 +1,139 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import aggregate_study_values
+
+# Field types of the generated fields, in turn
+FIELD_TYPES = ['str', 'list', 'int', 'float']
+
+
+def pivot_table_aggregate(df, field_types):
+    """
+    The former aggregation of `StudyVariable.get_dataframe`, a pivot_table
+    calling a Python function for every (study, field), kept as the
+    reference of the benchmark.
+    """
+    def aggfunc(x):
+        field_type = field_types[df.iloc[x.index]['study_field'].values[0]]
+        if field_type == 'list':
+            return ', '.join(x.astype(str))
+        elif field_type == 'str':
+            return max(x, key=len)
+        else:
+            return max(x)
+
+    pivot = pd.pivot_table(df, index='study', columns='study_field', values='value',
+                           aggfunc=aggfunc)
+    pivot.index.name = 'studies__study_id'
+    return pivot
+
+
+def generate_values(n_studies, n_fields, max_values, random_state):
+    """
+    Returns synthetic StudyVariable values of `n_fields` fields for
+    `n_studies` studies, with up to `max_values` values per study and
+    field, and the type of every field.
+
+    Returns:
+        pandas.DataFrame, dict
+    """
+    field_names = ['FIELD_{0:03d}'.format(i) for i in range(n_fields)]
+    field_types = {name: FIELD_TYPES[i % len(FIELD_TYPES)]
+                   for i, name in enumerate(field_names)}
+
+    n_values = random_state.randint(1, max_values + 1, (n_studies, n_fields))
+    studies = np.repeat(np.tile(np.arange(n_studies), n_fields), n_values.T.ravel())
+    fields = np.repeat(np.repeat(np.array(field_names, dtype=object), n_studies),
+                       n_values.T.ravel())
+    numbers = random_state.lognormal(3, 2, len(studies))
+    values = np.where(np.array([field_types[f] in ['int', 'float'] for f in fields]),
+                      np.round(numbers, 1).astype(str),
+                      np.char.add('value ', (numbers * 100).astype(np.int64).astype(str)))
+
+    df = pd.DataFrame({'study': np.char.add('STUDY', studies.astype(str)),
+                       'study_field': fields,
+                       'value': values.astype(object)},
+                      columns=['study', 'study_field', 'value'])
+    return df, field_types
+
+
+def time_func(func, repeat):
+    """Returns the result of `func` and the median of `repeat` wall times"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+class Command(BaseCommand):
+    help = """
+    Benchmarks the aggregation of StudyVariable values of
+    `StudyVariable.get_dataframe` against the former pivot_table
+    implementation on synthetic values, and checks both give the same
+    table.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--studies', type=int, default=10000,
+                            help='Number of studies.')
+        parser.add_argument('--fields', type=int, default=100,
+                            help='Number of study fields.')
+        parser.add_argument('--max_values', type=int, default=3,
+                            help='Maximum number of values per study and field.')
+        parser.add_argument('--repeat', type=int, default=1,
+                            help='Number of runs of every implementation.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random number generator.')
+        parser.add_argument('--output', type=str, default='',
+                            help='Path of an optional JSON report.')
+
+    def handle(self, *args, **options):
+        for name in ['studies', 'fields', 'max_values', 'repeat']:
+            if options[name] < 1:
+                raise CommandError('--{0} must be at least 1'.format(name))
+
+        df, field_types = generate_values(options['studies'], options['fields'],
+                                          options['max_values'],
+                                          np.random.RandomState(options['seed']))
+        self.stdout.write('Aggregating {0} values of {1} studies x {2} fields'.format(
+            len(df), options['studies'], options['fields']))
+
+        vectorized, vectorized_time = time_func(
+            lambda: aggregate_study_values(df, field_types), options['repeat'])
+        self.stdout.write('  vectorized  {0:>8.3f}s'.format(vectorized_time))
+        pivot_table, pivot_table_time = time_func(
+            lambda: pivot_table_aggregate(df, field_types), options['repeat'])
+        self.stdout.write('  pivot_table {0:>8.3f}s'.format(pivot_table_time))
+
+        if not vectorized.equals(pivot_table):
+            raise CommandError('The aggregations differ')
+
+        if options['output']:
+            report = dict(studies=options['studies'], fields=options['fields'],
+                          values=len(df), repeat=options['repeat'],
+                          vectorized=vectorized_time, pivot_table=pivot_table_time)
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write('Wrote report to {0}'.format(options['output']))
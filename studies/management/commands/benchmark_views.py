@@ -0,0 +1,255 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models import Count as CountAgg
+from django.http import QueryDict
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from ...cache import get_plot_cache
+from ...facets import FacetCounts
+from ...index import get_study_index, reset_study_index
+from ...models import Count, Domain, Filter, Study, Variable
+from ...views import (
+    AgeHeatmapView,
+    ExportByAgeView,
+    ExportView,
+    HeatmapView,
+    StudyExplorerView,
+    StudyFilterView,
+    StudyListView,
+)
+
+# Arguments of `generate_dataset` for each named dataset scale
+SCALES = {
+    'small': dict(studies=50, domains=5, variables=20, age_categories=5, counts=20000),
+    'medium': dict(studies=200, domains=20, variables=100, age_categories=10, counts=500000),
+    'large': dict(studies=1000, domains=40, variables=200, age_categories=15, counts=5000000),
+}
+
+# Numbers of active filters of the StudyFilterView cases
+FILTER_COUNTS = [0, 1, 5, 10]
+
+# Number of most common choices selected in every active checkbox filter
+CHOICES_PER_FILTER = 3
+
+
+def measure(func):
+    """
+    Calls `func` and measures its wall time and SQL queries.
+
+    Returns:
+        result of func, dict
+    """
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        result = func()
+        wall_time = time.perf_counter() - start
+
+    return result, dict(wall_time=wall_time,
+                        queries=len(queries),
+                        sql_time=sum(float(q['time']) for q in queries.captured_queries))
+
+
+def measure_peak_memory(func):
+    """
+    Calls `func` and returns the peak Python memory in bytes allocated
+    while it runs. Measured separately from `measure` as tracing
+    allocations slows everything down.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak_memory
+
+
+def get_filter_queries(n_filters):
+    """
+    Returns the GET url parameters activating `n_filters` checkbox
+    Filters, each selecting its most common choices.
+
+    Returns:
+        QueryDict
+    """
+    GET = QueryDict(mutable=True)
+    facets = FacetCounts(get_study_index(), QueryDict(), [])
+    filters = Filter.objects.filter(widget='checkbox').order_by('label')
+    for filt in filters[:n_filters]:
+        ids = [choice[0] for choice in filt.get_choices(include_ids=True)]
+        counts = facets.get_counts(filt, ids)
+        ranked = sorted(zip(counts, ids), reverse=True)[:CHOICES_PER_FILTER]
+        GET.setlist(filt.name, [str(pk) for _, pk in ranked])
+    return GET
+
+
+def get_cases():
+    """
+    Returns the benchmarked requests as a list of (name, view, path, GET,
+    kwargs) tuples.
+    """
+    GET_by_filters = {n: get_filter_queries(n) for n in FILTER_COUNTS}
+    cases = [('study-list', StudyListView, reverse('study-list'), QueryDict(), {})]
+    for n in FILTER_COUNTS:
+        cases.append(('study-filter-{0}-filters'.format(n), StudyFilterView,
+                      reverse('study-filter'), GET_by_filters[n], {}))
+
+    # The explorer and exports resolve the studies of the filter page
+    explorer_GET = GET_by_filters[1]
+    if not explorer_GET:
+        explorer_GET = QueryDict(mutable=True)
+        explorer_GET.setlist('study', Study.objects.values_list('id', flat=True))
+    cases.append(('study-explorer', StudyExplorerView, reverse('study-explorer'),
+                  explorer_GET, {}))
+
+    domain = (Domain.objects.filter(is_qualifier=False)
+                            .annotate(n_studies=CountAgg('variablepresence'))
+                            .filter(n_studies__gt=0)
+                            .order_by('-n_studies', 'code')
+                            .first())
+    if domain is not None:
+        kwargs = dict(domain_id=domain.id)
+        cases.append(('export', ExportView, reverse('export', kwargs=kwargs),
+                      explorer_GET, kwargs))
+        cases.append(('heatmap', HeatmapView, reverse('heatmap', kwargs=kwargs),
+                      explorer_GET, kwargs))
+        # Exports and heatmaps by age need counts qualified by age category
+        if Domain.objects.filter(code='AGECAT').exists():
+            cases.append(('export-by-age', ExportByAgeView,
+                          reverse('export_by_age', kwargs=kwargs), explorer_GET, kwargs))
+            cases.append(('heatmap-by-age', AgeHeatmapView,
+                          reverse('heatmap_by_age', kwargs=kwargs), explorer_GET, kwargs))
+    return cases
+
+
+def run_case(view_class, path, GET, kwargs):
+    """Renders a view for a GET request and returns the response"""
+    request = RequestFactory().get(path, data=GET, HTTP_HOST='localhost')
+    response = view_class.as_view()(request, **kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+def reset_caches():
+    """
+    Empties the filter cache, the plot cache and the StudyIndex of this
+    process, so that the next request runs cold.
+    """
+    cache.clear()
+    get_plot_cache().clear()
+    reset_study_index()
+
+
+def benchmark(repeat):
+    """
+    Runs every case `repeat` times on the current data. The first run
+    starts from empty caches, the remaining runs reuse them.
+
+    Returns:
+        dict
+    """
+    results = {}
+    for name, view_class, path, GET, kwargs in get_cases():
+        def run():
+            return run_case(view_class, path, GET, kwargs)
+
+        reset_caches()
+        runs = []
+        for _ in range(repeat):
+            response, stats = measure(run)
+            stats['status'] = response.status_code
+            runs.append(stats)
+
+        result = dict(query=GET.urlencode(), first=runs[0], peak_memory=measure_peak_memory(run))
+        if len(runs) > 1:
+            result['repeated'] = {key: statistics.median(stats[key] for stats in runs[1:])
+                                  for key in ['wall_time', 'queries', 'sql_time']}
+        results[name] = result
+    return results
+
+
+def describe_dataset():
+    """Returns the size of the benchmarked data"""
+    return dict(studies=Study.objects.count(),
+                domains=Domain.objects.count(),
+                variables=Variable.objects.count(),
+                counts=Count.objects.count(),
+                filters=Filter.objects.count())
+
+
+class Command(BaseCommand):
+    help = """
+    Benchmarks the study views and writes a JSON report of the wall time,
+    SQL query count, SQL time and peak Python memory of every request.
+    With --scales, a synthetic dataset is generated for every scale,
+    REPLACING the database content.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, default='benchmark.json',
+                            help='Path of the JSON report.')
+        parser.add_argument('--scales', type=str, default='',
+                            help='Comma separated dataset scales to generate and benchmark '
+                                 '({0}), defaults to the current data.'.format(
+                                     ', '.join(sorted(SCALES))))
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Number of runs of every request.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the generated datasets.')
+
+    def handle(self, *args, **options):
+        scales = [scale for scale in options['scales'].split(',') if scale]
+        unknown = [scale for scale in scales if scale not in SCALES]
+        if unknown:
+            raise CommandError('Unknown scales: {0}'.format(', '.join(unknown)))
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+
+        report = dict(created=datetime.now().isoformat(), repeat=options['repeat'],
+                      scales={})
+        for scale in scales or ['current']:
+            if scale in SCALES:
+                self.stdout.write('Generating {0} dataset'.format(scale))
+                call_command('generate_dataset', seed=options['seed'],
+                             stdout=self.stdout, **SCALES[scale])
+            results = benchmark(options['repeat'])
+            report['scales'][scale] = dict(dataset=describe_dataset(), views=results)
+            self.write_summary(scale, results)
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        self.stdout.write('Wrote report to {0}'.format(options['output']))
+
+    def write_summary(self, scale, results):
+        self.stdout.write('{0}:'.format(scale))
+        for name in sorted(results):
+            first = results[name]['first']
+            self.stdout.write('  {0:<28} {1:>8.3f}s {2:>6} queries {3:>8.3f}s SQL '
+                              '{4:>10.1f} KiB'.format(name, first['wall_time'], first['queries'],
+                                                      first['sql_time'],
+                                                      results[name]['peak_memory'] / 1024))
@@ -0,0 +1,274 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ...derived import bulk_load
+from ...models import (
+    StudyField,
+    Study,
+    StudyVariable,
+    Domain,
+    Variable,
+    Count,
+    Filter,
+    VariablePresence,
+    Precomputed,
+    DomainCount,
+    VariableCount,
+    QualifierCount,
+    to_numeric,
+)
+
+QUALIFIER_CODE = 'AGECAT'
+
+# Study fields generated for every study: field_name -> (field_type, widget)
+STUDY_FIELDS = [
+    ('START_YEAR', 'int', 'double slider'),
+    ('STUDY_TYPE', 'str', 'checkbox'),
+    ('COUNTRY', 'str', 'checkbox'),
+    ('DATA_STATUS', 'str', 'checkbox'),
+]
+
+# Tables emptied before generating, in dependency order
+CLEAR_MODELS = [
+    Precomputed,
+    DomainCount,
+    VariableCount,
+    QualifierCount,
+    VariablePresence,
+    Count.codes.through,
+    Count,
+    Filter,
+    StudyVariable.studies.through,
+    StudyVariable,
+    StudyField,
+    Variable,
+    Study,
+    Domain,
+]
+
+
+def zipf_weights(n, exponent, random_state):
+    """Returns shuffled probabilities of `n` items following Zipf's law"""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    random_state.shuffle(weights)
+    return weights / weights.sum()
+
+
+def copy_rows(cursor, table, df):
+    """Bulk inserts the rows of a DataFrame into a table using COPY"""
+    buf = io.StringIO()
+    df.to_csv(buf, header=False, index=False)
+    buf.seek(0)
+    cursor.copy_expert('COPY {0} ({1}) FROM STDIN WITH CSV'.format(
+        table, ', '.join('"{0}"'.format(column) for column in df.columns)), buf)
+
+
+def reserve_ids(cursor, model, n):
+    """
+    Advances the id sequence of a model by `n` and returns the first of
+    the `n` reserved ids.
+    """
+    table = model._meta.db_table
+    cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [table])
+    first_id = cursor.fetchone()[0]
+    cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)",
+                   [table, first_id + n])
+    return first_id
+
+
+def generate_counts(study_ids, variable_ids, qualifier_ids, n_counts, random_state):
+    """
+    Returns a DataFrame of synthetic count rows with columns study,
+    variable, qualifier, count and subjects. Studies, domains and
+    variables within a domain follow skewed (Zipf) popularity, counts
+    follow a log-normal distribution, and every (study, variable,
+    qualifier) combination occurs at most once as in IDX files.
+
+    Parameters:
+        study_ids (list(int))
+        variable_ids (numpy.ndarray(int) of shape (domains, variables))
+        qualifier_ids (list(int))
+        n_counts (int) - number of rows to draw before deduplication
+        random_state (numpy.random.RandomState)
+
+    Returns:
+        pandas.DataFrame
+    """
+    n_domains, n_variables = variable_ids.shape
+    studies = random_state.choice(
+        study_ids, n_counts, p=zipf_weights(len(study_ids), 0.8, random_state))
+    domains = random_state.choice(
+        n_domains, n_counts, p=zipf_weights(n_domains, 0.6, random_state))
+    variables = random_state.choice(
+        n_variables, n_counts, p=zipf_weights(n_variables, 1.1, random_state))
+    qualifiers = random_state.choice(
+        qualifier_ids, n_counts, p=zipf_weights(len(qualifier_ids), 0.5, random_state))
+
+    counts = np.ceil(random_state.lognormal(3, 1.5, n_counts)).astype(np.int64)
+    subjects = np.ceil(counts * random_state.uniform(0.05, 1, n_counts)).astype(np.int64)
+
+    df = pd.DataFrame({'study': studies,
+                       'variable': variable_ids[domains, variables],
+                       'qualifier': qualifiers,
+                       'count': np.minimum(counts, 2 ** 31 - 1),
+                       'subjects': np.minimum(subjects, 2 ** 31 - 1)})
+    return df.drop_duplicates(['study', 'variable', 'qualifier'])
+
+
+class Command(BaseCommand):
+    help = """
+    Replaces the database content with a synthetic dataset of studies,
+    study fields, domains, variables, age categories and counts, for
+    development and benchmarking at production scale.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--studies', type=int, default=200,
+                            help='Number of studies.')
+        parser.add_argument('--domains', type=int, default=20,
+                            help='Number of (non qualifier) domains.')
+        parser.add_argument('--variables', type=int, default=100,
+                            help='Number of variables per domain.')
+        parser.add_argument('--age_categories', type=int, default=10,
+                            help='Number of {0} qualifier variables.'.format(QUALIFIER_CODE))
+        parser.add_argument('--counts', type=int, default=1000000,
+                            help='Number of counts to draw (duplicates are dropped).')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random number generator.')
+        parser.add_argument('--batch_size', type=int, default=500000,
+                            help='Number of counts inserted per COPY statement.')
+
+    def handle(self, *args, **options):
+        for name in ['studies', 'domains', 'variables', 'age_categories', 'counts']:
+            if options[name] < 1:
+                raise CommandError('--{0} must be at least 1'.format(name))
+
+        start = time.time()
+        with bulk_load(), transaction.atomic():
+            self.generate(**options)
+        self.stdout.write('Generated dataset in {0:.1f}s'.format(time.time() - start))
+
+    def generate(self, **options):
+        random_state = np.random.RandomState(options['seed'])
+
+        with connection.cursor() as cursor:
+            for model in CLEAR_MODELS:
+                cursor.execute('DELETE FROM {0}'.format(model._meta.db_table))
+
+        # Domains and variables
+        qualifier = Domain.objects.create(code=QUALIFIER_CODE, label='Age Category',
+                                          is_qualifier=True)
+        Domain.objects.bulk_create([
+            Domain(code='D{0:03d}'.format(i), label='Domain {0}'.format(i))
+            for i in range(options['domains'])])
+        domains = list(Domain.objects.filter(is_qualifier=False).order_by('code'))
+
+        Variable.objects.bulk_create([
+            Variable(domain=qualifier, code=str(i), label='Age {0}'.format(i))
+            for i in range(options['age_categories'])])
+        Variable.objects.bulk_create([
+            Variable(domain=domain, code='V{0:04d}'.format(i),
+                     label='{0} variable {1}'.format(domain.label, i),
+                     category='Category {0}'.format(i % 5))
+            for domain in domains for i in range(options['variables'])])
+
+        qualifier_ids = list(Variable.objects.filter(domain=qualifier)
+                                             .values_list('id', flat=True))
+        variable_ids = np.array(
+            Variable.objects.filter(domain__in=domains)
+                            .order_by('domain__code', 'code')
+                            .values_list('id', flat=True),
+            dtype=np.int64).reshape(len(domains), options['variables'])
+        self.stdout.write('Created {0} domains and {1} variables'.format(
+            len(domains) + 1, variable_ids.size + len(qualifier_ids)))
+
+        # Studies and their metadata
+        Study.objects.bulk_create([Study(study_id='SYN{0:06d}'.format(i))
+                                   for i in range(options['studies'])])
+        study_ids = list(Study.objects.order_by('id').values_list('id', flat=True))
+
+        study_values = {
+            'START_YEAR': random_state.randint(1970, 2018, len(study_ids)).astype(str),
+            'STUDY_TYPE': random_state.choice(
+                ['Cohort', 'Cross-sectional', 'Interventional', 'Case-control', 'Registry'],
+                len(study_ids), p=[0.4, 0.25, 0.2, 0.1, 0.05]),
+            'COUNTRY': np.array(['Country {0}'.format(i) for i in range(30)])[
+                random_state.choice(30, len(study_ids), p=zipf_weights(30, 1, random_state))],
+            'DATA_STATUS': random_state.choice(['Available', 'Pending', 'Restricted'],
+                                               len(study_ids), p=[0.7, 0.2, 0.1]),
+        }
+
+        study_variables = []
+        for order, (field_name, field_type, widget) in enumerate(STUDY_FIELDS):
+            field = StudyField.objects.create(field_name=field_name, field_type=field_type,
+                                              big_order=order, lil_order=order)
+            values = sorted(set(study_values[field_name]))
+            study_variables += [StudyVariable(study_field=field, value=value,
+                                              numeric_value=to_numeric(value))
+                                for value in values]
+            Filter.objects.create(study_field=field, widget=widget)
+        StudyVariable.objects.bulk_create(study_variables)
+
+        study_variable_ids = {
+            (field, value): pk for pk, field, value in
+            StudyVariable.objects.values_list('id', 'study_field', 'value')}
+        StudyVariable.studies.through.objects.bulk_create([
+            StudyVariable.studies.through(
+                study_id=study_id, studyvariable_id=study_variable_ids[(field_name, value)])
+            for field_name, values in study_values.items()
+            for study_id, value in zip(study_ids, values)])
+
+        for domain in domains:
+            Filter.objects.create(domain=domain, widget='checkbox')
+        Filter.objects.create(domain=qualifier, widget='discrete slider',
+                              widget_json={'grid': True})
+        self.stdout.write('Created {0} studies with {1} study variables'.format(
+            len(study_ids), len(study_variables)))
+
+        # Counts, inserted with COPY in batches
+        df = generate_counts(study_ids, variable_ids, qualifier_ids,
+                             options['counts'], random_state)
+        codes_table = Count.codes.through._meta.db_table
+        # Counts are tagged with the domain of their variable, as by load_idx
+        variable_domains = dict(zip(variable_ids.ravel(),
+                                    np.repeat([domain.id for domain in domains],
+                                              options['variables'])))
+        with connection.cursor() as cursor:
+            for offset in range(0, len(df), options['batch_size']):
+                batch = df.iloc[offset:offset + options['batch_size']]
+                first_id = reserve_ids(cursor, Count, len(batch))
+                ids = np.arange(first_id, first_id + len(batch))
+                copy_rows(cursor, Count._meta.db_table, pd.DataFrame({
+                    'id': ids,
+                    'count': batch['count'].values,
+                    'subjects': batch['subjects'].values,
+                    'study_id': batch['study'].values,
+                    'source_domain_id': batch['variable'].map(variable_domains).values,
+                }, columns=['id', 'count', 'subjects', 'study_id', 'source_domain_id']))
+                copy_rows(cursor, codes_table, pd.DataFrame({
+                    'count_id': np.concatenate([ids, ids]),
+                    'variable_id': np.concatenate([batch['variable'].values,
+                                                   batch['qualifier'].values]),
+                }, columns=['count_id', 'variable_id']))
+                self.stdout.write('Wrote {0} of {1} counts'.format(
+                    min(offset + options['batch_size'], len(df)), len(df)))
@@ -18,7 +18,9 @@ import zipfile
 import fnmatch
 
 from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
 
+from ...derived import bulk_load, domain_replaced
 from ...models import Study, Count, Variable, Domain, EMPTY_IDENTIFIERS
 from ...utils import Utils
 
@@ -137,6 +139,16 @@ def get_valid_qualifiers(columns):
     return valid_qualifiers
 
 
+def check_idx_columns(df, **kwargs):
+    """
+    Raises a ValueError if an IDX csv file lacks a required column.
+    """
+    for required in [kwargs['study_id_field'], kwargs['count_subj_field'],
+                     kwargs['count_obs_field']]:
+        if required not in df.columns:
+            raise ValueError('Skipping IDX file. Does not contain "{0}" column. Contains columns: {1}'.format(required, ', '.join(df.columns)))
+
+
 def process_idx_df(df, domain, **kwargs):
     """
     Process an IDX csv file, creating Code, Count and Study
@@ -144,11 +156,8 @@ def process_idx_df(df, domain, **kwargs):
     """
     count_subj_field = kwargs['count_subj_field']
     count_obs_field = kwargs['count_obs_field']
-    study_id_field = kwargs['study_id_field']
 
-    for required in [study_id_field, count_subj_field, count_obs_field]:
-        if required not in df.columns:
-            raise ValueError('Skipping IDX file. Does not contain "{0}" column. Contains columns: {1}'.format(required, ', '.join(df.columns)))
+    check_idx_columns(df, **kwargs)
 
     valid_qualifiers = get_valid_qualifiers(df.columns)
 
@@ -170,7 +179,8 @@ def process_idx_df(df, domain, **kwargs):
         variable = get_domain_variable(row, domain, variable_cache)
         if variable:
             qualifiers = [variable] + qualifiers
-        query = Count.objects.create(count=count, subjects=subjects, study=study)
+        query = Count.objects.create(count=count, subjects=subjects, study=study,
+                                     source_domain=domain)
         query.codes = qualifiers
         query.save()
 
@@ -193,6 +203,34 @@ class Command(BaseCommand):
         parser.add_argument('--clear', action='store_true',
                             default=True, dest='clear',
                             help='Clear database before processing data.')
+        parser.add_argument('--replace', action='store_true',
+                            default=False, dest='replace',
+                            help='Only replace the counts and variables of the domains '
+                                 'of the loaded files instead of clearing the database, '
+                                 'refreshing the derived data of these domains only.')
+
+    def replace_domain(self, domain):
+        """
+        Deletes the counts and variables of a domain before its IDX file
+        is loaded, once per load. Counts are selected by the domain of the
+        file they were loaded from, which also selects the counts of rows
+        without a domain code, and by their codes if loaded before counts
+        recorded it.
+        """
+        if domain.id in self.replaced_domains:
+            return
+        self.replaced_domains.add(domain.id)
+        domain_replaced(domain.id)
+
+        queries = Count.objects.filter(Q(source_domain=domain) |
+                                       Q(source_domain__isnull=True, codes__domain=domain))
+        n_queries = queries.values('id').distinct().count()
+        self.stdout.write('Deleting %s counts of domain %s' % (n_queries, domain.code))
+        queries.delete()
+
+        codes = Variable.objects.filter(domain=domain)
+        self.stdout.write('Deleting %s variables of domain %s' % (len(codes), domain.code))
+        codes.delete()
 
     def process_file(self, filepath, zip_file=None, **kwargs):
         # Ensure the file matches the FILE_PATTERN
@@ -223,6 +261,9 @@ class Command(BaseCommand):
 
         # Process dataframe
         try:
+            if kwargs.get('replace'):
+                check_idx_columns(df, **kwargs)
+                self.replace_domain(domain)
             process_idx_df(df, domain, **kwargs)
             return True
         except ValueError as e:
@@ -231,7 +272,12 @@ class Command(BaseCommand):
         return False
 
     def handle(self, *args, **options):
-        if options['clear']:
+        self.replaced_domains = set()
+        with bulk_load(incremental=options.get('replace', False)):
+            self.load(*args, **options)
+
+    def load(self, *args, **options):
+        if options['clear'] and not options.get('replace'):
             queries = Count.objects.all()
             self.stdout.write('Deleting %s counts' % len(queries))
             queries.delete()
@@ -17,6 +17,7 @@ import os
 from pandas import read_excel, notnull
 from django.core.management.base import BaseCommand, CommandError
 
+from ...derived import bulk_load
 from ...models import StudyField, Study, StudyVariable, EMPTY_IDENTIFIERS, Filter, Domain
 from ...utils import Utils
 
@@ -38,6 +39,10 @@ class Command(BaseCommand):
                             help='Do not clear study fields before processing data.')
 
     def handle(self, *args, **options):
+        with bulk_load():
+            self.load(*args, **options)
+
+    def load(self, *args, **options):
         existing_filters = []
         for f in Filter.objects.all():
             existing_filters.append({
@@ -0,0 +1,130 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from datetime import datetime
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from ...cache import get_filtered_study_ids
+from ...dataframes import (
+    query_counts_by_domain,
+    query_all_variable_counts,
+    query_all_variable_count_by_variable,
+)
+from ...models import Study
+from .benchmark_views import SCALES, describe_dataset, get_filter_queries
+
+
+def frame_memory(df):
+    """Returns the memory used by a DataFrame (or dict of DataFrames) in bytes"""
+    if isinstance(df, dict):
+        return sum(frame_memory(frame) for frame in df.values())
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def get_request_frames(studies, compact):
+    """
+    Builds the count DataFrames of a study explorer request.
+
+    Returns:
+        dict of DataFrames (or dicts of DataFrames by domain code)
+    """
+    return {
+        'counts_by_domain': query_counts_by_domain(studies, compact=compact),
+        'variable_counts': query_all_variable_counts(studies, compact=compact),
+        'variable_count_by_variable': query_all_variable_count_by_variable(
+            studies, compact=compact),
+    }
+
+
+def get_selections():
+    """Returns the study selections of the measured requests by name"""
+    selections = {'all-studies': Study.objects.all()}
+    GET = get_filter_queries(1)
+    if GET:
+        selections['filtered'] = Study.objects.filter(id__in=get_filtered_study_ids(GET))
+    return selections
+
+
+def measure_memory():
+    """
+    Measures the memory of the count DataFrames of every selection with
+    the default and the compact dtypes.
+
+    Returns:
+        dict
+    """
+    results = {}
+    for name, studies in get_selections().items():
+        default = {key: frame_memory(frame)
+                   for key, frame in get_request_frames(studies, compact=False).items()}
+        compact = {key: frame_memory(frame)
+                   for key, frame in get_request_frames(studies, compact=True).items()}
+        default['total'] = sum(default.values())
+        compact['total'] = sum(compact.values())
+        results[name] = dict(
+            default=default, compact=compact,
+            saving={key: 1 - compact[key] / default[key] if default[key] else 0
+                    for key in default})
+    return results
+
+
+class Command(BaseCommand):
+    help = """
+    Reports the memory of the count DataFrames built for a study explorer
+    request with the default and the compact dtypes (see the
+    COMPACT_DATAFRAMES setting). With --scales, a synthetic dataset is
+    generated for every scale, REPLACING the database content.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, default='dataframe_memory.json',
+                            help='Path of the JSON report.')
+        parser.add_argument('--scales', type=str, default='',
+                            help='Comma separated dataset scales to generate and measure '
+                                 '({0}), defaults to the current data.'.format(
+                                     ', '.join(sorted(SCALES))))
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the generated datasets.')
+
+    def handle(self, *args, **options):
+        scales = [scale for scale in options['scales'].split(',') if scale]
+        unknown = [scale for scale in scales if scale not in SCALES]
+        if unknown:
+            raise CommandError('Unknown scales: {0}'.format(', '.join(unknown)))
+
+        report = dict(created=datetime.now().isoformat(), scales={})
+        for scale in scales or ['current']:
+            if scale in SCALES:
+                self.stdout.write('Generating {0} dataset'.format(scale))
+                call_command('generate_dataset', seed=options['seed'],
+                             stdout=self.stdout, **SCALES[scale])
+            results = measure_memory()
+            report['scales'][scale] = dict(dataset=describe_dataset(), requests=results)
+            self.write_summary(scale, results)
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        self.stdout.write('Wrote report to {0}'.format(options['output']))
+
+    def write_summary(self, scale, results):
+        self.stdout.write('{0}:'.format(scale))
+        for name in sorted(results):
+            result = results[name]
+            self.stdout.write('  {0:<14} {1:>12.1f} KiB default {2:>12.1f} KiB compact '
+                              '{3:>6.1%} saved'.format(name, result['default']['total'] / 1024,
+                                                       result['compact']['total'] / 1024,
+                                                       result['saving']['total']))
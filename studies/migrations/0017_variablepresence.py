@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+populate_sql = """
+INSERT INTO studies_variablepresence (study_id, variable_id, domain_id)
+SELECT DISTINCT c.study_id, cc.variable_id, v.domain_id
+FROM studies_count c
+JOIN studies_count_codes cc ON cc.count_id = c.id
+JOIN studies_variable v ON v.id = cc.variable_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studies', '0016_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VariablePresence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.ForeignKey(help_text='The domain of the variable.', on_delete=django.db.models.deletion.CASCADE, to='studies.Domain')),
+                ('study', models.ForeignKey(help_text='The study with counts for the variable.', on_delete=django.db.models.deletion.CASCADE, to='studies.Study')),
+                ('variable', models.ForeignKey(help_text='The variable the study has counts for.', on_delete=django.db.models.deletion.CASCADE, to='studies.Variable')),
+            ],
+            options={
+                'verbose_name_plural': 'variable presences',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='variablepresence',
+            unique_together=set([('study', 'variable')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='variablepresence',
+            index_together=set([('domain', 'variable')]),
+        ),
+        migrations.RunSQL(populate_sql, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import math
+
+from django.db import migrations, models
+
+
+def to_numeric(value):
+    if value in ['NaN', '.', 'None', None]:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def populate_numeric_values(apps, schema_editor):
+    StudyVariable = apps.get_model('studies', 'StudyVariable')
+    for pk, value in StudyVariable.objects.values_list('pk', 'value').iterator():
+        numeric_value = to_numeric(value)
+        if numeric_value is not None:
+            StudyVariable.objects.filter(pk=pk).update(numeric_value=numeric_value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studies', '0017_variablepresence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studyvariable',
+            name='numeric_value',
+            field=models.FloatField(blank=True, db_index=True, editable=False, help_text='The value of this study variable cast to a number, if numeric', null=True),
+        ),
+        migrations.RunPython(populate_numeric_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studies', '0018_studyvariable_numeric_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Precomputed',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Name of the precomputed result.', max_length=100, unique=True)),
+                ('version', models.PositiveIntegerField(help_text='Data version the result was computed from.')),
+                ('data', models.BinaryField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'precomputed results',
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+populate_sql = """
+UPDATE studies_study s SET
+    variable_ids = COALESCE(
+        (SELECT array_agg(p.variable_id ORDER BY p.variable_id)
+         FROM studies_variablepresence p WHERE p.study_id = s.id), '{}'),
+    study_variable_ids = COALESCE(
+        (SELECT array_agg(t.studyvariable_id ORDER BY t.studyvariable_id)
+         FROM studies_studyvariable_studies t WHERE t.study_id = s.id), '{}');
+"""
+
+create_indexes_sql = """
+CREATE INDEX studies_study_variable_ids_gin ON studies_study USING gin (variable_ids);
+CREATE INDEX studies_study_study_variable_ids_gin ON studies_study USING gin (study_variable_ids);
+"""
+
+drop_indexes_sql = """
+DROP INDEX studies_study_variable_ids_gin;
+DROP INDEX studies_study_study_variable_ids_gin;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studies', '0019_precomputed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='study',
+            name='study_variable_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, editable=False, help_text='Ids of the StudyVariables the study is tagged with (GIN indexed).', size=None),
+        ),
+        migrations.AddField(
+            model_name='study',
+            name='variable_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, editable=False, help_text='Ids of the Variables the study has counts for (GIN indexed).', size=None),
+        ),
+        migrations.RunSQL(populate_sql, migrations.RunSQL.noop),
+        migrations.RunSQL(create_indexes_sql, drop_indexes_sql),
+    ]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import math
+
+import django.contrib.postgres.fields.jsonb
+import pandas as pd
+from django.db import migrations
+
+
+def to_numeric(value):
+    if value in ['NaN', '.', 'None', 9999, None]:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def aggregate_study_values(df, field_types):
+    keys = ['study', 'study_field']
+    df = df[df['study'].notnull()].reset_index(drop=True)
+    field_type = df['study_field'].map(field_types)
+    parts = []
+
+    lists = df[field_type == 'list']
+    if len(lists):
+        parts.append(lists.groupby(keys, sort=False)['value']
+                          .agg(lambda x: ', '.join(x.astype(str))))
+
+    strs = df[field_type == 'str']
+    if len(strs):
+        strs = strs.assign(length=-strs['value'].str.len(), position=strs.index)
+        parts.append(strs.sort_values(keys + ['length', 'position'])
+                         .drop_duplicates(keys)
+                         .set_index(keys)['value'])
+
+    others = df[~field_type.isin(['list', 'str'])]
+    if len(others):
+        parts.append(others.sort_values(keys + ['value'])
+                           .drop_duplicates(keys, keep='last')
+                           .set_index(keys)['value'])
+
+    if not parts:
+        return pd.DataFrame(index=pd.Index([], name='studies__study_id'))
+    values = pd.concat(parts)
+    values.index.names = ['studies__study_id', 'study_field']
+    return values.unstack('study_field')
+
+
+def to_metadata_value(value, field_type):
+    if field_type == 'int':
+        number = to_numeric(value)
+        return None if number is None else int(round(number))
+    elif field_type == 'float':
+        return to_numeric(value)
+    return value
+
+
+def get_study_metadata(df, field_types):
+    documents = {}
+    if len(df) == 0:
+        return documents
+    values = aggregate_study_values(df, field_types)
+    if len(values.columns) == 0:
+        return documents
+    for (study_id, field_name), value in values.stack().items():
+        value = to_metadata_value(value, field_types.get(field_name))
+        if value is not None:
+            documents.setdefault(study_id, {})[field_name] = value
+    return documents
+
+
+def populate_metadata(apps, schema_editor):
+    Study = apps.get_model('studies', 'Study')
+    StudyField = apps.get_model('studies', 'StudyField')
+    StudyVariable = apps.get_model('studies', 'StudyVariable')
+
+    df = pd.DataFrame.from_records(
+        list(StudyVariable.objects.values_list('studies__study_id', 'study_field', 'value')),
+        columns=['study', 'study_field', 'value'])
+    field_types = dict(StudyField.objects.values_list('field_name', 'field_type'))
+    for study_id, metadata in get_study_metadata(df, field_types).items():
+        Study.objects.filter(study_id=study_id).update(metadata=metadata)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studies', '0020_study_memberships'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='study',
+            name='metadata',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=dict, editable=False, help_text='Typed StudyVariable values of the study by StudyField name.'),
+        ),
+        migrations.RunPython(populate_metadata, migrations.RunPython.noop),
+    ]
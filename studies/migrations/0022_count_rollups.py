@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+populate_sql = """
+INSERT INTO studies_domaincount (study_id, domain_id, count, subjects)
+SELECT c.study_id, v.domain_id, MAX(c.count), MAX(c.subjects)
+FROM studies_count c
+JOIN studies_count_codes cc ON cc.count_id = c.id
+JOIN studies_variable v ON v.id = cc.variable_id
+GROUP BY c.study_id, v.domain_id;
+
+INSERT INTO studies_variablecount (study_id, variable_id, domain_id, count, subjects, count_id)
+SELECT c.study_id, cc.variable_id, v.domain_id, MAX(c.count), MAX(c.subjects), MAX(c.id)
+FROM studies_count c
+JOIN studies_count_codes cc ON cc.count_id = c.id
+JOIN studies_variable v ON v.id = cc.variable_id
+GROUP BY c.study_id, cc.variable_id, v.domain_id;
+
+INSERT INTO studies_qualifiercount (study_id, variable_id, domain_id, qualifier_id,
+                                    qualifier_domain_id, count, subjects, count_id)
+SELECT c.study_id, cv.variable_id, v.domain_id, cq.variable_id, q.domain_id,
+       SUM(c.count), SUM(c.subjects), SUM(c.id)
+FROM studies_count c
+JOIN studies_count_codes cv ON cv.count_id = c.id
+JOIN studies_variable v ON v.id = cv.variable_id
+JOIN studies_count_codes cq ON cq.count_id = c.id
+JOIN studies_variable q ON q.id = cq.variable_id
+JOIN studies_domain qd ON qd.id = q.domain_id
+WHERE qd.is_qualifier AND v.domain_id <> q.domain_id
+GROUP BY c.study_id, cv.variable_id, v.domain_id, cq.variable_id, q.domain_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studies', '0021_study_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DomainCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField()),
+                ('subjects', models.IntegerField()),
+                ('domain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='studies.Domain')),
+                ('study', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='studies.Study')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VariableCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField()),
+                ('subjects', models.IntegerField()),
+                ('count_id', models.IntegerField(help_text='Largest id of the aggregated Counts.')),
+                ('domain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='studies.Domain')),
+                ('study', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='studies.Study')),
+                ('variable', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='studies.Variable')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QualifierCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.BigIntegerField()),
+                ('subjects', models.BigIntegerField()),
+                ('count_id', models.BigIntegerField(help_text='Sum of the ids of the aggregated Counts.')),
+                ('domain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='studies.Domain')),
+                ('qualifier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='studies.Variable')),
+                ('qualifier_domain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='studies.Domain')),
+                ('study', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='studies.Study')),
+                ('variable', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='studies.Variable')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='domaincount',
+            unique_together=set([('study', 'domain')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='variablecount',
+            unique_together=set([('study', 'variable')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='variablecount',
+            index_together=set([('domain', 'study')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='qualifiercount',
+            unique_together=set([('study', 'variable', 'qualifier')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='qualifiercount',
+            index_together=set([('qualifier_domain', 'domain', 'study')]),
+        ),
+        migrations.RunSQL(populate_sql, reverse_sql=migrations.RunSQL.noop),
+    ]
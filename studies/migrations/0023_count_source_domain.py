@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studies', '0022_count_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='count',
+            name='source_domain',
+            field=models.ForeignKey(blank=True, editable=False, help_text='The domain of the IDX file the count was loaded from.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='studies.Domain'),
+        ),
+    ]
@@ -12,12 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import Counter
+import json
+import math
+import pickle
 
 import pandas as pd
 
-from django.db import models
-from django.db.models import Q
+from django.db import connection, models, transaction
+from django.db.models import F, Max, Min
 from django.forms import ValidationError
 from django.contrib.postgres import fields as pgfields
 
@@ -30,6 +32,9 @@ WIDGETS = [('checkbox', 'Checkboxes'), ('double slider', 'Double Slider'),
 FIELD_TYPES = [('list', 'List'), ('int', 'Integer'),
                ('str', 'Character String'), ('float', 'Decimal Number')]
 
+# Ways `Study.filter_studies` can resolve filters, see its docstring
+FILTER_METHODS = ['index', 'sql', 'queryset']
+
 
 def is_list(val, sep=','):
     """Checks if type can be cast to list, which is true for all types"""
@@ -56,6 +61,129 @@ def is_int(val):
         return False
 
 
+def to_numeric(val):
+    """
+    Casts a value to float, returning None for missing, non-numeric
+    and non-finite values.
+    """
+    if val in EMPTY_IDENTIFIERS:
+        return None
+    try:
+        val = float(val)
+    except (TypeError, ValueError):
+        return None
+    return val if math.isfinite(val) else None
+
+
+def aggregate_study_values(df, field_types):
+    """
+    Pivots the values of StudyVariables into a study x field table,
+    aggregating the values of a study and field by the field type: list
+    values are joined, the longest str value is kept, and the largest
+    value is kept for other types.
+
+    Parameters:
+        df (pandas.DataFrame) - with study, study_field and value columns
+        field_types (dict) - field type by StudyField name
+
+    Returns:
+        pandas.DataFrame with study ids as index and field names as columns
+    """
+    keys = ['study', 'study_field']
+    df = df[df['study'].notnull()].reset_index(drop=True)
+    field_type = df['study_field'].map(field_types)
+    parts = []
+
+    # Keep the order of the values, which gives the order of joined lists
+    lists = df[field_type == 'list']
+    if len(lists):
+        parts.append(lists.groupby(keys, sort=False)['value']
+                          .agg(lambda x: ', '.join(x.astype(str))))
+
+    # The first of the longest values, like max(values, key=len)
+    strs = df[field_type == 'str']
+    if len(strs):
+        strs = strs.assign(length=-strs['value'].str.len(), position=strs.index)
+        parts.append(strs.sort_values(keys + ['length', 'position'])
+                         .drop_duplicates(keys)
+                         .set_index(keys)['value'])
+
+    others = df[~field_type.isin(['list', 'str'])]
+    if len(others):
+        parts.append(others.sort_values(keys + ['value'])
+                           .drop_duplicates(keys, keep='last')
+                           .set_index(keys)['value'])
+
+    if not parts:
+        return pd.DataFrame(index=pd.Index([], name='studies__study_id'))
+    values = pd.concat(parts)
+    values.index.names = ['studies__study_id', 'study_field']
+    return values.unstack('study_field')
+
+
+def to_metadata_value(value, field_type):
+    """
+    Converts a StudyVariable value to its type in `Study.metadata`: ints
+    and floats for numeric fields (None if not numeric), strings otherwise.
+    """
+    if field_type == 'int':
+        number = to_numeric(value)
+        return None if number is None else int(round(number))
+    elif field_type == 'float':
+        return to_numeric(value)
+    return value
+
+
+def get_study_metadata(df, field_types):
+    """
+    Builds the `Study.metadata` documents from StudyVariable values.
+
+    Parameters:
+        df (pandas.DataFrame) - with study, study_field and value columns
+        field_types (dict) - field type by StudyField name
+
+    Returns:
+        dict of {StudyField name: value} by `Study.study_id`
+    """
+    documents = {}
+    if len(df) == 0:
+        return documents
+    values = aggregate_study_values(df, field_types)
+    if len(values.columns) == 0:
+        return documents
+    for (study_id, field_name), value in values.stack().items():
+        value = to_metadata_value(value, field_types.get(field_name))
+        if value is not None:
+            documents.setdefault(study_id, {})[field_name] = value
+    return documents
+
+
+def get_slice_filter(study_ids=None, domain_ids=None):
+    """
+    Returns the SQL conditions selecting the rows of derived tables that
+    belong to the passed studies and domains, as `AND` clauses with
+    `{study}` and `{domain}` column placeholders, and their parameters.
+    None is returned when one of the lists is empty, i.e. no row matches.
+
+    Parameters:
+        study_ids (list(int)) - all studies if None
+        domain_ids (list(int)) - all domains if None
+
+    Returns:
+        str or None, list
+    """
+    conditions, params = [], []
+    for column, ids in [('{study}', study_ids), ('{domain}', domain_ids)]:
+        if ids is None:
+            continue
+        ids = list(ids)
+        if not ids:
+            return None, []
+        conditions.append('AND {0} = ANY(%s)'.format(column))
+        params.append(ids)
+    return ' '.join(conditions), params
+
+
 class StudyField(models.Model):
 
     field_name = models.CharField(
@@ -135,6 +263,18 @@ class Study(models.Model):
         max_length=50, unique=True, verbose_name='Study ID',
         help_text='Unique ID to reference the study.', db_index=True)
 
+    variable_ids = pgfields.ArrayField(
+        models.IntegerField(), default=list, blank=True, editable=False,
+        help_text='Ids of the Variables the study has counts for (GIN indexed).')
+
+    study_variable_ids = pgfields.ArrayField(
+        models.IntegerField(), default=list, blank=True, editable=False,
+        help_text='Ids of the StudyVariables the study is tagged with (GIN indexed).')
+
+    metadata = pgfields.JSONField(
+        default=dict, blank=True, editable=False,
+        help_text='Typed StudyVariable values of the study by StudyField name.')
+
     class Meta:
         verbose_name_plural = "Studies"
 
@@ -142,25 +282,123 @@ class Study(models.Model):
         return self.study_id
 
     @classmethod
-    def filter_studies(self, filters, GET):
+    def refresh_memberships(cls, study_ids=None):
+        """
+        Recomputes the `variable_ids` and `study_variable_ids` arrays of the
+        passed studies, or of all studies if `study_ids` is None. Variable ids
+        are taken from `VariablePresence`, which must be up to date.
+
+        Parameters:
+            study_ids (list(int))
+        """
+        where, params = '', []
+        if study_ids is not None:
+            study_ids = list(study_ids)
+            if not study_ids:
+                return
+            where, params = 'WHERE s.id = ANY(%s)', [study_ids]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE {0} s SET
+                    variable_ids = COALESCE(
+                        (SELECT array_agg(p.variable_id ORDER BY p.variable_id)
+                         FROM {1} p WHERE p.study_id = s.id), '{{}}'),
+                    study_variable_ids = COALESCE(
+                        (SELECT array_agg(t.studyvariable_id ORDER BY t.studyvariable_id)
+                         FROM {2} t WHERE t.study_id = s.id), '{{}}')
+                {3}
+                """.format(cls._meta.db_table, VariablePresence._meta.db_table,
+                           StudyVariable.studies.through._meta.db_table, where),
+                params)
+
+    @classmethod
+    def refresh_metadata(cls, study_ids=None):
+        """
+        Rebuilds the `metadata` documents of the passed studies, or of all
+        studies if `study_ids` is None, from their StudyVariables.
+
+        Parameters:
+            study_ids (list(int))
+        """
+        study_variables = StudyVariable.objects.all()
+        where, params = '', []
+        if study_ids is not None:
+            study_ids = list(study_ids)
+            if not study_ids:
+                return
+            study_variables = study_variables.filter(studies__id__in=study_ids)
+            where, params = 'WHERE id = ANY(%s)', [study_ids]
+
+        df = pd.DataFrame.from_records(
+            list(study_variables.values_list('studies__study_id', 'study_field', 'value')),
+            columns=['study', 'study_field', 'value'])
+        field_types = dict(StudyField.objects.values_list('field_name', 'field_type'))
+        documents = get_study_metadata(df, field_types)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE {0} SET metadata = '{{}}' {1}".format(cls._meta.db_table, where), params)
+            cursor.execute(
+                """
+                UPDATE {0} s SET metadata = d.value
+                FROM jsonb_each(%s::jsonb) d
+                WHERE s.study_id = d.key
+                """.format(cls._meta.db_table),
+                [json.dumps(documents)])
+
+    @classmethod
+    def filter_studies(self, filters, GET, method='index'):
         """
         Returns studies with filters applied using AND join.
 
         Parameters:
             filters (queryset of Filter objects to apply)
             GET (GET request params)
+            method (str) - one of `FILTER_METHODS`:
+                'index' resolves the filters with the in-process `StudyIndex`,
+                'sql' compiles all filters into a single SQL statement,
+                'queryset' evaluates each `Filter.filter_queryset` separately
         Returns:
             queryset of Study objects
         """
+        from .index import get_study_index
+
         studies = self.objects.all()
         if not filters:
             return studies
-        set_list = [set(filt.filter_queryset(studies, GET)
-                            .values_list('study_id', flat=True)) for filt in filters]
+        if method == 'index':
+            index = get_study_index()
+            studies = index.get_queryset(index.filter_studies(filters, GET))
+        elif method == 'sql':
+            studies = self.compile_filter_query(filters, GET)
+        elif method == 'queryset':
+            set_list = [set(filt.filter_queryset(studies, GET)
+                                .values_list('study_id', flat=True)) for filt in filters]
+            study_ids = set.intersection(*set_list)
+            studies = studies.filter(study_id__in=study_ids)
+        else:
+            raise ValueError('Unknown filter method: {0}'.format(method))
 
-        study_ids = set.intersection(*set_list)
-        studies = studies.filter(study_id__in=study_ids)
+        return studies
+
+    @classmethod
+    def compile_filter_query(self, filters, GET):
+        """
+        Returns studies with filters applied using AND join, compiled into
+        a single SQL statement with one semi-join subquery per filter so
+        that the database plans the whole selection at once.
 
+        Parameters:
+            filters (queryset of Filter objects to apply)
+            GET (GET request params)
+        Returns:
+            queryset of Study objects
+        """
+        studies = self.objects.all()
+        for filt in filters:
+            studies = studies.filter(id__in=filt.get_study_subquery(GET))
         return studies
 
 
@@ -189,6 +427,10 @@ class StudyVariable(models.Model):
         max_length=300, verbose_name='Value',
         help_text='The value of this study variable')
 
+    numeric_value = models.FloatField(
+        null=True, blank=True, editable=False, db_index=True,
+        help_text='The value of this study variable cast to a number, if numeric')
+
     class Meta:
         unique_together = ('value', 'study_field',)
         verbose_name_plural = "Study Variables"
@@ -217,6 +459,7 @@ class StudyVariable(models.Model):
                 # Return that the object was not saved since it was split into other variables.
                 return False
 
+        self.numeric_value = to_numeric(self.value)
         super(StudyVariable, self).save(*args, **kwargs)
         if self._with_studies:
             for study in self._with_studies:
@@ -272,26 +515,12 @@ class StudyVariable(models.Model):
             return
         study_fields = kwargs['study_field__in']
 
-        study_var_dict = study_variables.values('studies__study_id', 'study_field', 'value')
-        df = pd.DataFrame.from_records(study_var_dict)
+        df = pd.DataFrame.from_records(
+            list(study_variables.values_list('studies__study_id', 'study_field', 'value')),
+            columns=['study', 'study_field', 'value'])
+        study_field_types = dict(study_fields.values_list('field_name', 'field_type'))
 
-        study_field_types = {}
-        for sf in study_fields:
-            study_field_types[sf.field_name] = sf.field_type
-
-        def aggfunc(x):
-            study_field_name = df.iloc[x.index]['study_field'].values[0]
-            study_field_type = study_field_types[study_field_name]
-            if study_field_type == 'list':
-                return ', '.join(x.astype(str))
-            elif study_field_type == 'str':
-                return max(x, key=len)
-            else:
-                return max(x)
-
-        pivot = pd.pivot_table(df, index='studies__study_id',
-                               columns='study_field', values='value',
-                               aggfunc=aggfunc)
+        pivot = aggregate_study_values(df, study_field_types)
 
         pivot = pivot.rename(columns=dict(study_fields.values_list('field_name', 'label')))
 
@@ -335,7 +564,6 @@ class Domain(models.Model):
         super(Domain, self).save(*args, **kwargs)
 
 
-
 class FilterManager(models.Manager):
     def get_queryset(self):
         return super(FilterManager, self).get_queryset().select_related('study_field', 'domain')
@@ -479,34 +707,17 @@ class Filter(models.Model):
             list(int)
         """
 
-        GET = request.GET.copy().dict()
-
-        # Remove 'self' filter from filter dict so that counts are inter-domain union
-        GET.pop(self.name, None)
-        filters = Filter.objects.filter(
-            Q(study_field__in=GET.keys()) | Q(domain__code__in=GET.keys())
-        )
-        studies = Study.filter_studies(filters, request.GET)
-
-        if self.study_field:
-            variables = list(studies.filter(studyvariable__study_field=self.study_field)
-                                    .values_list('studyvariable__value', flat=True))
-
-        else:
-            variables = [variable["code"] for variable
-                         in (Variable.objects.filter(domain=self.domain,
-                                                     count__study__in=studies)
-                                             .values('count__study__study_id', 'code')
-                                             .distinct())]
-
-        counter = Counter(variables)
+        from .facets import FacetCounts
+        from .index import get_study_index
 
         if not values:
             values = self.get_values()
+        choices = self.get_choices(values=values, include_ids=True)
+        ids = [choice[0] for choice in choices]
 
-        counts = [counter[v] for v in values]
-
-        return counts
+        # Counts leave out 'self' filter so that counts are inter-domain union
+        facets = FacetCounts(get_study_index(), request.GET, Filter.objects.all())
+        return facets.get_counts(self, ids)
 
     def get_categories(self):
         """
@@ -551,15 +762,53 @@ class Filter(models.Model):
             from_index, to_index = labels.index(from_value), labels.index(to_value)
             selections = list(values[from_index:to_index + 1])
         elif self.widget == 'double slider':
-            if not values:
-                values = self.get_values()
-            from_value, to_value = GET.get(self.name).split(';')
-            selections = [v for v in values if
-                          float(from_value) <= float(v) <= float(to_value)]
+            from_value, to_value = self.get_slider_range(GET)
+            if self.study_field:
+                selections = list(StudyVariable.objects
+                                  .filter(study_field=self.study_field,
+                                          numeric_value__range=(from_value, to_value))
+                                  .values_list('value', flat=True)
+                                  .order_by('value'))
+            else:
+                if not values:
+                    values = self.get_values()
+                selections = [v for v in values if from_value <= float(v) <= to_value]
         else:
             raise ValueError
         return selections
 
+    def get_slider_range(self, GET):
+        """
+        Parses the passed GET url parameter of a double slider to the
+        selected numeric range
+
+        Parameters:
+            GET (request.GET)
+
+        Returns:
+            tuple(float, float)
+        """
+        from_value, to_value = GET.get(self.name).split(';')
+        return float(from_value), float(to_value)
+
+    def get_range(self):
+        """
+        Returns the minimum and maximum numeric values of the Filter, or
+        (None, None) if the Filter has no numeric values.
+
+        Returns:
+            tuple(float, float)
+        """
+        if self.study_field:
+            bounds = (StudyVariable.objects.filter(study_field=self.study_field)
+                                           .aggregate(min=Min('numeric_value'),
+                                                      max=Max('numeric_value')))
+            return bounds['min'], bounds['max']
+        values = [float(v) for v in self.get_values()]
+        if not values:
+            return None, None
+        return min(values), max(values)
+
     def filter_queryset(self, studies, GET):
         """
         Filters a Study QuerySet using the passed GET url parameters
@@ -571,23 +820,76 @@ class Filter(models.Model):
         Returns:
             django.db.models.query.QuerySet
         """
-        selections = self.get_selections(GET)
-
-        if self.study_field:
-            query_var = 'value' if self.widget in ['double slider', 'discrete slider'] else 'id'
+        if self.widget == 'checkbox':
+            studies = studies.filter(**self.get_membership_lookup(GET))
+        elif self.study_field:
             studies = (studies.filter(studyvariable__study_field=self.study_field,
-                                      **{'studyvariable__%s__in' % query_var: selections})
+                                      **self._get_study_variable_lookup(GET, 'studyvariable__'))
                               .distinct()
                        )
         else:
-            filter_on = 'id' if self.widget == 'checkbox' else 'code'
-            filter_key = 'count__codes__%s__in' % filter_on
-            studies = (studies.filter(count__codes__domain=self.domain,
-                                      **{filter_key: selections})
-                              .distinct()
-                       )
+            presence = VariablePresence.objects.filter(
+                domain=self.domain, variable__code__in=self.get_selections(GET))
+            studies = studies.filter(id__in=presence.values('study_id'))
         return studies
 
+    def get_study_subquery(self, GET):
+        """
+        Returns a subquery of the ids of studies matching the passed GET
+        url parameters. Equivalent to `filter_queryset` but without joins
+        or DISTINCT on the Study table so it can be nested in a larger
+        query.
+
+        Parameters:
+            GET (request.GET)
+
+        Returns:
+            django.db.models.query.QuerySet
+        """
+        if self.widget == 'checkbox':
+            subquery = Study.objects.filter(**self.get_membership_lookup(GET)).values('id')
+        elif self.study_field:
+            lookup = self._get_study_variable_lookup(GET, 'studyvariable__')
+            subquery = (StudyVariable.studies.through.objects
+                                     .filter(studyvariable__study_field=self.study_field, **lookup)
+                                     .values('study_id'))
+        else:
+            subquery = (VariablePresence.objects
+                                        .filter(domain=self.domain,
+                                                variable__code__in=self.get_selections(GET))
+                                        .values('study_id'))
+        return subquery
+
+    def get_membership_lookup(self, GET):
+        """
+        Returns the Study lookup of a checkbox Filter for the passed GET url
+        parameters. It matches the selected Variable or StudyVariable ids
+        against the GIN indexed `Study` membership arrays (`&&`), so that no
+        joins on the M2M tables are needed.
+
+        Parameters:
+            GET (request.GET)
+
+        Returns:
+            dict
+        """
+        selections = self.get_selections(GET)
+        if self.study_field:
+            ids = StudyVariable.objects.filter(study_field=self.study_field, id__in=selections)
+            return {'study_variable_ids__overlap': list(ids.values_list('id', flat=True))}
+        ids = Variable.objects.filter(domain=self.domain, id__in=selections)
+        return {'variable_ids__overlap': list(ids.values_list('id', flat=True))}
+
+    def _get_study_variable_lookup(self, GET, prefix=''):
+        """
+        Returns the StudyVariable lookup of a study field slider Filter for
+        the passed GET url parameters. Double sliders filter on the indexed
+        `numeric_value` range rather than on the list of matching values.
+        """
+        if self.widget == 'double slider':
+            return {prefix + 'numeric_value__range': self.get_slider_range(GET)}
+        return {prefix + 'value__in': self.get_selections(GET)}
+
     def get_applied_filters(self, GET):
         """
         Parses passed GET url parameters to pretty string of filtering values
@@ -658,9 +960,10 @@ class Filter(models.Model):
             labels = list(zip(*self.get_choices()))[1]
             return labels[0] == from_value and labels[-1] == to_value
         elif self.widget == 'double slider':
-            values = self.get_values()
-            return (float(values[0]) >= float(from_value) and
-                    float(values[-1]) <= float(to_value))
+            min_value, max_value = self.get_range()
+            if min_value is None:
+                return True
+            return min_value >= float(from_value) and max_value <= float(to_value)
         else:
             raise ValueError
 
@@ -721,5 +1024,354 @@ class Count(models.Model):
         db_index=True
     )
 
+    source_domain = models.ForeignKey(
+        Domain, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='+',
+        help_text='The domain of the IDX file the count was loaded from.',
+    )
+
     def __str__(self):
         return '{0}: {1}'.format(self.study, self.count)
+
+
+class VariablePresence(models.Model):
+    """
+    Deduplicated (study, variable) pairs for which at least one Count
+    exists. Derived from `Count.codes` and kept up to date by the loaders
+    and `studies.signals`, so that domain filters and counts do not need
+    to expand the Count x codes relation.
+    """
+
+    study = models.ForeignKey(
+        Study, on_delete=models.CASCADE,
+        help_text='The study with counts for the variable.')
+
+    variable = models.ForeignKey(
+        Variable, on_delete=models.CASCADE,
+        help_text='The variable the study has counts for.')
+
+    domain = models.ForeignKey(
+        Domain, on_delete=models.CASCADE,
+        help_text='The domain of the variable.')
+
+    class Meta:
+        unique_together = ('study', 'variable',)
+        index_together = ('domain', 'variable',)
+        verbose_name_plural = "variable presences"
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.study_id, self.variable_id)
+
+    @classmethod
+    def rebuild(cls, study_ids=None, domain_ids=None):
+        """
+        Recomputes the presence rows of the passed studies and domains
+        from their Counts, or of all studies (domains) if `study_ids`
+        (`domain_ids`) is None.
+
+        Parameters:
+            study_ids (list(int))
+            domain_ids (list(int))
+        """
+        where, params = get_slice_filter(study_ids, domain_ids)
+        if where is None:
+            return
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {0} WHERE TRUE {1}'.format(
+                    cls._meta.db_table, where.format(study='study_id', domain='domain_id')),
+                params)
+            cursor.execute(
+                """
+                INSERT INTO {0} (study_id, variable_id, domain_id)
+                SELECT DISTINCT c.study_id, cc.variable_id, v.domain_id
+                FROM {1} c
+                JOIN {2} cc ON cc.count_id = c.id
+                JOIN {3} v ON v.id = cc.variable_id
+                WHERE TRUE {4}
+                """.format(cls._meta.db_table, Count._meta.db_table,
+                           Count.codes.through._meta.db_table, Variable._meta.db_table,
+                           where.format(study='c.study_id', domain='v.domain_id')),
+                params)
+
+
+class RollupMixin(object):
+    """
+    Rebuilds a rollup table of Counts with an `INSERT ... SELECT` of its
+    `rollup_columns` from `rollup_sql`, for some or all studies.
+    """
+    rollup_columns = []
+    rollup_sql = ''
+
+    @classmethod
+    def rebuild(cls, study_ids=None, domain_ids=None):
+        """
+        Recomputes the rows of the passed studies and domains from their
+        Counts, or of all studies (domains) if `study_ids` (`domain_ids`)
+        is None. The domain of a row is the domain of its `variable`.
+
+        Parameters:
+            study_ids (list(int))
+            domain_ids (list(int))
+        """
+        where, params = get_slice_filter(study_ids, domain_ids)
+        if where is None:
+            return
+
+        tables = dict(count=Count._meta.db_table,
+                      codes=Count.codes.through._meta.db_table,
+                      variable=Variable._meta.db_table,
+                      domain=Domain._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {0} WHERE TRUE {1}'.format(
+                    cls._meta.db_table, where.format(study='study_id', domain='domain_id')),
+                params)
+            cursor.execute(
+                'INSERT INTO {0} ({1}) {2}'.format(
+                    cls._meta.db_table, ', '.join(cls.rollup_columns),
+                    cls.rollup_sql.format(
+                        where=where.format(study='c.study_id', domain='v.domain_id'),
+                        **tables)),
+                params)
+
+
+class DomainCount(RollupMixin, models.Model):
+    """
+    Largest count and subjects of the Counts of every (study, domain), the
+    rollup shown by the study summary heatmaps.
+    """
+
+    study = models.ForeignKey(Study, on_delete=models.CASCADE)
+
+    domain = models.ForeignKey(Domain, on_delete=models.CASCADE)
+
+    count = models.IntegerField()
+
+    subjects = models.IntegerField()
+
+    rollup_columns = ['study_id', 'domain_id', 'count', 'subjects']
+    rollup_sql = """
+        SELECT c.study_id, v.domain_id, MAX(c.count), MAX(c.subjects)
+        FROM {count} c
+        JOIN {codes} cc ON cc.count_id = c.id
+        JOIN {variable} v ON v.id = cc.variable_id
+        WHERE TRUE {where}
+        GROUP BY c.study_id, v.domain_id
+        """
+
+    class Meta:
+        unique_together = ('study', 'domain',)
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.study_id, self.domain_id)
+
+
+class VariableCount(RollupMixin, models.Model):
+    """
+    Largest count and subjects of the Counts of every (study, variable),
+    the rollup shown by the domain heatmaps and exports.
+    """
+
+    study = models.ForeignKey(Study, on_delete=models.CASCADE)
+
+    variable = models.ForeignKey(Variable, on_delete=models.CASCADE)
+
+    domain = models.ForeignKey(Domain, on_delete=models.CASCADE)
+
+    count = models.IntegerField()
+
+    subjects = models.IntegerField()
+
+    count_id = models.IntegerField(
+        help_text='Largest id of the aggregated Counts.')
+
+    rollup_columns = ['study_id', 'variable_id', 'domain_id', 'count', 'subjects', 'count_id']
+    rollup_sql = """
+        SELECT c.study_id, cc.variable_id, v.domain_id, MAX(c.count), MAX(c.subjects),
+               MAX(c.id)
+        FROM {count} c
+        JOIN {codes} cc ON cc.count_id = c.id
+        JOIN {variable} v ON v.id = cc.variable_id
+        WHERE TRUE {where}
+        GROUP BY c.study_id, cc.variable_id, v.domain_id
+        """
+
+    class Meta:
+        unique_together = ('study', 'variable',)
+        index_together = ('domain', 'study',)
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.study_id, self.variable_id)
+
+
+class QualifierCount(RollupMixin, models.Model):
+    """
+    Summed count and subjects of the Counts of every (study, variable,
+    qualifier variable), the rollup shown by the heatmaps and exports by
+    age.
+    """
+
+    study = models.ForeignKey(Study, on_delete=models.CASCADE)
+
+    variable = models.ForeignKey(Variable, on_delete=models.CASCADE, related_name='+')
+
+    domain = models.ForeignKey(Domain, on_delete=models.CASCADE, related_name='+')
+
+    qualifier = models.ForeignKey(Variable, on_delete=models.CASCADE, related_name='+')
+
+    qualifier_domain = models.ForeignKey(Domain, on_delete=models.CASCADE, related_name='+')
+
+    count = models.BigIntegerField()
+
+    subjects = models.BigIntegerField()
+
+    count_id = models.BigIntegerField(
+        help_text='Sum of the ids of the aggregated Counts.')
+
+    rollup_columns = ['study_id', 'variable_id', 'domain_id', 'qualifier_id',
+                      'qualifier_domain_id', 'count', 'subjects', 'count_id']
+    rollup_sql = """
+        SELECT c.study_id, cv.variable_id, v.domain_id, cq.variable_id, q.domain_id,
+               SUM(c.count), SUM(c.subjects), SUM(c.id)
+        FROM {count} c
+        JOIN {codes} cv ON cv.count_id = c.id
+        JOIN {variable} v ON v.id = cv.variable_id
+        JOIN {codes} cq ON cq.count_id = c.id
+        JOIN {variable} q ON q.id = cq.variable_id
+        JOIN {domain} qd ON qd.id = q.domain_id
+        WHERE qd.is_qualifier AND v.domain_id <> q.domain_id {where}
+        GROUP BY c.study_id, cv.variable_id, v.domain_id, cq.variable_id, q.domain_id
+        """
+
+    class Meta:
+        unique_together = ('study', 'variable', 'qualifier',)
+        index_together = ('qualifier_domain', 'domain', 'study',)
+
+    def __str__(self):
+        return '{0}: {1} x {2}'.format(self.study_id, self.variable_id, self.qualifier_id)
+
+
+ROLLUP_MODELS = (DomainCount, VariableCount, QualifierCount)
+
+
+def rebuild_rollups(study_ids=None, domain_ids=None):
+    """Rebuilds all rollup tables for the passed (or all) studies and domains"""
+    for model in ROLLUP_MODELS:
+        model.rebuild(study_ids, domain_ids)
+
+
+class DataVersion(models.Model):
+    """
+    Counter identifying the state of the loaded data. Derived data and
+    caches record the version they were built from so that they can be
+    detected as stale once the data changes.
+    """
+
+    version = models.PositiveIntegerField(
+        default=0, help_text='Incremented every time the loaded data changes.')
+
+    updated = models.DateTimeField(auto_now=True)
+
+    # Number of changes seen by this process that may not be committed yet,
+    # bumped by the model signals registered in `studies.signals`.
+    local_changes = 0
+
+    class Meta:
+        verbose_name_plural = "data versions"
+
+    def __str__(self):
+        return str(self.version)
+
+    @classmethod
+    def get_version(cls):
+        """
+        Returns the committed data version shared by all processes.
+
+        Returns:
+            int
+        """
+        version = cls.objects.values_list('version', flat=True).first()
+        return version or 0
+
+    @classmethod
+    def current(cls):
+        """
+        Returns a token identifying the data visible to this process.
+
+        Returns:
+            tuple(int, int)
+        """
+        return (cls.get_version(), cls.local_changes)
+
+    @classmethod
+    def bump(cls):
+        """
+        Increments the committed data version.
+
+        Returns:
+            int
+        """
+        with transaction.atomic():
+            obj, _ = cls.objects.select_for_update().get_or_create(pk=1)
+            cls.objects.filter(pk=obj.pk).update(version=F('version') + 1)
+        return cls.get_version()
+
+
+class Precomputed(models.Model):
+    """
+    Pickled results computed from a single data version, such as the
+    state of the pages for the empty selection (see `studies.landing`).
+    Results are only returned for the data version they were built from.
+    """
+
+    key = models.CharField(
+        max_length=100, unique=True,
+        help_text='Name of the precomputed result.')
+
+    version = models.PositiveIntegerField(
+        help_text='Data version the result was computed from.')
+
+    data = models.BinaryField()
+
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "precomputed results"
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.key, self.version)
+
+    @classmethod
+    def load(cls, key):
+        """
+        Returns the stored result if it is up to date, otherwise None.
+
+        Parameters:
+            key (str)
+
+        Returns:
+            object or None
+        """
+        data = (cls.objects.filter(key=key, version=DataVersion.get_version())
+                           .values_list('data', flat=True)
+                           .first())
+        if data is None:
+            return None
+        return pickle.loads(bytes(data))
+
+    @classmethod
+    def store(cls, key, value, version=None):
+        """
+        Stores a result computed from the current (or passed) data version.
+
+        Parameters:
+            key (str)
+            value (picklable object)
+            version (int)
+        """
+        if version is None:
+            version = DataVersion.get_version()
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        cls.objects.update_or_create(key=key, defaults=dict(version=version, data=data))
@@ -16,6 +16,8 @@
 # from bokeh.palettes import viridis
 FONT = 'Roboto'
 MONO_FONT = 'Roboto Mono'
+# Largest side in pixels of the cells of an image heatmap
+IMAGE_MAX_SIZE = 2000
 
 
 def add_axes(plot):
@@ -63,19 +65,21 @@ def add_title(plot, title_text):
     )
 
 
-def get_plot(y_factors, y_factors_width, x_factors):
+def get_plot(y_factors, y_factors_width, x_factors, cell_size=None):
     from bokeh.models import (
         Plot,
         FactorRange,
     )
     x_range = FactorRange(*x_factors)
     y_range = FactorRange(*y_factors)
-    if len(x_factors) < 10:
-        x_factor = 40
+    if cell_size is not None:
+        x_factor = y_factor = cell_size
+    elif len(x_factors) < 10:
+        x_factor, y_factor = 40, 25
     else:
-        x_factor = 20
+        x_factor, y_factor = 20, 25
     plot_width = (len(x_range.factors) * x_factor) + (y_factors_width * 8) + 60
-    plot_height = len(y_range.factors) * 25 + 200
+    plot_height = len(y_range.factors) * y_factor + 200
     plot = Plot(
         x_range=x_range, y_range=y_range,
         logo=None, toolbar_location=None,
@@ -139,6 +143,101 @@ def add_glyphs(plot, source, color_mapper, x_label, y_label):
     )
 
 
+def get_image_cell_size(x_factors, y_factors):
+    """
+    Returns the size in pixels of the cells of an image heatmap, so that
+    its cells fit in IMAGE_MAX_SIZE pixels in both directions.
+    """
+    n_factors = max(len(x_factors), len(y_factors), 1)
+    return max(2, min(20, IMAGE_MAX_SIZE // n_factors))
+
+
+def add_image(plot, df, color_mapper, x_label, y_label):
+    """
+    Draws the counts of a heatmap as a single Image glyph, a dense
+    matrix with one pixel block per (x, y) factor pair, instead of a
+    Rect and a Circle per cell. Empty cells are NaN and transparent.
+
+    Parameters:
+        plot (bokeh Plot) - see `get_plot`
+        df (pandas.Dataframe) - with columns x_label, y_label, count and
+            subjects
+        color_mapper (LinearColorMapper) - see `get_colormapper_add_colorbar`
+        x_label (str) - column of the x factors
+        y_label (str) - column of the y factors
+
+    Returns:
+        bokeh GlyphRenderer
+    """
+    from bokeh.models import (
+        ColumnDataSource, Image
+    )
+    x_factors = list(plot.x_range.factors)
+    y_factors = list(plot.y_range.factors)
+    data = {}
+    for column in ['count', 'subjects']:
+        matrix = df.pivot_table(index=y_label, columns=x_label, values=column, aggfunc='max')
+        matrix = matrix.reindex(index=y_factors, columns=x_factors)
+        data[column] = [matrix.values.astype('float64')]
+    data['image'] = list(data['count'])
+
+    # https://github.com/bokeh/bokeh/pull/5872 can simplify when released
+    source = ColumnDataSource()
+    source.data.update(data)
+    color_mapper.nan_color = 'rgba(0, 0, 0, 0)'
+    # Factor n of a categorical range spans [n + 0.5, n + 1.5] in synthetic
+    # coordinates, the rows of the matrix go from the bottom to the top
+    return plot.add_glyph(
+        source,
+        Image(
+            image='image', x=0.5, y=0.5, dw=len(x_factors), dh=len(y_factors),
+            color_mapper=color_mapper
+        )
+    )
+
+
+def add_image_hover(plot, renderer, y_name):
+    """
+    Reports the study, y factor, count and subjects of the cell under the
+    mouse of an image heatmap in a Div. Bokeh does not hit test the cells
+    of an Image, so the hover is attached to a transparent Quad spanning
+    the image and the cell is found from the factors under the mouse.
+
+    Returns:
+        bokeh Div (to add below the plot)
+    """
+    from bokeh.models import (
+        CustomJS, HoverTool, Quad
+    )
+    from bokeh.models.widgets import Div
+    n_x = len(plot.x_range.factors)
+    n_y = len(plot.y_range.factors)
+    hover_renderer = plot.add_glyph(
+        renderer.data_source,
+        Quad(
+            left=0.5, right=n_x + 0.5, bottom=0.5, top=n_y + 0.5,
+            fill_alpha=0, line_color=None
+        )
+    )
+    readout = Div(text='', width=plot.plot_width)
+    callback = CustomJS(args=dict(plot=plot, ds=renderer.data_source, readout=readout), code="""
+       var geometry = cb_data.geometry;
+       var i = plot.y_range.factors.indexOf(geometry.y);
+       var j = plot.x_range.factors.indexOf(geometry.x);
+       var count = (i >= 0 && j >= 0) ? Number(ds.data.count[0][i][j]) : NaN;
+       if (isNaN(count)) {
+         readout.text = '';
+         return;
+       }
+       var subjects = Number(ds.data.subjects[0][i][j]);
+       readout.text = '%s: ' + geometry.y + ' | Study: ' + geometry.x +
+                      ' | Count: ' + count.toLocaleString() +
+                      ' | Subjects: ' + subjects.toLocaleString();
+    """ % y_name)
+    plot.add_tools(HoverTool(tooltips=[], renderers=[hover_renderer], callback=callback))
+    return readout
+
+
 def add_age_glyphs(plot, df, color_mapper, show_studies=True):
     from bokeh.models import (
         Rect, Circle, ColumnDataSource
@@ -231,7 +330,7 @@ def add_categorical_offsets(df):
 def add_count_toggle(plot):
     from bokeh.layouts import widgetbox
     from bokeh.models import (
-        CustomJS, Column, Circle, Rect, ColumnDataSource,
+        CustomJS, Column, Circle, Rect, Image, ColumnDataSource,
         LinearColorMapper, ColorBar, Label
     )
     from bokeh.models.widgets import RadioButtonGroup
@@ -239,12 +338,15 @@ def add_count_toggle(plot):
     args = dict(
         circle=None,
         rect=None,
+        image=None,
     )
     for r in plot.references():
         if isinstance(r, Circle):
             args['circle'] = r
         elif isinstance(r, Rect):
             args['rect'] = r
+        elif isinstance(r, Image):
+            args['image'] = r
         elif isinstance(r, LinearColorMapper):
             args['cmapper'] = r
         elif isinstance(r, ColorBar):
@@ -259,7 +361,19 @@ def add_count_toggle(plot):
        var selection = {Observations: 'count', Subjects: 'subjects'}[label];
        if (circle !== null) {circle.fill_color.field = selection};
        if (rect !== null && rect.fill_color) {rect.fill_color.field = selection };
-       var max_val = Math.max.apply(null, ds.data[selection]);
+       if (image !== null) {
+         ds.data.image = ds.data[selection];
+         var max_val = 0;
+         var rows = ds.data[selection][0];
+         for (var i = 0; i < rows.length; i++) {
+           for (var j = 0; j < rows[i].length; j++) {
+             var value = Number(rows[i][j]);
+             if (value > max_val) { max_val = value; }
+           }
+         }
+       } else {
+         var max_val = Math.max.apply(null, ds.data[selection]);
+       }
        cmapper.high = max_val;
        cbar.ticker.ticks = [0, max_val];
        split_title = title.text.split(' ');
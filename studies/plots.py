@@ -12,6 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import pandas as pd
+
+from django.conf import settings
+
 from .plot_utils import (
     get_plot,
     add_axes,
@@ -21,66 +25,88 @@ from .plot_utils import (
     add_hover,
     add_age_glyphs,
     add_age_hover,
-    add_count_toggle
+    add_count_toggle,
+    add_image,
+    add_image_hover,
+    get_image_cell_size,
 )
 
 
-def get_summary_heatmap(df, study_ids):
+def use_image(x_factors, y_factors):
+    """
+    Returns whether a heatmap has more cells than the HEATMAP_IMAGE_CELLS
+    setting, and is drawn as a single image instead of a glyph per cell.
+    """
+    max_cells = getattr(settings, 'HEATMAP_IMAGE_CELLS', None)
+    return max_cells is not None and len(x_factors) * len(y_factors) > max_cells
+
+
+def get_counts_heatmap(df, x_factors, y_factors, y_label, y_name, title_text):
+    """
+    Returns the heatmap of the count and subjects of studies by y factor,
+    drawn as an image above HEATMAP_IMAGE_CELLS cells.
+
+    Parameters:
+        df (pandas.Dataframe) - with columns study_label, y_label, count
+            and subjects
+        x_factors (list(str)) - study ids
+        y_factors (list(str))
+        y_label (str) - column of the y factors
+        y_name (str) - name of the y factors in the hover
+        title_text (str)
+
+    Returns:
+        bokeh Column
+    """
     from bokeh.models import ColumnDataSource
     from bokeh.document import Document
-    # https://github.com/bokeh/bokeh/pull/5872 can simplify when released
-    source = ColumnDataSource()
-    source.data.update(df[['study_label', 'domain_label', 'count', 'subjects']].to_dict(orient='list'))  # noqa
-    y_factors = df[['domain_label']].sort_values(by='domain_label')['domain_label'].unique().tolist()  # noqa
-    y_factors_width = df['domain_label'].map(len).max()
-    x_factors = study_ids
+    y_factors_width = df[y_label].astype(str).str.len().max()
     max_count = df['count'].max()
-    title_text = "Number of observations by domain"
-    tooltips = ("Domain: @domain_label <br> Study: @study_label <br> "
-                "Count: @count{0a} <br> Subjects: @subjects{0a}")
 
-    plot = get_plot(y_factors, y_factors_width, x_factors)
-    color_mapper = get_colormapper_add_colorbar(plot, high=max_count)
-    add_axes(plot)
-    add_glyphs(plot, source, color_mapper, 'study_label', 'domain_label')
-    add_hover(plot, tooltips)
-    add_title(plot, title_text)
-    column = add_count_toggle(plot)
+    if use_image(x_factors, y_factors):
+        cell_size = get_image_cell_size(x_factors, y_factors)
+        plot = get_plot(y_factors, y_factors_width, x_factors, cell_size=cell_size)
+        color_mapper = get_colormapper_add_colorbar(plot, high=max_count)
+        add_axes(plot)
+        renderer = add_image(plot, df, color_mapper, 'study_label', y_label)
+        readout = add_image_hover(plot, renderer, y_name)
+        add_title(plot, title_text)
+        column = add_count_toggle(plot)
+        column.children.append(readout)
+    else:
+        # https://github.com/bokeh/bokeh/pull/5872 can simplify when released
+        source = ColumnDataSource()
+        source.data.update(df[['study_label', y_label, 'count', 'subjects']].to_dict(orient='list'))  # noqa
+        tooltips = ("{0}: @{1} <br> Study: @study_label <br> "
+                    "Count: @count{{0a}} <br> Subjects: @subjects{{0a}}").format(y_name, y_label)
+
+        plot = get_plot(y_factors, y_factors_width, x_factors)
+        color_mapper = get_colormapper_add_colorbar(plot, high=max_count)
+        add_axes(plot)
+        add_glyphs(plot, source, color_mapper, 'study_label', y_label)
+        add_hover(plot, tooltips)
+        add_title(plot, title_text)
+        column = add_count_toggle(plot)
     # https://github.com/bokeh/bokeh/pull/5909 can remove when released
     Document().add_root(column)
 
     return column
 
 
+def get_summary_heatmap(df, study_ids):
+    y_factors = df[['domain_label']].sort_values(by='domain_label')['domain_label'].unique().tolist()  # noqa
+    title_text = "Number of observations by domain"
+    return get_counts_heatmap(df, list(study_ids), y_factors, 'domain_label', 'Domain', title_text)
+
+
 def get_heatmap(df, study_ids):
-    from bokeh.models import ColumnDataSource
-    from bokeh.document import Document
-    # https://github.com/bokeh/bokeh/pull/5872 can simplify when released
-    source = ColumnDataSource()
-    source.data.update(df[['study_label', 'var_label', 'count', 'subjects']].to_dict(orient='list'))  # noqa
     try:
         df['var_code'] = df['var_code'].astype('int')
     except ValueError:
         pass
     y_factors = df[['var_code', 'var_label']].sort_values(by='var_code')['var_label'].unique().tolist()   # noqa
-    y_factors_width = df['var_label'].map(len).max()
-    x_factors = study_ids
-    max_count = df['count'].max()
     title_text = "Number of observations by variable"
-    tooltips = ("Variable: @var_label <br> Study: @study_label <br> "
-                "Count: @count{0a} <br> Subjects: @subjects{0a}")
-
-    plot = get_plot(y_factors, y_factors_width, x_factors)
-    color_mapper = get_colormapper_add_colorbar(plot, high=max_count)
-    add_axes(plot)
-    add_glyphs(plot, source, color_mapper, 'study_label', 'var_label')
-    add_hover(plot, tooltips)
-    add_title(plot, title_text)
-    column = add_count_toggle(plot)
-    # https://github.com/bokeh/bokeh/pull/5909 can remove when released
-    Document().add_root(column)
-
-    return column
+    return get_counts_heatmap(df, list(study_ids), y_factors, 'var_label', 'Variable', title_text)
 
 
 def get_age_heatmap(df):
@@ -95,7 +121,7 @@ def get_age_heatmap(df):
     except ValueError:
         pass
     y_factors = df[['var_code', 'var_label']].sort_values(by='var_code')['var_label'].unique().tolist()  # noqa
-    y_factors_width = df['var_label'].map(len).max()
+    y_factors_width = df['var_label'].astype(str).str.len().max()
     x_factors = df[['qual_code', 'qual_label']].sort_values(by='qual_code')['qual_label'].unique().tolist()  # noqa
     max_count = df['count'].max()
     title_text = "Number of observations by variable and age"
@@ -118,3 +144,110 @@ def get_age_heatmap(df):
     Document().add_root(column)
 
     return column
+
+
+def get_variable_factors(df):
+    """Returns the variable labels of a heatmap ordered by variable code"""
+    df = df[['var_code', 'var_label']]
+    try:
+        df = df.assign(var_code=df['var_code'].astype('int'))
+    except ValueError:
+        pass
+    return df.sort_values(by='var_code')['var_label'].unique().tolist()
+
+
+def get_domains_heatmap(domain_dfs, domain_labels, study_ids):
+    """
+    Returns a single variable heatmap for several domains, showing one
+    domain at a time. The rows and variable factors of all domains are
+    shipped once as long-format sources and a Select swaps the plotted
+    rows, factors and color range on the client, so that the number of
+    models does not grow with the number of domains. The plot is sized
+    for the domain with the most variables.
+
+    Parameters:
+        domain_dfs (dict(str, pandas.Dataframe)) - `query_variable_counts`
+            by Domain code
+        domain_labels (OrderedDict(str, str)) - labels by Domain code, in
+            the order of the Select options
+        study_ids (list(str))
+
+    Returns:
+        bokeh Column
+    """
+    from bokeh.document import Document
+    from bokeh.layouts import widgetbox
+    from bokeh.models import Circle, Column, ColorBar, ColumnDataSource, CustomJS
+    from bokeh.models.widgets import Select
+
+    codes = [code for code in domain_labels if code in domain_dfs]
+    columns = ['study_label', 'var_label', 'count', 'subjects']
+    rows = pd.concat([domain_dfs[code][columns].assign(domain=code) for code in codes])
+    factors = pd.concat([pd.DataFrame({'domain': code,
+                                       'var_label': get_variable_factors(domain_dfs[code])})
+                         for code in codes])
+
+    # https://github.com/bokeh/bokeh/pull/5872 can simplify when released
+    all_rows = ColumnDataSource()
+    all_rows.data.update(rows.to_dict(orient='list'))
+    all_factors = ColumnDataSource()
+    all_factors.data.update(factors.to_dict(orient='list'))
+    source = ColumnDataSource()
+    first = rows[rows['domain'] == codes[0]]
+    source.data.update(first[columns].to_dict(orient='list'))
+
+    y_factors = factors[factors['domain'] == codes[0]]['var_label'].tolist()
+    y_factors_width = rows['var_label'].astype(str).str.len().max()
+    title_text = "Number of observations by variable"
+    tooltips = ("Variable: @var_label <br> Study: @study_label <br> "
+                "Count: @count{0a} <br> Subjects: @subjects{0a}")
+
+    plot = get_plot(y_factors, y_factors_width, study_ids)
+    # Bokeh does not reliably lay out a plot again when its height changes on
+    # the client, so the plot is sized for the domain with the most variables
+    plot.plot_height = int(factors.groupby('domain').size().max()) * 25 + 200
+    color_mapper = get_colormapper_add_colorbar(plot, high=first['count'].max())
+    add_axes(plot)
+    add_glyphs(plot, source, color_mapper, 'study_label', 'var_label')
+    add_hover(plot, tooltips)
+    add_title(plot, title_text)
+    column = add_count_toggle(plot)
+
+    args = dict(all_rows=all_rows, all_factors=all_factors, ds=source, plot=plot,
+                cmapper=color_mapper)
+    for r in plot.references():
+        if isinstance(r, Circle):
+            args['circle'] = r
+        elif isinstance(r, ColorBar):
+            args['cbar'] = r
+
+    callback = CustomJS(args=args, code="""
+       var code = cb_obj.value;
+       var data = {study_label: [], var_label: [], count: [], subjects: []};
+       for (var i = 0; i < all_rows.data.domain.length; i++) {
+         if (all_rows.data.domain[i] === code) {
+           for (var key in data) { data[key].push(all_rows.data[key][i]); }
+         }
+       }
+       var y_factors = [];
+       for (var i = 0; i < all_factors.data.domain.length; i++) {
+         if (all_factors.data.domain[i] === code) {
+           y_factors.push(all_factors.data.var_label[i]);
+         }
+       }
+       ds.data = data;
+       plot.y_range.factors = y_factors;
+       var max_val = Math.max.apply(null, data[circle.fill_color.field]);
+       cmapper.high = max_val;
+       cbar.ticker.ticks = [0, max_val];
+       ds.trigger("change");
+    """)
+
+    select = Select(title="Domain", value=codes[0],
+                    options=[(code, domain_labels[code]) for code in codes])
+    select.callback = callback
+    layout = Column(widgetbox(select, width=300), column)
+    # https://github.com/bokeh/bokeh/pull/5909 can remove when released
+    Document().add_root(layout)
+
+    return layout
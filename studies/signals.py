@@ -0,0 +1,207 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .derived import is_bulk_loading
+from .models import (
+    StudyField,
+    Study,
+    StudyVariable,
+    Domain,
+    Variable,
+    Count,
+    Filter,
+    DataVersion,
+    VariablePresence,
+    rebuild_rollups,
+)
+
+DATA_MODELS = (StudyField, Study, StudyVariable, Domain, Variable, Count, Filter)
+
+
+# Changes of the current transaction of each thread, see `on_commit_once`
+_pending = threading.local()
+
+
+def get_pending():
+    """Returns the studies to rebuild and the version bump pending in this thread"""
+    if not hasattr(_pending, 'study_ids'):
+        _pending.study_ids = set()
+        _pending.bump = False
+    return _pending
+
+
+def on_commit_once(study_ids=(), bump=False):
+    """
+    Records studies whose derived data must be rebuilt and whether the
+    data version must be bumped, and registers `commit_changes` once per
+    transaction, however many signals record changes in it. Outside of a
+    transaction the changes are committed right away, like
+    `transaction.on_commit`. Changes of a rolled back transaction (or
+    savepoint) are dropped with its registration.
+    """
+    connection = transaction.get_connection()
+    registered = any(entry[1] is commit_changes for entry in connection.run_on_commit)
+    pending = get_pending()
+    if not registered:
+        # Rolling back discards the registration but not the pending changes
+        pending.study_ids, pending.bump = set(), False
+    pending.study_ids.update(study_ids)
+    pending.bump = pending.bump or bump
+
+    if not connection.in_atomic_block:
+        commit_changes()
+    elif not registered:
+        transaction.on_commit(commit_changes)
+
+
+def commit_changes():
+    """
+    Rebuilds the derived data of the studies changed by the committed
+    transaction, then bumps the data version so that other processes
+    never read the new version before its derived data.
+    """
+    pending = get_pending()
+    study_ids, bump = pending.study_ids, pending.bump
+    pending.study_ids, pending.bump = set(), False
+    if study_ids:
+        with transaction.atomic():
+            rebuild_study_variables(sorted(study_ids))
+        DataVersion.local_changes += 1
+    if bump:
+        DataVersion.bump()
+
+
+def data_changed():
+    """
+    Marks the data of this process as changed and, unless a loader is
+    running, bumps the shared data version once the change is committed.
+    """
+    DataVersion.local_changes += 1
+    if not is_bulk_loading():
+        on_commit_once(bump=True)
+
+
+def model_changed(sender, raw=False, **kwargs):
+    if not raw:
+        data_changed()
+
+
+# Connected per sender: a receiver of every model would stop Django from
+# fast deleting the rows of the derived tables
+for model in DATA_MODELS:
+    post_save.connect(model_changed, sender=model)
+    post_delete.connect(model_changed, sender=model)
+
+
+@receiver(m2m_changed, sender=Count.codes.through)
+@receiver(m2m_changed, sender=StudyVariable.studies.through)
+def relation_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        data_changed()
+
+
+def rebuild_study_variables(study_ids=None):
+    """
+    Rebuilds the presence rows, count rollups and membership arrays of the
+    passed studies
+    """
+    VariablePresence.rebuild(study_ids)
+    rebuild_rollups(study_ids)
+    Study.refresh_memberships(study_ids)
+
+
+@receiver(m2m_changed, sender=Count.codes.through)
+def count_codes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if is_bulk_loading() or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        rebuild_study_variables([instance.study_id])
+    elif pk_set:
+        study_ids = Count.objects.filter(pk__in=pk_set).values_list('study_id', flat=True)
+        rebuild_study_variables(set(study_ids))
+    else:
+        rebuild_study_variables()
+
+
+@receiver(m2m_changed, sender=StudyVariable.studies.through)
+def study_variable_studies_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if is_bulk_loading() or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        study_ids = [instance.pk]
+    elif pk_set:
+        study_ids = pk_set
+    else:
+        study_ids = None
+    Study.refresh_memberships(study_ids)
+    Study.refresh_metadata(study_ids)
+
+
+@receiver(post_delete, sender=Count)
+def count_deleted(sender, instance, **kwargs):
+    # Deleting a Study deletes its Counts one signal at a time, rebuild once
+    if not is_bulk_loading():
+        on_commit_once([instance.study_id])
+
+
+@receiver(post_save, sender=Count)
+def count_saved(sender, instance, created, raw=False, **kwargs):
+    # New Counts have no codes yet, they are rolled up once codes are added
+    if not created and not raw and not is_bulk_loading():
+        rebuild_rollups([instance.study_id])
+
+
+@receiver(post_delete, sender=StudyVariable)
+def study_variable_deleted(sender, instance, **kwargs):
+    if not is_bulk_loading():
+        studies = Study.objects.filter(study_variable_ids__contains=[instance.pk])
+        study_ids = list(studies.values_list('id', flat=True))
+        Study.refresh_memberships(study_ids)
+        Study.refresh_metadata(study_ids)
+
+
+@receiver(post_save, sender=StudyVariable)
+def study_variable_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw and not is_bulk_loading():
+        Study.refresh_metadata(instance.studies.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=StudyField)
+@receiver(post_delete, sender=StudyField)
+def study_field_changed(sender, raw=False, **kwargs):
+    if not raw and not is_bulk_loading():
+        Study.refresh_metadata()
+
+
+@receiver(post_delete, sender=Variable)
+def variable_deleted(sender, instance, **kwargs):
+    if not is_bulk_loading():
+        studies = Study.objects.filter(variable_ids__contains=[instance.pk])
+        study_ids = list(studies.values_list('id', flat=True))
+        rebuild_rollups(study_ids)
+        Study.refresh_memberships(study_ids)
+
+
+@receiver(post_save, sender=Variable)
+def variable_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw and not is_bulk_loading():
+        presences = VariablePresence.objects.filter(variable=instance)
+        presences.update(domain=instance.domain)
+        rebuild_rollups(presences.values_list('study_id', flat=True))
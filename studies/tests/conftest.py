@@ -5,6 +5,16 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 
+from studies.models import DataVersion
+
+
+@pytest.fixture(autouse=True)
+def new_data_version():
+    # Data of previous tests is rolled back without bumping the data version,
+    # make sure indexes and caches built from it are not reused.
+    DataVersion.local_changes += 1
+
+
 @pytest.fixture
 def hide_cookie_banner(selenium):
     def _f():
@@ -0,0 +1,45 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from ..management.commands.benchmark_study_values import generate_values, pivot_table_aggregate
+from ..models import aggregate_study_values
+
+
+def test_aggregate_study_values_matches_pivot_table():
+    df, field_types = generate_values(50, 8, 3, np.random.RandomState(0))
+    expected = pivot_table_aggregate(df, field_types)
+    assert aggregate_study_values(df, field_types).equals(expected)
+
+
+def test_benchmark_study_values_writes_report(tmpdir):
+    output = str(tmpdir.join('report.json'))
+    call_command('benchmark_study_values', studies=20, fields=4, output=output)
+
+    with open(output) as f:
+        report = json.load(f)
+    assert report['studies'] == 20
+    assert report['vectorized'] > 0
+    assert report['pivot_table'] > 0
+
+
+def test_benchmark_study_values_rejects_empty_datasets():
+    with pytest.raises(CommandError):
+        call_command('benchmark_study_values', studies=0)
@@ -0,0 +1,92 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from ..cache import get_plot_cache
+from ..index import get_study_index
+from ..management.commands.benchmark_views import get_filter_queries, measure, reset_caches
+from ..models import Study
+
+from .factories import (
+    CountFactory,
+    DomainFactory,
+    FilterFactory,
+    StudyFactory,
+    VariableFactory,
+)
+
+
+@pytest.mark.django_db
+def test_measure_counts_queries():
+    StudyFactory()
+    result, stats = measure(lambda: list(Study.objects.all()))
+    assert len(result) == 1
+    assert stats['queries'] == 1
+    assert stats['wall_time'] >= stats['sql_time'] >= 0
+
+
+@pytest.mark.django_db
+def test_reset_caches_empties_process_caches():
+    StudyFactory()
+    index = get_study_index()
+    get_plot_cache().set('key', None)
+    assert len(get_plot_cache()) == 1
+
+    reset_caches()
+    assert len(get_plot_cache()) == 0
+    assert get_study_index() is not index
+
+
+@pytest.mark.django_db
+def test_get_filter_queries_selects_most_common_choices():
+    domain = DomainFactory(code='DOMAIN')
+    variables = VariableFactory.create_batch(5, domain=domain)
+    for i, variable in enumerate(variables):
+        for _ in range(i):
+            CountFactory(codes=[variable])
+    FilterFactory(domain=domain, study_field=None, widget='checkbox')
+
+    GET = get_filter_queries(1)
+    assert GET.getlist('DOMAIN') == [str(v.id) for v in variables[:1:-1]]
+    assert not get_filter_queries(0)
+
+
+@pytest.mark.django_db
+def test_benchmark_views_writes_report(tmpdir):
+    domain = DomainFactory(code='DOMAIN')
+    variable = VariableFactory(domain=domain)
+    CountFactory(codes=[variable])
+    FilterFactory(domain=domain, study_field=None, widget='checkbox')
+
+    output = str(tmpdir.join('report.json'))
+    call_command('benchmark_views', output=output, repeat=2)
+
+    with open(output) as f:
+        report = json.load(f)
+    views = report['scales']['current']['views']
+    assert 'study-filter-0-filters' in views
+    assert views['study-filter-1-filters']['query'] == 'DOMAIN={0}'.format(variable.id)
+    assert views['study-explorer']['first']['status'] == 200
+    assert set(views['export']['repeated']) == {'wall_time', 'queries', 'sql_time'}
+    assert views['heatmap']['first']['status'] == 200
+
+
+def test_benchmark_views_rejects_unknown_scales():
+    with pytest.raises(CommandError):
+        call_command('benchmark_views', scales='huge')
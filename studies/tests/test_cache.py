@@ -0,0 +1,133 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import mock
+import pytest
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ..cache import (
+    PlotCache,
+    canonicalize_query,
+    get_cache_key,
+    get_filtered_studies,
+    get_filtered_study_ids,
+    get_plot_components,
+    get_selection_key,
+)
+from ..models import Filter, StudyVariable
+
+from .factories import (
+    StudyFactory,
+    StudyFieldFactory,
+    StudyVariableFactory,
+    FilterFactory,
+)
+
+
+def test_canonicalize_query_sorts_and_drops_ignored_params(rf):
+    request = rf.get(reverse('study-filter'),
+                     data={'B': ['2', '1', '2'], 'A': '3', 'page': '2', 'Apply': 'Apply', 'C': ''})
+    assert canonicalize_query(request.GET) == 'A=3&B=1,2'
+
+
+def test_get_cache_key_is_independent_of_param_order(rf):
+    request1 = rf.get(reverse('study-filter') + '?A=1&B=2&B=3&page=4')
+    request2 = rf.get(reverse('study-filter') + '?B=3&B=2&A=1&submit=')
+    assert get_cache_key(request1.GET) == get_cache_key(request2.GET)
+
+
+@pytest.mark.django_db
+def test_get_filtered_study_ids_recomputes_when_data_changes(rf):
+    field = StudyFieldFactory(field_name='STUDY_TYPE')
+    studies = StudyFactory.create_batch(3)
+    variable = StudyVariableFactory(study_field=field, value='A', with_studies=studies[:1])
+    FilterFactory(study_field=field, domain=None, widget='checkbox')
+
+    request = rf.get(reverse('study-filter'), data={'STUDY_TYPE': [variable.id]})
+    assert get_filtered_study_ids(request.GET) == [studies[0].id]
+
+    variable.studies.add(studies[2])
+    assert get_filtered_study_ids(request.GET) == [studies[0].id, studies[2].id]
+    assert list(get_filtered_studies(request.GET).order_by('id')) == [studies[0], studies[2]]
+
+
+@pytest.mark.django_db
+def test_get_filtered_studies_repeated_query_runs_no_filter_sql(rf):
+    field = StudyFieldFactory(field_name='STUDY_TYPE')
+    studies = StudyFactory.create_batch(3)
+    variable = StudyVariableFactory(study_field=field, value='A', with_studies=studies[:2])
+    FilterFactory(study_field=field, domain=None, widget='checkbox')
+
+    request = rf.get(reverse('study-filter'), data={'STUDY_TYPE': [variable.id]})
+    assert list(get_filtered_studies(request.GET).order_by('id')) == studies[:2]
+
+    with CaptureQueriesContext(connection) as queries:
+        assert list(get_filtered_studies(request.GET).order_by('id')) == studies[:2]
+    tables = [Filter._meta.db_table, StudyVariable._meta.db_table]
+    assert not [query for query in queries.captured_queries
+                if any(table in query['sql'] for table in tables)]
+
+
+@pytest.mark.django_db
+def test_get_filtered_studies_without_filters_returns_all_studies(rf):
+    StudyFactory.create_batch(2)
+    request = rf.get(reverse('study-filter'), data={'page': 2})
+    assert get_filtered_studies(request.GET).count() == 2
+
+
+def test_plot_cache_evicts_least_recently_used_entries():
+    size = PlotCache.get_size('a', ('aaaa', None))
+    plot_cache = PlotCache(max_size=2 * size + 1)
+    plot_cache.set('a', ('aaaa', None))
+    plot_cache.set('b', ('bbbb', None))
+    assert plot_cache.get('a') == ('aaaa', None)
+
+    plot_cache.set('c', ('cccc', None))
+    assert plot_cache.get('b', 'missing') == 'missing'
+    assert plot_cache.get('a') == ('aaaa', None)
+    assert plot_cache.size == 2 * size
+
+    plot_cache.set('d', ('d' * 2 * size, None))
+    assert len(plot_cache) == 2
+
+
+def test_plot_cache_evicts_empty_plots():
+    plot_cache = PlotCache(max_size=2 * PlotCache.get_size('a', None))
+    for key in ['a', 'b', 'c']:
+        plot_cache.set(key, None)
+    assert len(plot_cache) == 2
+    assert plot_cache.get('a', 'missing') == 'missing'
+    assert plot_cache.get('c', 'missing') is None
+
+
+def test_get_selection_key_is_independent_of_order():
+    assert get_selection_key([3, 1, 2]) == get_selection_key([1, 2, 3])
+    assert get_selection_key([1, 2]) != get_selection_key([1, 2, 3])
+
+
+@mock.patch('bokeh.embed.components')
+@pytest.mark.django_db
+def test_get_plot_components_renders_once(mock_components):
+    mock_components.return_value = ('script', {'FOO': 'div'})
+    render = mock.Mock(return_value=('plot', 42))
+    empty = mock.Mock(return_value=None)
+
+    for _ in range(2):
+        assert get_plot_components('heatmap', 'FOO', 'key', render) == ('script', 'div', 42)
+        assert get_plot_components('heatmap', 'BAR', 'key', empty) is None
+    assert render.call_count == 1
+    assert empty.call_count == 1
+    mock_components.assert_called_once_with({'FOO': 'plot'})
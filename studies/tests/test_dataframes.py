@@ -19,9 +19,15 @@ import pytest
 from ..dataframes import (
     get_counts_df,
     get_counts_by_domain,
+    query_counts_by_domain,
+    query_domain_totals,
     pivot_counts_df,
     get_variable_counts,
-    get_variable_count_by_variable
+    get_variable_count_by_variable,
+    query_variable_counts,
+    query_variable_count_by_variable,
+    query_all_variable_counts,
+    query_all_variable_count_by_variable,
 )
 from ..models import (
     Study,
@@ -77,6 +83,33 @@ def test_get_counts_df_no_counts_for_studies():
     assert len(df) == 0
 
 
+@pytest.mark.django_db
+def test_get_counts_df_keeps_types_of_columns():
+    var_var = VariableFactory(domain__code="NA", domain__label="001")
+    study = StudyFactory(study_id="0012")
+    CountFactory(codes=[var_var], study=study, count=21, subjects=3)
+    CountFactory(codes=[], study=study, count=5, subjects=1)
+    StudyFactory()
+
+    df = get_counts_df(studies=Study.objects.filter(id=study.id))
+
+    assert len(df) == 2
+    assert df['study_label'].tolist() == ["0012", "0012"]
+    assert df['domain_code'].tolist()[0] == "NA"
+    assert df['domain_label'].tolist()[0] == "001"
+    assert df['count'].tolist() == [21, 5]
+    assert df['codes'].tolist()[0] == var_var.id
+    assert pd.isnull(df['codes'].tolist()[1])
+
+
+@pytest.mark.django_db
+def test_get_counts_df_empty_selection():
+    CountFactory()
+    df = get_counts_df(studies=Study.objects.filter(id__in=[]))
+    assert len(df) == 0
+    assert 'study_label' in df.columns
+
+
 @pytest.fixture
 @pytest.mark.django_db
 def test_df():
@@ -115,6 +148,31 @@ def test_get_counts_by_domain(test_df):
                                         pd.Series(data=["Age", "bar", "foo", "foo"], name='domain_label'))
 
 
+@pytest.mark.django_db
+def test_query_counts_by_domain(test_df):
+    df = query_counts_by_domain(Study.objects.all())
+
+    expected = get_counts_by_domain(test_df)
+    pd.util.testing.assert_frame_equal(df[expected.columns], expected, check_dtype=False)
+
+
+@pytest.mark.django_db
+def test_query_counts_by_domain_no_counts_for_studies(test_df):
+    df = query_counts_by_domain(Study.objects.filter(study_id='UNKNOWN'))
+    assert len(df) == 0
+
+
+@pytest.mark.django_db
+def test_query_domain_totals(test_df):
+    df = query_domain_totals(Study.objects.all())
+
+    counts = query_all_variable_counts(Study.objects.all())
+    by_age = query_all_variable_count_by_variable(Study.objects.all())
+    assert list(df['domain_code']) == sorted(counts)
+    assert list(df['count']) == [counts[code]['count'].sum() for code in df['domain_code']]
+    assert list(df['by_qualifier']) == [code in by_age for code in df['domain_code']]
+
+
 @pytest.mark.django_db
 def test_pivot_counts_df(test_df):
     df = pivot_counts_df(test_df)
@@ -178,3 +236,79 @@ def test_get_variable_count_by_variable_qualifier_domain_not_in_df(pivot_df):
     df = get_variable_count_by_variable(pivot_df, var_lookup, "FOO", qualifier_code="FAKEDOMAIN")
 
     assert df is None
+
+
+@pytest.mark.django_db
+def test_query_variable_counts(pivot_df):
+    variables = Variable.objects.all()
+    var_lookup = groupby('id', variables.values('id', 'label', 'code'))
+    expected = get_variable_counts(pivot_df, var_lookup, "FOO")
+
+    df = query_variable_counts(Study.objects.all(), "FOO")
+
+    assert set(df.columns) == set(expected.columns)
+    assert (sorted(zip(df['study'], df['FOO'], df['count'], df['var_label'])) ==
+            sorted(zip(expected['study'], expected['FOO'], expected['count'],
+                       expected['var_label'])))
+
+
+@pytest.mark.django_db
+def test_query_variable_counts_domain_without_counts(test_df):
+    assert query_variable_counts(Study.objects.all(), "FAKEDOMAIN") is None
+    assert query_variable_counts(Study.objects.none(), "FOO") is None
+
+
+@pytest.mark.django_db
+def test_query_variable_count_by_variable(pivot_df):
+    variables = Variable.objects.all()
+    var_lookup = groupby('id', variables.values('id', 'label', 'code'))
+    expected = get_variable_count_by_variable(pivot_df, var_lookup, "FOO", qualifier_code="AGECAT")
+
+    df = query_variable_count_by_variable(Study.objects.all(), "FOO", qualifier_code="AGECAT")
+
+    assert set(df.columns) == set(expected.columns)
+    assert df['count'].tolist() == expected['count'].tolist()
+    assert df['var_label'].tolist() == ["var"]
+    assert df['qual_label'].tolist() == ["age"]
+
+
+@pytest.mark.django_db
+def test_query_variable_count_by_variable_qualifier_domain_without_counts(test_df):
+    df = query_variable_count_by_variable(Study.objects.all(), "FOO", qualifier_code="FAKEDOMAIN")
+    assert df is None
+
+
+@pytest.mark.django_db
+def test_query_all_variable_counts_splits_by_domain(test_df):
+    studies = Study.objects.all()
+
+    counts = query_all_variable_counts(studies)
+    counts_by_age = query_all_variable_count_by_variable(studies)
+
+    assert set(counts) == set(['AGECAT', 'BAR', 'FOO'])
+    for code, df in counts.items():
+        pd.util.testing.assert_frame_equal(df, query_variable_counts(studies, code))
+    assert set(counts_by_age) == set(['BAR', 'FOO'])
+    for code, df in counts_by_age.items():
+        pd.util.testing.assert_frame_equal(df, query_variable_count_by_variable(studies, code))
+
+
+@pytest.mark.django_db
+def test_get_counts_df_compact_dtypes(test_df):
+    studies = Study.objects.all()
+    df = get_counts_df(studies, compact=True)
+
+    assert str(df['study_label'].dtype) == 'category'
+    assert str(df['domain_label'].dtype) == 'category'
+    assert df['id'].dtype == 'int32'
+    assert df['codes'].dtype == 'int32'
+    assert df.memory_usage(deep=True).sum() < test_df.memory_usage(deep=True).sum()
+
+    compact = get_counts_by_domain(df)
+    default = get_counts_by_domain(test_df)
+    assert compact['count'].tolist() == default['count'].tolist()
+    assert compact['domain_label'].tolist() == default['domain_label'].tolist()
+
+    counts = query_all_variable_counts(studies, compact=True)
+    assert str(counts['FOO']['var_label'].dtype) == 'category'
+    assert counts['FOO']['count'].tolist() == query_variable_counts(studies, 'FOO')['count'].tolist()
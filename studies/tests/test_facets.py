@@ -0,0 +1,77 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from django.core.urlresolvers import reverse
+
+from ..facets import FacetCounts
+from ..index import StudyIndex
+from ..models import Filter
+
+from .factories import (
+    CountFactory,
+    DomainFactory,
+    FilterFactory,
+    StudyFactory,
+    StudyFieldFactory,
+    StudyVariableFactory,
+    VariableFactory,
+)
+
+
+@pytest.fixture
+def facet_data():
+    domain = DomainFactory(code="DOMAIN")
+    variables = [VariableFactory(domain=domain, code=code) for code in ['FOO', 'BAR']]
+    studies = StudyFactory.create_batch(4)
+    CountFactory(study=studies[0], codes=[variables[0]])
+    CountFactory(study=studies[1], codes=[variables[0], variables[1]])
+    CountFactory(study=studies[2], codes=[variables[1]])
+    CountFactory(study=studies[3], codes=[variables[1]])
+
+    field = StudyFieldFactory(field_name='STUDY_TYPE')
+    study_vars = [StudyVariableFactory(study_field=field, value='A', with_studies=studies[:2]),
+                  StudyVariableFactory(study_field=field, value='B', with_studies=studies[2:])]
+
+    FilterFactory(domain=domain, study_field=None, widget='checkbox')
+    FilterFactory(study_field=field, domain=None, widget='checkbox')
+    return variables, study_vars
+
+
+@pytest.mark.django_db
+def test_facet_counts_without_active_filters(rf, facet_data):
+    variables, study_vars = facet_data
+    request = rf.get(reverse('study-filter'))
+    facets = FacetCounts(StudyIndex(), request.GET, Filter.objects.all())
+
+    domain_filter = Filter.objects.get(domain__code='DOMAIN')
+    study_filter = Filter.objects.get(study_field='STUDY_TYPE')
+    assert facets.get_counts(domain_filter, [v.id for v in variables]) == [2, 3]
+    assert facets.get_counts(study_filter, [v.id for v in study_vars]) == [2, 2]
+
+
+@pytest.mark.django_db
+def test_facet_counts_leave_own_filter_out(rf, facet_data):
+    variables, study_vars = facet_data
+    get_params = {'DOMAIN': [variables[0].id], 'STUDY_TYPE': [study_vars[1].id]}
+    request = rf.get(reverse('study-filter'), data=get_params)
+    facets = FacetCounts(StudyIndex(), request.GET, Filter.objects.all())
+
+    domain_filter = Filter.objects.get(domain__code='DOMAIN')
+    study_filter = Filter.objects.get(study_field='STUDY_TYPE')
+    # Domain counts over studies of type B, study type counts over studies with FOO
+    assert facets.get_counts(domain_filter, [v.id for v in variables]) == [0, 2]
+    assert facets.get_counts(study_filter, [v.id for v in study_vars]) == [2, 0]
+    # Unknown ids have no studies
+    assert facets.get_counts(study_filter, [-1]) == [0]
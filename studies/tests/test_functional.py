@@ -294,6 +294,9 @@ def test_explorer_page_contains_summary_and_variable_plot(live_server, selenium,
     hide_cookie_banner()
 
     WebDriverWait(selenium, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "tabs")))
+    # The heatmaps of the open panels are fetched after the page loads
+    WebDriverWait(selenium, 10).until(
+        lambda driver: "Number of observations by variable" in driver.page_source)
 
     assert "Number of observations by domain" in selenium.page_source
     assert "Number of observations by variable" in selenium.page_source
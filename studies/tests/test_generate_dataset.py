@@ -0,0 +1,58 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from ..management.commands.generate_dataset import generate_counts
+from ..models import Count, Domain, Filter, Study, StudyVariable, Variable, VariablePresence
+
+from .factories import StudyFactory
+
+
+def test_generate_counts_drops_duplicate_combinations():
+    variable_ids = np.arange(6).reshape(2, 3)
+    df = generate_counts([10, 11], variable_ids, [100, 101], 500, np.random.RandomState(0))
+    assert not df.duplicated(['study', 'variable', 'qualifier']).any()
+    assert set(df['study']) <= {10, 11}
+    assert set(df['variable']) <= set(range(6))
+    assert (df['subjects'] <= df['count']).all()
+    assert (df['subjects'] > 0).all()
+
+
+@pytest.mark.django_db
+def test_generate_dataset_replaces_data():
+    StudyFactory()
+    call_command('generate_dataset', studies=5, domains=2, variables=3,
+                 age_categories=2, counts=100)
+
+    assert Study.objects.count() == 5
+    assert Domain.objects.count() == 3
+    assert Variable.objects.count() == 2 * 3 + 2
+    assert Filter.objects.count() == 4 + 2 + 1
+    assert Count.objects.count() > 0
+    assert Count.codes.through.objects.count() == 2 * Count.objects.count()
+    for count in Count.objects.all()[:10]:
+        assert count.source_domain in {code.domain for code in count.codes.all()}
+        assert not count.source_domain.is_qualifier
+    assert StudyVariable.studies.through.objects.count() == 4 * 5
+    assert VariablePresence.objects.exists()
+
+
+@pytest.mark.django_db
+def test_generate_dataset_rejects_empty_dimensions():
+    with pytest.raises(CommandError):
+        call_command('generate_dataset', studies=0)
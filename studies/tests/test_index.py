@@ -0,0 +1,104 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+from django.core.urlresolvers import reverse
+
+from ..index import StudyIndex, get_study_index, get_rows, pack_rows
+from ..models import DataVersion, Filter, Study
+
+from .factories import (
+    CountFactory,
+    DomainFactory,
+    FilterFactory,
+    StudyFactory,
+    StudyFieldFactory,
+    StudyVariableFactory,
+    VariableFactory,
+)
+
+
+def test_get_rows_ignores_missing_ids():
+    sorted_ids = np.array([2, 5, 9])
+    assert get_rows(sorted_ids, [9, 3, 2, 10]).tolist() == [2, 0]
+
+
+def test_pack_rows_sets_bits():
+    packed = pack_rows([0, 0, 1], [0, 9, 3], 2, 10)
+    assert packed.shape == (2, 2)
+    assert np.unpackbits(packed[0])[:10].tolist() == [1, 0, 0, 0, 0, 0, 0, 0, 0, 1]
+    assert np.unpackbits(packed[1])[:10].tolist() == [0, 0, 0, 1, 0, 0, 0, 0, 0, 0]
+
+
+@pytest.mark.django_db
+def test_study_index_filter_studies_matches_filter_queryset(rf):
+    domain = DomainFactory(code="DOMAIN")
+    variable1 = VariableFactory(domain=domain, code='FOO')
+    variable2 = VariableFactory(domain=domain, code='BAR')
+    studies = StudyFactory.create_batch(4)
+    CountFactory(study=studies[0], codes=[variable1])
+    CountFactory(study=studies[1], codes=[variable1, variable2])
+    CountFactory(study=studies[2], codes=[variable2])
+
+    field = StudyFieldFactory(field_name='STUDY_TYPE')
+    study_var = StudyVariableFactory(study_field=field, value='A', with_studies=studies[1:])
+
+    FilterFactory(domain=domain, study_field=None, widget='checkbox')
+    FilterFactory(study_field=field, domain=None, widget='checkbox')
+
+    get_params = {'DOMAIN': [variable1.id], 'STUDY_TYPE': [study_var.id]}
+    request = rf.get(reverse('study-filter'), data=get_params)
+
+    index = StudyIndex()
+    for filt in Filter.objects.all():
+        expected = filt.filter_queryset(Study.objects.all(), request.GET)
+        bitset = index.filter_bitset(filt, request.GET)
+        assert sorted(index.get_study_ids(bitset)) == sorted(s.id for s in expected)
+
+    bitset = index.filter_studies(Filter.objects.all(), request.GET)
+    assert index.get_study_ids(bitset) == [studies[1].id]
+
+
+@pytest.mark.django_db
+def test_get_study_index_rebuilds_when_data_changes():
+    StudyFactory()
+    index = get_study_index()
+    assert get_study_index() is index
+    assert len(index) == 1
+
+    StudyFactory()
+    assert index.version != DataVersion.current()
+    assert len(get_study_index()) == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('selected', [[], [0], [0, 2, 3], [0, 1, 2, 3]])
+def test_study_index_get_queryset_selects_bitset_studies(selected):
+    studies = StudyFactory.create_batch(4)
+    index = StudyIndex()
+    bitset = pack_rows(np.zeros(len(selected)), selected, 1, len(studies))[0]
+
+    queryset = index.get_queryset(bitset)
+    assert sorted(queryset.values_list('id', flat=True)) == [studies[i].id for i in selected]
+
+
+@pytest.mark.django_db
+def test_study_index_get_bitset_ignores_unknown_ids():
+    studies = StudyFactory.create_batch(3)
+    index = StudyIndex()
+
+    bitset = index.get_bitset([studies[2].id, studies[0].id, -1])
+    assert index.get_study_ids(bitset) == [studies[0].id, studies[2].id]
+    assert index.count(index.get_bitset([])) == 0
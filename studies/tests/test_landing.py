@@ -0,0 +1,80 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from django.core.urlresolvers import reverse
+
+from ..landing import LANDING_KEY, get_landing_state, is_landing_query, store_landing_state
+from ..models import DataVersion, Precomputed
+
+from .factories import (
+    DomainFactory,
+    FilterFactory,
+    StudyFactory,
+    StudyFieldFactory,
+    StudyVariableFactory,
+    VariableFactory,
+)
+
+
+def test_is_landing_query(rf):
+    assert is_landing_query(rf.get(reverse('study-filter')).GET)
+    assert is_landing_query(rf.get(reverse('study-filter'), data={'page': 2}).GET)
+    assert not is_landing_query(rf.get(reverse('study-filter'), data={'FOO': 1}).GET)
+
+
+@pytest.mark.django_db
+def test_precomputed_load_returns_none_once_data_version_changes():
+    Precomputed.store('foo', {'bar': 1})
+    assert Precomputed.load('foo') == {'bar': 1}
+
+    DataVersion.bump()
+    assert Precomputed.load('foo') is None
+
+
+@pytest.mark.django_db
+def test_landing_state_contains_filter_options_and_context():
+    studies = StudyFactory.create_batch(2)
+    field = StudyFieldFactory(field_name='STUDY_TYPE', lil_order=0, label='TYPE')
+    var = StudyVariableFactory(study_field=field, value='A', with_studies=studies[:1])
+    domain = DomainFactory(code='DOMAIN')
+    VariableFactory(domain=domain, code='0', label='FOO', category='BAR')
+    FilterFactory(study_field=field, domain=None, widget='checkbox')
+    FilterFactory(domain=domain, study_field=None, widget='checkbox')
+
+    state = store_landing_state()
+
+    options = state['filter_options']
+    assert options['STUDY_TYPE']['choices'] == [(var.id, 'A', 'A')]
+    assert options['STUDY_TYPE']['counts'] == [1]
+    assert options['DOMAIN']['counts'] == [0]
+    assert options['DOMAIN']['categories'] == ['BAR']
+    assert state['context']['n_total'] == 2
+    assert state['context']['filtered_studies'] == sorted(s.study_id for s in studies)
+    assert state['context']['field_names'] == ['TYPE']
+    assert get_landing_state() == state
+
+
+@pytest.mark.django_db
+def test_study_filter_view_serves_stored_landing_state(client):
+    StudyFactory.create_batch(2)
+    state = get_landing_state()
+    state['context']['n_total'] = 42
+    Precomputed.store(LANDING_KEY, state)
+
+    response = client.get(reverse('study-filter'))
+    assert response.context['n_total'] == 42
+
+    response = client.get(reverse('study-filter'), {'page': 1})
+    assert response.context['n_total'] == 42
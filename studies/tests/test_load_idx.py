@@ -24,11 +24,14 @@ from ..management.commands.load_idx import (
     get_qualifiers, get_study,
     get_valid_qualifiers, get_domain_variable
 )
-from ..models import Study, Variable, Count
+from ..models import Study, Variable, Count, DomainCount, VariablePresence
 
 from .factories import (
     SampleDomainFactory as DomainFactory,
+    AgeDomainFactory,
+    CountFactory,
     StudyFactory,
+    VariableFactory,
 )
 
 
@@ -348,6 +351,45 @@ def test_load_idx_command_qualifiers(command_kwargs):
     assert Count.objects.count() == 18
 
 
+@pytest.mark.django_db()
+def test_load_idx_command_replace_keeps_other_domains(command_kwargs):
+    """Test load_idx --replace only replaces the counts of the loaded domain"""
+    domain = DomainFactory()
+    other = VariableFactory(domain__code='OTHER')
+    study = StudyFactory(study_id='CPP')
+    CountFactory(study=study, codes=[other], count=7)
+    file_path = os.path.dirname(os.path.abspath(__file__))
+    sample_csv = os.path.join(file_path, 'IDX_SAMPLE.csv')
+    for _ in range(2):
+        call_command('load_idx', sample_csv, replace=True, **command_kwargs)
+
+    assert Study.objects.count() == 1
+    assert Variable.objects.filter(domain=domain).count() == 18
+    assert Count.objects.count() == 19
+    assert VariablePresence.objects.filter(study=study).count() == 19
+    assert set(DomainCount.objects.filter(study=study).values_list('domain', 'count')) == {
+        (domain.id, 101161), (other.domain_id, 7)}
+    study.refresh_from_db()
+    assert len(study.variable_ids) == 19
+
+
+@pytest.mark.django_db()
+def test_load_idx_command_replace_counts_without_domain_code(command_kwargs, tmpdir):
+    """Test load_idx --replace replaces counts of rows with an empty domain code"""
+    domain = DomainFactory()
+    AgeDomainFactory()
+    sample_csv = tmpdir.join('IDX_SAMPLE.csv')
+    sample_csv.write('STUDYID,SAMPLETESTCD,SAMPLETEST,AGECATN,AGECAT,COUNT_OBS,COUNT_SUBJ\n'
+                     'CPP,A,Test A,0,0 Months,10,5\n'
+                     'CPP,,,1,1 Month,20,8\n')
+    for _ in range(2):
+        call_command('load_idx', str(sample_csv), replace=True, **command_kwargs)
+
+    assert Count.objects.count() == 2
+    assert Count.objects.filter(source_domain=domain).count() == 2
+    assert Count.objects.exclude(codes__domain=domain).count() == 1
+
+
 @pytest.mark.django_db()
 def test_load_idx_nonexistent_file():
     """Test load_idx command fails as expected on non-existent file."""
@@ -12,16 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from unittest import mock
+
 import pytest
 from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.db.models import Q
 from django.db.utils import IntegrityError
 from django.forms import ValidationError
 
 from ..models import (
+    FILTER_METHODS,
     StudyField,
     Study,
     StudyVariable,
     Filter,
+    VariablePresence,
+    DomainCount,
+    VariableCount,
+    QualifierCount,
+    DataVersion,
+    rebuild_rollups,
 )
 
 from .factories import (
@@ -31,7 +43,8 @@ from .factories import (
     SampleVariableFactory as VariableFactory,
     CountFactory,
     DomainFactory,
-    FilterFactory
+    FilterFactory,
+    AgeVariableFactory,
 )
 
 
@@ -239,6 +252,19 @@ def test_study_variable_split_list_does_not_split_when_missing_delimiter():
     assert StudyVariable.objects.all().count() == 1
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize("value, numeric_value", [
+    ('1991', 1991.0),
+    ('3.5', 3.5),
+    ('NaN', None),
+    ('inf', None),
+    ('A', None),
+    ])
+def test_study_variable_save_sets_numeric_value(value, numeric_value):
+    var = StudyVariableFactory(value=value)
+    assert StudyVariable.objects.get(pk=var.pk).numeric_value == numeric_value
+
+
 @pytest.mark.django_db
 def test_study_variable_split_list_sets_all_studies():
     field = StudyFieldFactory(field_name='country', field_type='list')
@@ -862,6 +888,41 @@ def test_filter_double_slider_is_full_range(rf, to_value, result):
     assert filt.is_full_range('1991.0', to_value) is result
 
 
+@pytest.mark.django_db
+def test_filter_get_range_of_study_field_uses_numeric_values():
+    field = StudyFieldFactory(field_name='DISTANCE')
+
+    # Lexicographic order of the values differs from numeric order
+    StudyVariableFactory(study_field=field, value='10.5')
+    StudyVariableFactory(study_field=field, value='9')
+    StudyVariableFactory(study_field=field, value='NaN')
+
+    filt = FilterFactory(study_field=field, domain=None, widget='double slider')
+
+    assert filt.get_range() == (9.0, 10.5)
+    assert filt.is_full_range('9', '10.5') is True
+    assert filt.is_full_range('9', '10') is False
+
+
+@pytest.mark.django_db
+def test_filter_double_slider_filters_on_numeric_range(rf):
+    field = StudyFieldFactory(field_name='DISTANCE')
+    studies = StudyFactory.create_batch(3)
+
+    StudyVariableFactory(study_field=field, value='9', with_studies=studies[:1])
+    StudyVariableFactory(study_field=field, value='10.5', with_studies=studies[1:2])
+    StudyVariableFactory(study_field=field, value='100', with_studies=studies[2:])
+
+    filt = FilterFactory(study_field=field, domain=None, widget='double slider')
+
+    request = rf.get(reverse('study-filter'), data={'DISTANCE': '9;50'})
+
+    assert filt.get_selections(request.GET) == ['10.5', '9']
+    for method in FILTER_METHODS:
+        filtered = Study.filter_studies(Filter.objects.all(), request.GET, method=method)
+        assert list(filtered.order_by('id')) == studies[:2]
+
+
 @pytest.mark.django_db
 @pytest.mark.parametrize("to_value, result", [
     ('D', True),
@@ -1208,3 +1269,252 @@ def test_study_filter_studies_returns_all_studies_when_no_filters_given(rf):
 
     filtered_studies = Study.filter_studies(empty_queryset, request.GET)
     assert list(filtered_studies) == list(Study.objects.all())
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("get_params", [
+    {'STUDY_TYPE': [0, 1]},
+    {'DOMAIN': ['1;2']},
+    {'STUDY_TYPE': [0, 1], 'DOMAIN': ['1;2']},
+    {'STUDY_TYPE': [2, 3], 'DOMAIN': ['0;1'], 'BAR': [0]},
+    {'STUDY_TYPE': [3], 'BAR': [0, 1]},
+    ])
+def test_study_filter_studies_methods_return_identical_studies(rf, get_params):
+    domain = DomainFactory(code="DOMAIN", is_qualifier=True)
+    bar_domain = DomainFactory(code="BAR")
+    studies = StudyFactory.create_batch(5)
+    labels = ["A", "B", "C", "D"]
+    bar_vars = [VariableFactory(domain=bar_domain, code='X'),
+                VariableFactory(domain=bar_domain, code='Y')]
+
+    for i, (label, study) in enumerate(zip(labels, studies)):
+        var = VariableFactory(domain=domain, code=str(i), label=label)
+        CountFactory(codes=[var, bar_vars[i % 2]], study=study)
+
+    field = StudyFieldFactory(field_name='STUDY_TYPE')
+    study_vars = []
+    for value, study in zip(["ala", "sbd", "zzz", "bet"], studies[1:]):
+        study_vars.append(StudyVariableFactory(study_field=field, value=value, with_studies=[study]))
+
+    FilterFactory(domain=domain, study_field=None, widget='double slider')
+    FilterFactory(domain=bar_domain, study_field=None, widget='checkbox')
+    FilterFactory(study_field=field, domain=None, widget='checkbox')
+
+    # Replace positional placeholders with the ids of the created objects
+    if 'STUDY_TYPE' in get_params:
+        get_params['STUDY_TYPE'] = [study_vars[i].id for i in get_params['STUDY_TYPE']]
+    if 'BAR' in get_params:
+        get_params['BAR'] = [bar_vars[i].id for i in get_params['BAR']]
+    request = rf.get(reverse('study-filter'), data=get_params)
+    filters = Filter.objects.filter(Q(study_field__in=get_params.keys()) |
+                                    Q(domain__code__in=get_params.keys()))
+
+    results = [set(Study.filter_studies(filters, request.GET, method=method))
+               for method in FILTER_METHODS]
+    assert all(result == results[0] for result in results)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_variable_presence_follows_count_codes():
+    domain = DomainFactory(code="DOMAIN")
+    variable1 = VariableFactory(domain=domain, code='FOO')
+    variable2 = VariableFactory(domain=domain, code='BAR')
+    study = StudyFactory()
+    CountFactory(study=study, codes=[variable1])
+    count = CountFactory(study=study, codes=[variable1, variable2])
+
+    presence = VariablePresence.objects.filter(study=study)
+    assert sorted(presence.values_list('variable', flat=True)) == sorted([variable1.id, variable2.id])
+    assert set(presence.values_list('domain', flat=True)) == {domain.id}
+
+    count.delete()
+    assert list(presence.values_list('variable', flat=True)) == [variable1.id]
+
+
+@pytest.mark.django_db
+def test_variable_presence_rebuild_matches_counts():
+    variables = VariableFactory.create_batch(3)
+    studies = StudyFactory.create_batch(2)
+    CountFactory(study=studies[0], codes=variables[:2])
+    CountFactory(study=studies[1], codes=variables[1:])
+    expected = set(VariablePresence.objects.values_list('study', 'variable'))
+
+    VariablePresence.objects.all().delete()
+    VariablePresence.rebuild(study_ids=[studies[0].id])
+    assert set(VariablePresence.objects.values_list('study', 'variable')) == {
+        (studies[0].id, variables[0].id), (studies[0].id, variables[1].id)}
+
+    VariablePresence.rebuild()
+    assert set(VariablePresence.objects.values_list('study', 'variable')) == expected
+    assert len(expected) == 4
+
+
+@pytest.mark.django_db
+def test_study_memberships_follow_counts_and_study_variables():
+    variables = VariableFactory.create_batch(2)
+    study = StudyFactory()
+    count = CountFactory(study=study, codes=variables)
+    study_var = StudyVariableFactory(with_studies=[study])
+
+    study.refresh_from_db()
+    assert sorted(study.variable_ids) == sorted(v.id for v in variables)
+    assert study.study_variable_ids == [study_var.id]
+
+    count.codes.remove(variables[0])
+    study_var.delete()
+    study.refresh_from_db()
+    assert study.variable_ids == [variables[1].id]
+    assert study.study_variable_ids == []
+
+
+@pytest.mark.django_db
+def test_study_refresh_memberships_rebuilds_arrays():
+    variable = VariableFactory()
+    studies = StudyFactory.create_batch(2)
+    CountFactory(study=studies[0], codes=[variable])
+    Study.objects.update(variable_ids=[])
+
+    Study.refresh_memberships(study_ids=[studies[1].id])
+    assert list(Study.objects.order_by('id').values_list('variable_ids', flat=True)) == [[], []]
+
+    Study.refresh_memberships()
+    assert list(Study.objects.order_by('id').values_list('variable_ids', flat=True)) == [
+        [variable.id], []]
+
+
+@pytest.mark.django_db
+def test_study_metadata_follows_study_variables_and_fields():
+    field = StudyFieldFactory(field_name='START_YEAR', field_type='str')
+    study = StudyFactory()
+    study_var = StudyVariableFactory(study_field=field, with_studies=[study], value='1997.0')
+
+    study.refresh_from_db()
+    assert study.metadata == {'START_YEAR': '1997.0'}
+
+    field.field_type = 'int'
+    field.save()
+    study.refresh_from_db()
+    assert study.metadata == {'START_YEAR': 1997}
+
+    study_var.delete()
+    study.refresh_from_db()
+    assert study.metadata == {}
+
+
+@pytest.mark.django_db
+def test_study_refresh_metadata_rebuilds_documents():
+    field = StudyFieldFactory(field_name='WEIGHT', field_type='float')
+    studies = StudyFactory.create_batch(2)
+    StudyVariableFactory(study_field=field, with_studies=studies, value='2.5')
+    Study.objects.update(metadata={})
+
+    Study.refresh_metadata(study_ids=[studies[1].id])
+    assert list(Study.objects.order_by('id').values_list('metadata', flat=True)) == [
+        {}, {'WEIGHT': 2.5}]
+
+    Study.refresh_metadata()
+    assert list(Study.objects.order_by('id').values_list('metadata', flat=True)) == [
+        {'WEIGHT': 2.5}, {'WEIGHT': 2.5}]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_count_rollups_follow_counts():
+    variable = VariableFactory(domain__code="DOMAIN")
+    ages = AgeVariableFactory.create_batch(2)
+    study = StudyFactory()
+    CountFactory(study=study, codes=[variable, ages[0]], count=10, subjects=4)
+    count = CountFactory(study=study, codes=[variable, ages[1]], count=20, subjects=3)
+
+    assert list(DomainCount.objects.filter(domain=variable.domain)
+                                   .values_list('study', 'count', 'subjects')) == [
+        (study.id, 20, 4)]
+    assert list(VariableCount.objects.filter(variable=variable)
+                                     .values_list('count', 'subjects', 'count_id')) == [
+        (20, 4, count.id)]
+    assert sorted(QualifierCount.objects.filter(variable=variable)
+                                        .values_list('qualifier', 'count')) == [
+        (ages[0].id, 10), (ages[1].id, 20)]
+
+    count.count = 5
+    count.save()
+    assert VariableCount.objects.get(variable=variable).count == 10
+
+    count.delete()
+    assert list(QualifierCount.objects.filter(variable=variable)
+                                      .values_list('qualifier', flat=True)) == [ages[0].id]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_deleting_a_study_rebuilds_its_variables_once_on_commit():
+    variable = VariableFactory()
+    study = StudyFactory()
+    CountFactory.create_batch(3, study=study, codes=[variable])
+    study_id = study.id
+
+    with mock.patch('studies.signals.rebuild_study_variables') as rebuild, \
+            mock.patch.object(DataVersion, 'bump') as bump:
+        with transaction.atomic():
+            study.delete()
+            assert not rebuild.called
+            assert not bump.called
+    rebuild.assert_called_once_with([study_id])
+    assert bump.call_count == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rolled_back_changes_are_not_rebuilt():
+    variable = VariableFactory()
+    studies = StudyFactory.create_batch(2)
+    counts = [CountFactory(study=study, codes=[variable]) for study in studies]
+
+    with mock.patch('studies.signals.rebuild_study_variables') as rebuild:
+        with pytest.raises(IntegrityError):
+            with transaction.atomic():
+                counts[0].delete()
+                raise IntegrityError
+        assert not rebuild.called
+
+        with transaction.atomic():
+            counts[1].delete()
+    rebuild.assert_called_once_with([studies[1].id])
+
+
+def test_derived_tables_have_no_delete_receivers():
+    # Receivers would disable the fast deletes of their rebuilds
+    for model in (VariablePresence, DomainCount, VariableCount, QualifierCount):
+        assert not post_delete.has_listeners(model)
+        assert not post_save.has_listeners(model)
+
+
+@pytest.mark.django_db
+def test_rebuild_rollups_of_studies():
+    variable = VariableFactory()
+    studies = StudyFactory.create_batch(2)
+    for study in studies:
+        CountFactory(study=study, codes=[variable])
+    DomainCount.objects.all().delete()
+    VariableCount.objects.all().delete()
+
+    rebuild_rollups(study_ids=[studies[1].id])
+    assert list(DomainCount.objects.values_list('study', flat=True)) == [studies[1].id]
+    assert list(VariableCount.objects.values_list('study', flat=True)) == [studies[1].id]
+
+    rebuild_rollups()
+    assert sorted(DomainCount.objects.values_list('study', flat=True)) == [
+        study.id for study in studies]
+
+
+@pytest.mark.django_db
+def test_rebuild_rollups_of_domains():
+    variables = [VariableFactory(domain=DomainFactory()) for _ in range(2)]
+    study = StudyFactory()
+    CountFactory(study=study, codes=[variables[0]])
+    CountFactory(study=study, codes=[variables[1]])
+    VariablePresence.objects.all().delete()
+    VariableCount.objects.all().delete()
+
+    VariablePresence.rebuild(domain_ids=[variables[1].domain_id])
+    rebuild_rollups(study_ids=[study.id], domain_ids=[variables[1].domain_id])
+    assert list(VariablePresence.objects.values_list('variable', flat=True)) == [variables[1].id]
+    assert list(VariableCount.objects.values_list('variable', flat=True)) == [variables[1].id]
+    assert DomainCount.objects.count() == 2
@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
+
+import numpy as np
 from toolz.itertoolz import groupby
 import pytest
 
@@ -20,10 +23,14 @@ from ..dataframes import (
     get_counts_by_domain,
     pivot_counts_df,
     get_variable_counts,
-    get_variable_count_by_variable
+    get_variable_count_by_variable,
+    query_all_variable_counts,
+    query_counts_by_domain,
+    query_variable_counts,
+    query_variable_count_by_variable,
 )
 
-from ..plots import get_summary_heatmap, get_heatmap, get_age_heatmap
+from ..plots import get_summary_heatmap, get_heatmap, get_age_heatmap, get_domains_heatmap
 from ..plot_utils import add_categorical_offsets
 
 from ..models import (
@@ -160,3 +167,106 @@ def test_by_var_and_ageheatmap_add_categorical_offsets(plot_data):
                                                      'age_2:0.4', 'age_2:0.4',
                                                      'age_3:0.4', 'age_3:0.4',
                                                      'age_4:0.4', 'age_4:0.4']
+
+
+@pytest.mark.django_db
+def test_domains_heatmap_shows_first_domain_and_selects_domains(plot_data):
+    domain_dfs = query_all_variable_counts(Study.objects.all())
+    domain_labels = OrderedDict([('AGECAT', 'Age'), ('QUAL', 'qual'), ('MISSING', 'missing')])
+
+    study_ids = Study.objects.all().values_list('study_id', flat=True)
+    layout = get_domains_heatmap(domain_dfs, domain_labels, study_ids)
+    select = layout.children[0].children[0]
+    plot = layout.children[1].children[1]
+    assert select.value == 'AGECAT'
+    assert select.options == [('AGECAT', 'Age'), ('QUAL', 'qual')]
+    assert plot.x_range.factors == ['study_1', 'study_2', 'study_3']
+    assert plot.y_range.factors == ['age_3', 'age_4', 'age_2', 'age_1']
+
+
+@pytest.mark.django_db
+def test_domains_heatmap_is_sized_for_the_domain_with_most_variables(plot_data):
+    domain_dfs = query_all_variable_counts(Study.objects.all())
+    domain_labels = OrderedDict([('QUAL', 'qual'), ('AGECAT', 'Age')])
+
+    study_ids = Study.objects.all().values_list('study_id', flat=True)
+    plot = get_domains_heatmap(domain_dfs, domain_labels, study_ids).children[1].children[1]
+    assert plot.y_range.factors == ['qual_var_1', 'qual_var_2']
+    assert plot.plot_height == 4 * 25 + 200
+
+
+@pytest.mark.django_db
+def test_heatmaps_of_compact_dataframes(plot_data, settings):
+    settings.COMPACT_DATAFRAMES = True
+    studies = Study.objects.all()
+    study_ids = studies.values_list('study_id', flat=True)
+
+    summary_df = query_counts_by_domain(studies)
+    assert str(summary_df['domain_label'].dtype) == 'category'
+    plot = get_summary_heatmap(summary_df, study_ids).children[1]
+    assert plot.y_range.factors == ['Age', 'piano', 'qual', 'violin']
+
+    domain_dfs = query_all_variable_counts(studies)
+    assert str(domain_dfs['AGECAT']['var_label'].dtype) == 'category'
+    plot = get_heatmap(domain_dfs['AGECAT'], study_ids).children[1]
+    assert plot.y_range.factors == ['age_3', 'age_4', 'age_2', 'age_1']
+
+    plot = get_age_heatmap(query_variable_count_by_variable(studies, 'QUAL')).children[1]
+    assert plot.y_range.factors == ['qual_var_1', 'qual_var_2']
+
+    domain_labels = OrderedDict([('AGECAT', 'Age'), ('QUAL', 'qual')])
+    plot = get_domains_heatmap(domain_dfs, domain_labels, study_ids).children[1].children[1]
+    assert plot.y_range.factors == ['age_3', 'age_4', 'age_2', 'age_1']
+
+
+@pytest.mark.django_db
+def test_by_var_heatmap_above_image_cells_draws_a_count_matrix(plot_data, settings):
+    from bokeh.models import Circle, Image
+    settings.HEATMAP_IMAGE_CELLS = 4
+    pivot_df = pivot_counts_df(plot_data)
+    variables = Variable.objects.all()
+    var_lookup = groupby('id', variables.values('id', 'label', 'code'))
+    domain_heatmap_df = get_variable_counts(pivot_df, var_lookup, 'QUAL')
+
+    study_ids = Study.objects.all().values_list('study_id', flat=True)
+    column = get_heatmap(domain_heatmap_df, study_ids)
+    plot = column.children[1]
+    assert plot.y_range.factors == ['qual_var_1', 'qual_var_2']
+    assert not [r for r in plot.references() if isinstance(r, Circle)]
+    image = [r for r in plot.references() if isinstance(r, Image)]
+    assert len(image) == 1
+    assert (image[0].dw, image[0].dh) == (3, 2)
+
+    source = [r for r in plot.renderers if getattr(r, 'glyph', None) is image[0]][0].data_source
+    # get_variable_counts keeps the largest count of every study and variable
+    expected = [[13, 23, np.nan],
+                [14, 24, np.nan]]
+    np.testing.assert_array_equal(source.data['count'][0], expected)
+    np.testing.assert_array_equal(source.data['image'][0], expected)
+
+
+@pytest.mark.django_db
+def test_image_heatmap_hovers_a_quad_spanning_the_image(plot_data, settings):
+    from bokeh.models import HoverTool, Quad
+    settings.HEATMAP_IMAGE_CELLS = 4
+    domain_heatmap_df = query_variable_counts(Study.objects.all(), 'QUAL')
+
+    study_ids = Study.objects.all().values_list('study_id', flat=True)
+    plot = get_heatmap(domain_heatmap_df, study_ids).children[1]
+    hover = plot.select_one(HoverTool)
+    quad = hover.renderers[0].glyph
+    assert isinstance(quad, Quad)
+    assert (quad.left, quad.right, quad.bottom, quad.top) == (0.5, 3.5, 0.5, 2.5)
+    assert quad.fill_alpha == 0
+
+
+@pytest.mark.django_db
+def test_summary_heatmap_below_image_cells_draws_glyphs(plot_data, settings):
+    from bokeh.models import Circle, Image
+    settings.HEATMAP_IMAGE_CELLS = 12
+    summary_heatmap_df = get_counts_by_domain(plot_data)
+
+    study_ids = Study.objects.all().values_list('study_id', flat=True)
+    plot = get_summary_heatmap(summary_heatmap_df, study_ids).children[1]
+    assert [r for r in plot.references() if isinstance(r, Circle)]
+    assert not [r for r in plot.references() if isinstance(r, Image)]
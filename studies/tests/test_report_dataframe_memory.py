@@ -0,0 +1,37 @@
+# Copyright 2017-present, Bill & Melinda Gates Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import pytest
+from django.core.management import call_command
+
+from .factories import CountFactory, DomainFactory, StudyFactory, VariableFactory
+
+
+@pytest.mark.django_db
+def test_report_dataframe_memory_writes_report(tmpdir):
+    variables = VariableFactory.create_batch(5, domain=DomainFactory(code='DOMAIN'))
+    for study in StudyFactory.create_batch(3):
+        for variable in variables:
+            CountFactory(codes=[variable], study=study)
+
+    output = str(tmpdir.join('report.json'))
+    call_command('report_dataframe_memory', output=output)
+
+    with open(output) as f:
+        report = json.load(f)
+    result = report['scales']['current']['requests']['all-studies']
+    assert result['default']['total'] > result['compact']['total'] > 0
+    assert set(result['saving']) == set(result['default'])
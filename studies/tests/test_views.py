@@ -364,6 +364,23 @@ def test_study_explorer_get_context_with_study_get_params(rf):
     assert domain_acc['count'] == 10
 
 
+@pytest.mark.django_db
+def test_study_explorer_get_context_single_heatmap(rf, settings):
+    settings.EXPLORER_SINGLE_HEATMAP = True
+    domain = SampleDomainFactory(code="AGECAT")
+    study = StudyFactory(study_id="foo")
+    variable = SampleVariableFactory(label="bar", domain=domain, code=1)
+    CountFactory(codes=[variable], study=study, count=10)
+
+    request = rf.get(reverse('study-explorer'), data={"study": [study.id]})
+    study_explorer_view = _get_instance(StudyExplorerView, request=request)
+
+    context = study_explorer_view.get_context_data()
+    assert context['plot_domains_div']
+    assert context['plot_domains_script']
+    assert context['domains'][0]['code'] == domain.code
+
+
 @pytest.mark.django_db
 def test_study_export_view_given_domain_data_returns_values(client):
     age_domain = SampleDomainFactory(code="AGECAT")
@@ -390,6 +407,34 @@ def test_study_export_by_age_view_given_domain_data_returns_values(client):
     assert response.status_code == 200
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize('url_name', ['heatmap', 'heatmap_by_age'])
+def test_heatmap_view_returns_components_of_domain(client, url_name):
+    age_domain = AgeDomainFactory()
+    data_domain = SampleDomainFactory()
+    study = StudyFactory(study_id="foo")
+    age_variable = AgeVariableFactory(domain=age_domain, code=1)
+    data_variable = SampleVariableFactory(label="bat", domain=data_domain, code=2)
+    CountFactory(codes=[age_variable, data_variable], study=study, count=10)
+
+    response = client.get(reverse(url_name, kwargs={"domain_id": data_domain.id}),
+                          {'study': study.id})
+    assert response.status_code == 200
+    data = response.json()
+    assert '<script' in data['script']
+    assert 'bk-root' in data['div']
+
+
+@pytest.mark.django_db
+def test_heatmap_view_domain_without_counts_returns_404(client):
+    data_domain = SampleDomainFactory()
+    study = StudyFactory(study_id="foo")
+
+    response = client.get(reverse('heatmap_by_age', kwargs={"domain_id": data_domain.id}),
+                          {'study': study.id})
+    assert response.status_code == 404
+
+
 @pytest.mark.django_db
 def test_study_filter_view_get_method_filter_reset_get_param_and_redirect(rf):
     # setup the view
@@ -644,10 +689,7 @@ def tests_explorer_view_get_context_data_adds_domains_properties_correctly(mock_
     request = rf.get(reverse('study-explorer'), data={'study': study.id})
     view = _get_instance(StudyExplorerView, request=request)
 
-    # Set mock get_domain_count return value
-    mock_components.return_value = ('script', {
-        d_a.label: 'div_a', d_b.label: 'div_b', d_c.label: 'div_c'
-    })
+    mock_components.return_value = ('script', {'summary': 'div'})
     context = view.get_context_data()
 
     context_domains = context['domains']
@@ -657,8 +699,8 @@ def tests_explorer_view_get_context_data_adds_domains_properties_correctly(mock_
         assert context_domains[i]['label'] == domain.label
         assert context_domains[i]['code'] == domain.code.strip('*')
         assert context_domains[i]['id'] == domain.id
-        if i != 3:  # Handle age domain separately
-            assert context_domains[i]['heatmap'] == 'div_%s' % domain.label.strip('*')
+        # Heatmaps are fetched from HeatmapView
+        assert 'heatmap' not in context_domains[i]
         count = 100
         assert context_domains[i]['count'] == count
 
@@ -668,10 +710,10 @@ def tests_explorer_view_get_context_data_adds_domains_properties_correctly(mock_
         assert context_age_domains[i]['label'] == domain.label
         assert context_age_domains[i]['code'] == domain.code.strip('*')
         assert context_age_domains[i]['id'] == domain.id
-        assert context_age_domains[i]['age_heatmap'] == 'div_%s' % domain.label.strip('*')
+        assert 'age_heatmap' not in context_age_domains[i]
         assert context_age_domains[i]['count'] == 100
     # Check scripts
     assert context['plot_summary_script'] == 'script'
-    assert context['plot_script'] == 'script'
-    assert context['plot_age_script'] == 'script'
+    assert 'plot_script' not in context
+    assert 'plot_age_script' not in context
     # Note: not testing plot_summary_div as blanket means it doesn't really make sense
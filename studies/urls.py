@@ -15,8 +15,10 @@
 from django.conf.urls import url
 
 from .views import (
+    AgeHeatmapView,
     ExportByAgeView,
     ExportView,
+    HeatmapView,
     StudyListView,
     StudyFilterView,
     StudyExplorerView,
@@ -30,4 +32,6 @@ urlpatterns = [
     url(r'^explorer', StudyExplorerView.as_view(), name='study-explorer'),
     url(r'^export/domain_(?P<domain_id>[0-9]+)', ExportView.as_view(), name='export'),
     url(r'^export_by_age/domain_(?P<domain_id>[0-9]+)', ExportByAgeView.as_view(), name='export_by_age'),  # noqa
+    url(r'^heatmap/domain_(?P<domain_id>[0-9]+)', HeatmapView.as_view(), name='heatmap'),
+    url(r'^heatmap_by_age/domain_(?P<domain_id>[0-9]+)', AgeHeatmapView.as_view(), name='heatmap_by_age'),  # noqa
 ]
@@ -13,30 +13,40 @@
 # limitations under the License.
 
 import re
+from collections import OrderedDict
 
-from toolz.itertoolz import groupby
-
+from django.conf import settings
 from django.db.models import Q
 from django.views.generic.base import TemplateView
 from django.core.urlresolvers import reverse
 from django.views.generic.list import ListView
 from django.views import View
-from django.http import HttpResponseRedirect, Http404, HttpResponse
+from django.http import HttpResponseRedirect, Http404, HttpResponse, JsonResponse
 import django_tables2 as tables
 
+from .cache import (
+    get_filters,
+    get_filtered_studies,
+    get_filtered_study_ids,
+    get_plot_components,
+    get_selection_key,
+    select_studies,
+)
 from .dataframes import (
-    get_counts_df,
-    get_counts_by_domain,
-    pivot_counts_df,
-    get_variable_counts,
-    get_variable_count_by_variable
+    query_counts_by_domain,
+    query_domain_totals,
+    query_variable_counts,
+    query_variable_count_by_variable,
+    query_all_variable_counts,
+    get_study_dict,
+    get_study_rows,
 )
 
 from .forms import StudyFilterForm, VariableListForm, StudyExplorerForm
+from .landing import get_landing_state, is_landing_query
 from .models import (
     StudyField,
     Study,
-    StudyVariable,
     Domain,
     Variable,
     Filter,
@@ -45,6 +55,7 @@ from .plots import (
     get_summary_heatmap,
     get_heatmap,
     get_age_heatmap,
+    get_domains_heatmap,
 )
 from .tables import StudyTable, VariableTable
 
@@ -57,23 +68,17 @@ class StudyListView(tables.SingleTableView):
     }
 
     def get_study_dict(self):
-        study_fields = StudyField.objects.filter(big_order__gte=0) or StudyField.objects.all()
-        df = StudyVariable.get_dataframe(study_field__in=study_fields)
-        df['study_id'] = df.index
-        df_dict = df.to_dict('records')
-
-        for study_field in study_fields.filter(field_type='int'):
-            for record in df_dict:
-                if record[study_field.label]:
-                    record[study_field.label] = int(float(record[study_field.label]))
-        return df_dict
+        study_fields = (StudyField.objects.filter(big_order__gte=0).order_by('big_order') or
+                        StudyField.objects.order_by('id'))
+        _, rows = get_study_rows(Study.objects.all(), study_fields)
+        return [dict(values, study_id=study_id) for study_id, values in rows.items()]
 
     def get_queryset(self, **kwargs):
         """
         Overrides existing table get_queryset method
 
         Returns:
-            Dict(StudyVariable)
+            list(dict) of StudyField values by label for each Study
         """
         return self.get_study_dict()
 
@@ -84,13 +89,7 @@ class StudyFilterView(ListView):
     paginate_by = 10
 
     def get_queryset(self, **kwargs):
-        GET = self.request.GET
-
-        filters = Filter.objects.filter(
-            Q(study_field__in=GET.keys()) | Q(domain__code__in=GET.keys())
-        )
-        studies = Study.filter_studies(filters, GET)
-        return studies
+        return get_filtered_studies(self.request.GET)
 
     def get(self, request):
         if 'Reset' in request.GET:
@@ -125,19 +124,26 @@ class StudyFilterView(ListView):
         return super(StudyFilterView, self).get(request)
 
     def get_context_data(self, **kwargs):
-        from bokeh.embed import components
         context = super(StudyFilterView, self).get_context_data(**kwargs)
 
-        study_form = StudyFilterForm(request=self.request)
-
-        context['study_form'] = study_form
-
         get = self.request.GET.copy()
         get.pop('page', None)
         get.pop('submit', None)
 
         context['GET_params'] = get.urlencode()
 
+        # Serve the unfiltered page from the state precomputed at data load
+        if is_landing_query(self.request.GET):
+            landing = get_landing_state()
+            context['study_form'] = StudyFilterForm(request=self.request,
+                                                    filter_options=landing['filter_options'])
+            context.update(landing['context'])
+            return context
+
+        study_form = StudyFilterForm(request=self.request)
+
+        context['study_form'] = study_form
+
         context['n_total'] = Study.objects.count()
 
         study_ids = self.object_list.order_by('study_id').values_list('study_id', flat=True)
@@ -147,28 +153,18 @@ class StudyFilterView(ListView):
             context['field_names'], context['study_dict'] = self.get_study_dict()
 
         # Make summary plot
-        df = get_counts_df(self.object_list)
-        if len(df) > 0:
-            summary_heatmap_df = get_counts_by_domain(df)
-            summary_heatmap = get_summary_heatmap(summary_heatmap_df, study_ids)
-            [bk_summary_script, bk_summary_div] = components(summary_heatmap)
-            context['plot_summary_script'] = bk_summary_script
-            context['plot_summary_div'] = bk_summary_div
+        summary_heatmap_df = query_counts_by_domain(self.object_list)
+        if len(summary_heatmap_df) > 0:
+            selection = get_selection_key(self.object_list.values_list('id', flat=True))
+            summary = get_plot_components(
+                'summary', 'summary', selection,
+                lambda: (get_summary_heatmap(summary_heatmap_df, study_ids), None))
+            context['plot_summary_script'], context['plot_summary_div'], _ = summary
 
         return context
 
     def get_study_dict(self):
-        study_fields = StudyField.objects.filter(lil_order__gte=0).order_by('lil_order')
-        if study_fields.count() == 0:
-            return None, None
-        studies = self.object_list
-        df = StudyVariable.get_dataframe(study_field__in=study_fields, studies__in=studies)
-        if df is None:
-            return None, None
-        ordered_labels = study_fields.values_list('label', flat=True)
-        labels = [label for label in ordered_labels if label in df.columns]
-        df_dict = df.to_dict('index')
-        return labels, df_dict
+        return get_study_dict(self.object_list)
 
 
 class VariableListView(tables.SingleTableView):
@@ -215,16 +211,17 @@ class StudyResolverMixin(object):
 
     def resolve_studies(self, context=None):
         """Resolve study filter query into study ids"""
-        # TODO This could be much more efficient
         GET = self.request.GET
         if GET and 'study' not in GET:
             self.request.GET = GET.copy()
-            filters = Filter.objects.filter(
-                Q(study_field__in=GET.keys()) | Q(domain__code__in=GET.keys())
-            )
+            filters = get_filters(GET)
 
-            studies = Study.filter_studies(filters, GET)
-            study_ids = studies.values_list('id', flat=True)
+            if filters:
+                study_ids = get_filtered_study_ids(GET, filters)
+                studies = select_studies(study_ids)
+            else:
+                studies = Study.objects.all()
+                study_ids = list(studies.values_list('id', flat=True))
             self.request.GET.setlist('study', study_ids)
 
             if context is not None:
@@ -248,8 +245,6 @@ class StudyExplorerView(TemplateView, StudyResolverMixin):
         return super(StudyExplorerView, self).get(request)
 
     def get_context_data(self, **kwargs):
-        from bokeh.embed import components
-
         context = super(StudyExplorerView, self).get_context_data(**kwargs)
 
         studies = self.resolve_studies(context)
@@ -259,75 +254,94 @@ class StudyExplorerView(TemplateView, StudyResolverMixin):
         context['n_total'] = Study.objects.count()
         context['n_selected'] = studies.count()
 
-        df = get_counts_df(studies)
-        if len(df) == 0:
+        summary_heatmap_df = query_counts_by_domain(studies)
+        if len(summary_heatmap_df) == 0:
             return context
 
         study_ids = studies.order_by('study_id').values_list('study_id', flat=True)
+        selection = get_selection_key(studies.values_list('id', flat=True))
 
         # Make summary plot
-        summary_heatmap_df = get_counts_by_domain(df)
-        summary_heatmap = get_summary_heatmap(summary_heatmap_df, study_ids)
-        [bk_summary_script, bk_summary_div] = components(summary_heatmap)
-        context['plot_summary_script'] = bk_summary_script
-        context['plot_summary_div'] = bk_summary_div
+        summary = get_plot_components(
+            'summary', 'summary', selection,
+            lambda: (get_summary_heatmap(summary_heatmap_df, study_ids), None))
+        context['plot_summary_script'], context['plot_summary_div'], _ = summary
+
+        # The heatmaps of a domain are fetched from HeatmapView when its
+        # panel is opened, only the totals of the panels are shipped
+        totals = query_domain_totals(studies).set_index('domain_code')
+        domains = Domain.objects.filter(code__in=list(totals.index)).order_by('label')
+        domains_context = []
+        domains_age_context = []
 
-        # Make heatmaps
-        domains = Domain.objects.all().order_by('label')
-        domain_heatmaps = {}
-        domain_age_heatmaps = {}
-        active_domains = []
-        active_age_domains = []
+        for domain in domains:
+            domain_context = {
+                "id": domain.pk,
+                "label": domain.label,
+                "code": domain.code.strip("*"),
+                "count": int(totals.at[domain.code, 'count']),
+            }
+            domains_context.append(domain_context)
+            if totals.at[domain.code, 'by_qualifier']:
+                domains_age_context.append(dict(domain_context))
 
-        # need for later, but storing for single query
-        variables = Variable.objects.all()
-        var_lookup = groupby('id', variables.values('id', 'label', 'code'))
+        context['domains'] = domains_context
+        context['age_domains'] = domains_age_context
 
-        pivot_df = pivot_counts_df(df)
+        # Ship the variable heatmaps of all domains at once in a single figure
+        if getattr(settings, 'EXPLORER_SINGLE_HEATMAP', False):
+            domain_labels = OrderedDict((domain.code, domain.label) for domain in domains)
+            heatmap = get_plot_components(
+                'domains', 'all', selection,
+                lambda: self.render_domains(studies, domain_labels, study_ids))
+            if heatmap is not None:
+                context['plot_domains_script'], context['plot_domains_div'], _ = heatmap
+        return context
 
-        for domain in domains:
-            code = domain.code
-            domain_heatmap_df = get_variable_counts(pivot_df, var_lookup, code)
+    def render_domains(self, studies, domain_labels, study_ids):
+        domain_dfs = query_all_variable_counts(studies)
+        if not any(code in domain_dfs for code in domain_labels):
+            return None
+        return get_domains_heatmap(domain_dfs, domain_labels, study_ids), None
 
-            if domain_heatmap_df is not None:
-                count = domain_heatmap_df['count'].sum()
-                active_domains.append((count, domain))
-                domain_heatmaps[domain.label] = get_heatmap(domain_heatmap_df, study_ids)
 
-            domain_age_heatmap_df = get_variable_count_by_variable(pivot_df, var_lookup, code)
+class HeatmapView(View, StudyResolverMixin):
+    """
+    Returns the Bokeh script and div of the heatmap of a domain for the
+    study selection of the explorer as JSON, read through the plot cache.
+    """
+    by_age = False
 
-            if domain_age_heatmap_df is not None:
-                count = domain_heatmap_df['count'].sum()
-                active_age_domains.append((count, domain))
-                domain_age_heatmaps[domain.label] = get_age_heatmap(domain_age_heatmap_df)
+    def get(self, request, *args, **kwargs):
+        studies = self.resolve_studies()
+        try:
+            domain = Domain.objects.get(pk=kwargs.get('domain_id'))
+        except Domain.DoesNotExist:
+            raise Http404
+        selection = get_selection_key(studies.values_list('id', flat=True))
+        kind = 'age' if self.by_age else 'heatmap'
+        heatmap = get_plot_components(kind, domain.code, selection,
+                                      lambda: self.render(studies, domain))
+        if heatmap is None:
+            raise Http404
+        script, div, _ = heatmap
+        return JsonResponse(dict(script=script, div=div))
+
+    def render(self, studies, domain):
+        if self.by_age is True:
+            domain_df = query_variable_count_by_variable(studies, domain.code)
+            if domain_df is None:
+                return None
+            return get_age_heatmap(domain_df), None
+        domain_df = query_variable_counts(studies, domain.code)
+        if domain_df is None:
+            return None
+        study_ids = studies.order_by('study_id').values_list('study_id', flat=True)
+        return get_heatmap(domain_df, study_ids), None
 
-        [bk_script, bk_divs] = components(domain_heatmaps)
-        [bk_age_script, bk_age_divs] = components(domain_age_heatmaps)
-        context['plot_script'] = bk_script
-        context['plot_age_script'] = bk_age_script
 
-        # Build domains context
-        domains_context = []
-        for count, domain in active_domains:
-            domains_context.append({
-                "heatmap": bk_divs.get(domain.label),
-                "id": domain.pk,
-                "label": domain.label,
-                "code": domain.code.strip("*"),
-                "count": count,
-            })
-        context['domains'] = domains_context
-        domains_age_context = []
-        for count, domain in active_age_domains:
-            domains_age_context.append({
-                "age_heatmap": bk_age_divs.get(domain.label),
-                "id": domain.pk,
-                "label": domain.label,
-                "code": domain.code.strip("*"),
-                "count": count,
-            })
-        context['age_domains'] = domains_age_context
-        return context
+class AgeHeatmapView(HeatmapView):
+    by_age = True
 
 
 class BaseExportView(View, StudyResolverMixin):
@@ -336,21 +350,17 @@ class BaseExportView(View, StudyResolverMixin):
     def get(self, request, *args, **kwargs):
         studies = self.resolve_studies()
         domain = Domain.objects.get(pk=kwargs.get('domain_id'))
-        df = get_counts_df(studies)
-        pivot_df = pivot_counts_df(df)
-        # need for later, but storing for single query
-        variables = Variable.objects.all()
-        var_lookup = groupby('id', variables.values('id', 'label', 'code'))
         if self.by_age is True:
-            domain_df = get_variable_count_by_variable(pivot_df, var_lookup, domain.code)
+            domain_df = query_variable_count_by_variable(studies, domain.code)
         else:
-            domain_df = get_variable_counts(pivot_df, var_lookup, domain.code)
+            domain_df = query_variable_counts(studies, domain.code)
         # Build response
         filename = self.get_filename(domain)
         content_type = 'text/csv'
         response = HttpResponse(content_type=content_type)
         response['Content-Disposition'] = 'attachment; filename="{0}"'.format(filename)
-        domain_df.to_csv(response)
+        if domain_df is not None:
+            domain_df.to_csv(response)
         return response
 
 